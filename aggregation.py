@@ -0,0 +1,197 @@
+"""
+Incident Aggregation
+One incident per flagged message: later flags join it and update its embed through a debounced edit
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from message_cache import MessageSnapshot
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class OpenIncident:
+    """A flagged message that later flags are merged into."""
+    incident_id: str
+    message_id: int
+    guild_id: int
+    channel_id: int
+    opened_at: float = field(default_factory=time.time)
+    # Flagger user ID -> time of their flag, in flag order
+    flaggers: Dict[int, float] = field(default_factory=dict)
+    # Set once the message is fetched and the flagged embed built
+    snapshot: Optional[MessageSnapshot] = None
+    content: str = ""
+    # The posted flagged message, and the embeds that follow the flagged one in it (as dicts)
+    flagged_message_id: Optional[int] = None
+    extra_embeds: List[dict] = field(default_factory=list)
+
+RenderIncident = Callable[[OpenIncident], Awaitable[None]]
+
+class IncidentAggregator:
+    """Bounded index of open incidents by message ID.
+
+    An incident stays open for `window` seconds after its first flag; flags
+    and unflags in that time change its flagger list, and the posted embed is
+    re-rendered at most once per `edit_debounce` seconds. The least recently
+    flagged incidents are closed when more than `max_open` are open.
+    """
+
+    def __init__(self, render: RenderIncident, window: float = 600, max_open: int = 1000,
+                 edit_debounce: float = 2.0):
+        self.render = render
+        self.window = window
+        self.max_open = max_open
+        self.edit_debounce = edit_debounce
+
+        self._open: "OrderedDict[int, OpenIncident]" = OrderedDict()
+        # message_id -> pending debounced edit
+        self._edits: Dict[int, asyncio.Task] = {}
+
+        self.stats = {
+            'opened': 0,
+            'merged': 0,
+            'withdrawn': 0,
+            'edits': 0,
+            'edit_errors': 0,
+            'expired': 0,
+            'evicted': 0
+        }
+
+    @classmethod
+    def from_config(cls, render: RenderIncident, config: Optional[dict]) -> "IncidentAggregator":
+        """Create an aggregator from the incident_aggregation config section."""
+        config = config or {}
+        return cls(
+            render,
+            window=config.get('window', 600),
+            max_open=config.get('max_open', 1000),
+            edit_debounce=config.get('edit_debounce', 2.0)
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self._open)
+
+    def get(self, message_id: int) -> Optional[OpenIncident]:
+        """The open incident for a message, if its window has not passed."""
+        incident = self._open.get(message_id)
+        if incident is None:
+            return None
+        if time.time() - incident.opened_at >= self.window:
+            del self._open[message_id]
+            self.stats['expired'] += 1
+            return None
+        return incident
+
+    def open(self, incident_id: str, message_id: int, guild_id: int, channel_id: int,
+             flagger_id: int, flagged_at: Optional[float] = None) -> OpenIncident:
+        """Start an incident for a message with its first flagger."""
+        flagged_at = flagged_at or time.time()
+        incident = OpenIncident(incident_id, message_id, guild_id, channel_id, opened_at=flagged_at)
+        incident.flaggers[flagger_id] = flagged_at
+        self._open[message_id] = incident
+        self._open.move_to_end(message_id)
+        self.stats['opened'] += 1
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+            self.stats['evicted'] += 1
+        return incident
+
+    def add_flagger(self, incident: OpenIncident, user_id: int, flagged_at: Optional[float] = None) -> bool:
+        """Merge a later flag into an incident. Returns False if the user had already flagged it."""
+        if user_id in incident.flaggers:
+            return False
+        incident.flaggers[user_id] = flagged_at or time.time()
+        if incident.message_id in self._open:
+            self._open.move_to_end(incident.message_id)
+        self.stats['merged'] += 1
+        self._schedule_edit(incident)
+        return True
+
+    def remove_flagger(self, message_id: int, user_id: int) -> Optional[OpenIncident]:
+        """Withdraw a flag (the reaction was removed). Returns the incident if it changed."""
+        incident = self.get(message_id)
+        if incident is None or incident.flaggers.pop(user_id, None) is None:
+            return None
+        self.stats['withdrawn'] += 1
+        self._schedule_edit(incident)
+        return incident
+
+    def posted(self, incident: OpenIncident, flagged_message_id: int, extra_embeds: List[dict]):
+        """Record the message that shows the incident; re-render it if flags arrived meanwhile."""
+        incident.flagged_message_id = flagged_message_id
+        incident.extra_embeds = extra_embeds
+        if len(incident.flaggers) != 1:
+            self._schedule_edit(incident)
+
+    def discard(self, message_id: int):
+        """Close an incident, e.g. because its message was deleted or could not be fetched."""
+        self._open.pop(message_id, None)
+        edit = self._edits.pop(message_id, None)
+        if edit:
+            edit.cancel()
+
+    async def stop(self):
+        """Cancel pending edits."""
+        edits = list(self._edits.values())
+        self._edits.clear()
+        for edit in edits:
+            edit.cancel()
+        await asyncio.gather(*edits, return_exceptions=True)
+
+    def export_state(self) -> dict:
+        """Posted incidents still in their window, for a warm-restart snapshot."""
+        now = time.time()
+        incidents = []
+        for incident in self._open.values():
+            if incident.flagged_message_id is None or now - incident.opened_at >= self.window:
+                continue
+            fields = asdict(incident)
+            # JSON object keys are strings
+            fields['flaggers'] = [[user_id, flagged_at] for user_id, flagged_at in incident.flaggers.items()]
+            incidents.append(fields)
+        return {'incidents': incidents}
+
+    def restore_state(self, state: dict):
+        """Reopen incidents saved by export_state(), so flags after a restart still merge into them."""
+        now = time.time()
+        for fields in state.get('incidents', []):
+            if now - fields['opened_at'] >= self.window or fields['message_id'] in self._open:
+                continue
+            fields = dict(fields)
+            fields['flaggers'] = {user_id: flagged_at for user_id, flagged_at in fields['flaggers']}
+            if fields.get('snapshot'):
+                fields['snapshot'] = MessageSnapshot(**fields['snapshot'])
+            incident = OpenIncident(**fields)
+            self._open[incident.message_id] = incident
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        """Return open incident count, merge counters and pending edits."""
+        return dict(self.stats, open=len(self._open), pending_edits=len(self._edits))
+
+    def _schedule_edit(self, incident: OpenIncident):
+        # Flags that arrive before the embed is posted are rendered by posted()
+        if incident.flagged_message_id is None or incident.message_id in self._edits:
+            return
+        self._edits[incident.message_id] = asyncio.create_task(
+            self._edit_later(incident), name=f'incident-edit-{incident.message_id}'
+        )
+
+    async def _edit_later(self, incident: OpenIncident):
+        await asyncio.sleep(self.edit_debounce)
+        # Changes from here on schedule another edit
+        self._edits.pop(incident.message_id, None)
+        try:
+            await self.render(incident)
+            self.stats['edits'] += 1
+        except Exception as e:
+            self.stats['edit_errors'] += 1
+            logger.error(f"Failed to update incident {incident.incident_id}: {e}")
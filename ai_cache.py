@@ -0,0 +1,269 @@
+"""
+AI Improvement Cache
+Content-addressed LRU/TTL cache for OpenRouter results with an optional SQLite tier
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from shared_state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_text(text: str) -> str:
+    """Normalize text so copy-pasted variants share a cache entry."""
+    text = unicodedata.normalize('NFKC', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+def make_cache_key(text: str, model: str, prompt_version: int) -> str:
+    """Build a content-addressed key from normalized text, model and prompt version."""
+    payload = f"{prompt_version}\x00{model}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ImprovementCache:
+    """Bounded in-memory LRU with TTL, backed by optional shared and SQLite tiers."""
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 86400, db_path: Optional[str] = None,
+                 shared: Optional[StateBackend] = None, prune_every: int = 500):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.prune_every = prune_every
+
+        # Only a backend visible to other processes adds anything over the local LRU
+        self.shared = shared if shared is not None and shared.shared else None
+        self._shared_writes: Set[asyncio.Task] = set()
+
+        # key -> (expires_at, improved_text), oldest first
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        # In-flight lookups, used to coalesce concurrent misses
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        # SQLite is only touched from this single worker thread
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Disk writes since expired rows were last deleted
+        self._db_puts = 0
+
+        self.stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], shared: Optional[StateBackend] = None) -> "ImprovementCache":
+        """Create a cache from the openrouter.cache config section."""
+        config = config or {}
+        return cls(
+            max_entries=config.get('max_entries', 2048),
+            ttl=config.get('ttl', 86400),
+            db_path=config.get('db_path'),
+            shared=shared,
+            prune_every=config.get('prune_every', 500)
+        )
+
+    async def open(self):
+        """Open the on-disk tier if one is configured."""
+        if not self.db_path or self._db:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai-cache')
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._open_db)
+            logger.info(f"AI cache disk tier opened at {self.db_path}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open AI cache database {self.db_path}: {e}")
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def close(self):
+        """Flush pending writes and close the on-disk tier."""
+        if not self._executor:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_db)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a fresh in-memory entry without touching disk or upstream."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.stats['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        """Store an entry in memory and, if enabled, on disk."""
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, value, expires_at)
+        if self._executor:
+            self._executor.submit(self._db_put, key, value, expires_at)
+        if self.shared:
+            task = asyncio.get_running_loop().create_task(self._put_shared(key, value))
+            self._shared_writes.add(task)
+            task.add_done_callback(self._shared_writes.discard)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Return the cached value for key, computing it at most once across concurrent callers."""
+        value = self.get(key)
+        if value is not None:
+            self.stats['hits'] += 1
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        value = None
+        try:
+            value = await self._get_shared(key)
+            if value is not None:
+                self.stats['hits'] += 1
+                self.stats['shared_hits'] += 1
+                self._put_memory(key, value, time.time() + self.ttl)
+                return value
+
+            value = await self._get_disk(key)
+            if value is not None:
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+                self._put_memory(key, value, time.time() + self.ttl)
+            else:
+                self.stats['misses'] += 1
+                value = await compute()
+                # Failures are not cached so the next flag retries upstream
+                if value is not None:
+                    self.put(key, value)
+            return value
+        finally:
+            if not future.done():
+                future.set_result(value)
+            self._pending.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """Return hit, miss and eviction statistics."""
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['size'] = len(self._entries)
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['disk_enabled'] = self._executor is not None
+        return stats
+
+    def export_state(self) -> dict:
+        """Unexpired in-memory entries, oldest first, for a warm-restart snapshot."""
+        now = time.time()
+        return {'entries': [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()
+                            if expires_at > now]}
+
+    def restore_state(self, state: dict):
+        """Reload entries saved by export_state() that have not expired since."""
+        now = time.time()
+        for key, expires_at, value in state.get('entries', []):
+            if expires_at > now:
+                self._put_memory(key, value, expires_at)
+
+    def _put_memory(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    async def _get_shared(self, key: str) -> Optional[str]:
+        if not self.shared:
+            return None
+        try:
+            return await self.shared.cache_get(key)
+        except Exception as e:
+            logger.error(f"AI cache shared read failed: {e}")
+            return None
+
+    async def _put_shared(self, key: str, value: str):
+        try:
+            await self.shared.cache_set(key, value, self.ttl)
+        except Exception as e:
+            logger.error(f"AI cache shared write failed: {e}")
+
+    async def _get_disk(self, key: str) -> Optional[str]:
+        if not self._executor:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._db_get, key)
+        except sqlite3.Error as e:
+            logger.error(f"AI cache read failed: {e}")
+            return None
+
+    # The methods below run on the cache worker thread
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS improvements ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS improvements_expires_at ON improvements (expires_at)')
+        self._db_prune()
+
+    def _close_db(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def _db_get(self, key: str) -> Optional[str]:
+        if not self._db:
+            return None
+        row = self._db.execute(
+            'SELECT value FROM improvements WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _db_put(self, key: str, value: str, expires_at: float):
+        if not self._db:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO improvements (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+            self._db.commit()
+            self._db_puts += 1
+            # Rows are only read back while fresh, so expired ones would otherwise pile up between restarts
+            if self.prune_every and self._db_puts >= self.prune_every:
+                self._db_prune()
+        except sqlite3.Error as e:
+            logger.error(f"AI cache write failed: {e}")
+
+    def _db_prune(self):
+        deleted = self._db.execute('DELETE FROM improvements WHERE expires_at <= ?', (time.time(),)).rowcount
+        self._db.commit()
+        self._db_puts = 0
+        if deleted:
+            logger.debug(f"AI cache deleted {deleted} expired rows")
@@ -0,0 +1,142 @@
+"""
+AI Request Batching
+Groups texts that arrive within a short window into one OpenRouter completion
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Improvement:
+    """One text's result and the tokens spent on it."""
+    text: Optional[str]
+    tokens: int = 0
+    # True when tokens is a local estimate rather than reported usage
+    estimated: bool = False
+
+BatchRequest = Callable[[List[str]], Awaitable[List[Improvement]]]
+SingleRequest = Callable[[str], Awaitable[Improvement]]
+
+class ImprovementBatcher:
+    """Collects improvement requests and sends them as micro-batches."""
+
+    def __init__(self, request_batch: BatchRequest, request_single: SingleRequest,
+                 window: float = 0.25, max_batch_size: int = 8, max_batch_tokens: int = 2000):
+        self.request_batch = request_batch
+        self.request_single = request_single
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.stats = {
+            'batches': 0,
+            'batched_items': 0,
+            'single_requests': 0,
+            'fallbacks': 0
+        }
+
+    @classmethod
+    def from_config(cls, request_batch: BatchRequest, request_single: SingleRequest,
+                    config: Optional[dict]) -> "ImprovementBatcher":
+        """Create a batcher from the openrouter.batching config section."""
+        config = config or {}
+        return cls(
+            request_batch,
+            request_single,
+            window=config.get('window', 0.25),
+            max_batch_size=config.get('max_batch_size', 8),
+            max_batch_tokens=config.get('max_batch_tokens', 2000)
+        )
+
+    async def submit(self, text: str) -> Improvement:
+        """Queue text for the next batch and wait for its improvement."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = estimate_tokens(text)
+
+        # Start a new batch rather than overflow the token limit
+        if self._pending and self._pending_tokens + tokens > self.max_batch_tokens:
+            self._flush()
+
+        self._pending.append((text, future))
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    async def close(self):
+        """Send anything still pending and wait for in-flight batches."""
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        """Return batch counters and the average batch size."""
+        stats = dict(self.stats)
+        stats['pending'] = len(self._pending)
+        stats['avg_batch_size'] = stats['batched_items'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        results = [Improvement(None) for _ in texts]
+        try:
+            if len(texts) == 1:
+                self.stats['single_requests'] += 1
+                results = [await self.request_single(texts[0])]
+            else:
+                self.stats['batches'] += 1
+                self.stats['batched_items'] += len(texts)
+                results = await self.request_batch(texts)
+
+                # Retry any item the batch could not answer on its own
+                failed = [i for i, result in enumerate(results) if result.text is None]
+                if failed:
+                    self.stats['fallbacks'] += len(failed)
+                    logger.debug(f"Batch of {len(texts)} had {len(failed)} failed items, retrying singly")
+                    retries = await asyncio.gather(
+                        *(self.request_single(texts[i]) for i in failed),
+                        return_exceptions=True
+                    )
+                    for i, retry in zip(failed, retries):
+                        if not isinstance(retry, BaseException):
+                            # The item still pays its share of the batch
+                            results[i] = Improvement(retry.text, results[i].tokens + retry.tokens,
+                                                     results[i].estimated or retry.estimated)
+        except Exception as e:
+            logger.error(f"Batch improvement failed: {e}")
+        finally:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,146 @@
+"""
+Fake Discord REST layer
+In-process stand-ins for channels and messages that simulate per-channel rate-limit buckets
+"""
+
+import asyncio
+import itertools
+import random
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import discord
+
+_snowflakes = itertools.count(10 ** 17)
+
+class FakeBucket:
+    """Discord-style fixed window bucket: `limit` calls per `per` seconds."""
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = time.monotonic() + per
+
+    async def acquire(self) -> bool:
+        """Wait for capacity. Returns True if the caller hit a (simulated) 429."""
+        limited = False
+        while True:
+            now = time.monotonic()
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.per
+            if self.remaining > 0:
+                self.remaining -= 1
+                return limited
+            limited = True
+            await asyncio.sleep(self.reset_at - now)
+
+class FakeUser:
+    def __init__(self, user_id: int, bot: bool = False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.bot = bot
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+class FakeMessage:
+    def __init__(self, rest: "FakeDiscordREST", channel: "FakeChannel", message_id: int,
+                 author: FakeUser, content: str):
+        self._rest = rest
+        self.channel = channel
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.embeds: List[discord.Embed] = []
+
+    async def edit(self, **kwargs):
+        await self._rest.call(('edit', self.channel.id))
+        self._rest.stats['edits'] += 1
+        self.embeds = kwargs.get('embeds') or [kwargs['embed']]
+        return self
+
+class FakeChannel:
+    def __init__(self, rest: "FakeDiscordREST", channel_id: int, guild_id: int):
+        self._rest = rest
+        self.id = channel_id
+        self.guild_id = guild_id
+
+    async def send(self, content: Optional[str] = None, *, embed=None, embeds=None, **kwargs):
+        await self._rest.call(('send', self.id))
+        self._rest.stats['sends'] += 1
+        message = FakeMessage(self._rest, self, next(_snowflakes), FakeUser(0, bot=True), content or "")
+        message.embeds = embeds or ([embed] if embed else [])
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self._rest.call(('fetch', self.id))
+        self._rest.stats['fetches'] += 1
+        message = self._rest.messages.get(message_id)
+        if message is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self._rest.sent_or_placeholder(self, message_id)
+
+class FakeDiscordREST:
+    """Replaces the bot's Discord REST calls with simulated latency and rate limits."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, limit: int = 5, per: float = 5.0,
+                 seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.limit = limit
+        self.per = per
+        self.random = random.Random(seed)
+
+        self.channels: Dict[int, FakeChannel] = {}
+        self.messages: Dict[int, FakeMessage] = {}
+        self._buckets: Dict[tuple, FakeBucket] = {}
+
+        self.stats = {'sends': 0, 'edits': 0, 'fetches': 0, 'rate_limited': 0}
+
+    def channel(self, channel_id: int, guild_id: int = 0) -> FakeChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(self, channel_id, guild_id)
+        return channel
+
+    def add_message(self, channel_id: int, guild_id: int, author_id: int, content: str) -> FakeMessage:
+        """Create a message that reactions can target."""
+        channel = self.channel(channel_id, guild_id)
+        message = FakeMessage(self, channel, next(_snowflakes), FakeUser(author_id), content)
+        self.messages[message.id] = message
+        return message
+
+    def sent_or_placeholder(self, channel: FakeChannel, message_id: int) -> FakeMessage:
+        message = self.messages.get(message_id)
+        return message or FakeMessage(self, channel, message_id, FakeUser(0, bot=True), "")
+
+    async def call(self, route: tuple):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = FakeBucket(self.limit, self.per)
+        if await bucket.acquire():
+            self.stats['rate_limited'] += 1
+        await asyncio.sleep(max(0.0, self.random.gauss(self.latency, self.jitter)))
+
+    def install(self, bot):
+        """Point the bot's channel lookups at this fake."""
+        bot._get_messageable = lambda channel_id, guild_id=None: self.channel(channel_id, guild_id or 0)
+
+def make_reaction_payload(message: FakeMessage, user: FakeUser, emoji: str = '💩') -> SimpleNamespace:
+    """Build an object shaped like discord.RawReactionActionEvent."""
+    return SimpleNamespace(
+        emoji=discord.PartialEmoji(name=emoji),
+        guild_id=message.channel.guild_id,
+        channel_id=message.channel.id,
+        message_id=message.id,
+        user_id=user.id,
+        member=user,
+        event_type='REACTION_ADD'
+    )
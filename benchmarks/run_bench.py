@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Discord Shit Tracker Bot Benchmark
+Drives ShitTrackerBot with synthetic reactions against a fake Discord REST layer and a stub OpenRouter server
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Make the bot modules importable when run from anywhere
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_discord import FakeDiscordREST, FakeUser, make_reaction_payload
+from stub_openrouter import StubOpenRouter
+
+SAMPLE_TEXTS = [
+    "This is stupid and you're an idiot",
+    "nobody asked for your garbage opinion",
+    "lol what a clown take, go touch grass",
+    "Shut up, you have no idea what you're talking about",
+    "this server is trash and so are the mods",
+    "Worst idea I've ever heard, absolutely brain dead",
+    "ok",
+    "https://example.com/some/link",
+]
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': max(values) if values else None
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+class Workload:
+    """Synthetic reaction stream over a fixed population of guilds, channels, messages and users."""
+
+    def __init__(self, rest: FakeDiscordREST, args: argparse.Namespace):
+        self.random = random.Random(args.seed)
+        self.args = args
+        self.users = [FakeUser(1000 + i) for i in range(args.users)]
+        self.messages = []
+        for i in range(args.messages):
+            guild_id = 1 + i % args.guilds
+            channel_id = guild_id * 1000 + (i // args.guilds) % args.channels
+            author_id = 5000 + self.random.randrange(args.users)
+            self.messages.append(rest.add_message(channel_id, guild_id, author_id, self.random.choice(SAMPLE_TEXTS)))
+        self.hot = self.messages[:args.hot_messages]
+
+    def next_payload(self):
+        if self.args.distribution == 'hot' and self.random.random() < self.args.hot_fraction:
+            message = self.random.choice(self.hot)
+        else:
+            message = self.random.choice(self.messages)
+        return make_reaction_payload(message, self.random.choice(self.users))
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    if args.no_ai:
+        os.environ.pop('OPENROUTER_API_KEY', None)
+    else:
+        os.environ['OPENROUTER_API_KEY'] = 'benchmark'
+
+    from bot import ShitTrackerBot
+    from ratelimit import RateLimiter
+
+    stub = StubOpenRouter(args.ai_latency, args.ai_jitter, args.ai_error_rate, args.ai_throttle_rate, args.seed)
+    url = await stub.start()
+    rest = FakeDiscordREST(args.discord_latency, args.discord_jitter, seed=args.seed)
+
+    bot = ShitTrackerBot()
+    rest.install(bot)
+    # Keep benchmark incidents and state out of the real store and snapshot
+    store_dir = tempfile.TemporaryDirectory()
+    if bot.incident_store:
+        bot.incident_store.db_path = os.path.join(store_dir.name, 'incidents.db')
+    if bot.snapshot_path:
+        bot.snapshot_path = os.path.join(store_dir.name, 'state.json.gz')
+    if bot.text_improver:
+        bot.text_improver.api_url = url
+    if args.no_rate_limit:
+        bot.rate_limiter = RateLimiter.from_config({'rate_limit_max': 10 ** 9, 'rate_limit_window': 1})
+    await bot.setup_hook()
+
+    # Measure end-to-end latencies by wrapping the pipeline's exit points
+    flag_latencies: List[float] = []
+    ai_latencies: List[float] = []
+    handle_incident = bot._handle_incident
+    record_ai_posted = bot._record_ai_posted
+
+    async def timed_incident(message, user, received_at=None, incident=None):
+        received_at = received_at or time.time()
+        await handle_incident(message, user, received_at, incident)
+        flag_latencies.append(time.time() - received_at)
+
+    def timed_ai_posted(job):
+        record_ai_posted(job)
+        ai_latencies.append(time.time() - job.reaction_at)
+
+    bot._handle_incident = timed_incident
+    bot._record_ai_posted = timed_ai_posted
+
+    workload = Workload(rest, args)
+    total_events = int(args.rate * args.duration)
+    interval = 1.0 / args.rate
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = []
+    for i in range(total_events):
+        delay = start + i * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(bot.on_raw_reaction_add(workload.next_payload())))
+    await asyncio.gather(*tasks)
+    dispatch_elapsed = loop.time() - start
+
+    # Let queued AI work finish
+    drain_deadline = loop.time() + args.drain_timeout
+    while loop.time() < drain_deadline:
+        queue_stats = bot.improvement_queue.get_stats()
+        if not queue_stats['depth'] and not queue_stats['in_flight']:
+            break
+        await asyncio.sleep(0.05)
+    elapsed = loop.time() - start
+
+    peak_traced = None
+    if args.trace_memory:
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'events': total_events,
+        'incidents': len(flag_latencies),
+        'throughput_events_per_s': total_events / dispatch_elapsed if dispatch_elapsed else None,
+        'throughput_incidents_per_s': len(flag_latencies) / elapsed if elapsed else None,
+        'elapsed_s': elapsed,
+        'reaction_to_flag_s': summarize(flag_latencies),
+        'reaction_to_ai_s': summarize(ai_latencies),
+        'rate_limited': bot.rate_limited_counter.total(),
+        'discord_rest': dict(rest.stats),
+        'openrouter': dict(stub.stats),
+        'ai_queue': bot.improvement_queue.get_stats(),
+        'aggregation': bot.incident_index.get_stats() if bot.incident_index else None,
+        'ai_tokens': {
+            key: bot.text_improver.stats[key] for key in ('prompt_tokens', 'completion_tokens')
+        } if bot.text_improver else None,
+        'incident_store': bot.incident_store.get_stats() if bot.incident_store else None,
+        'spans': bot.spans.get_stats(),
+        'loop_stalls': bot.loop_watchdog.get_stats() if bot.loop_watchdog else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_traced_bytes': peak_traced
+    }
+
+    # Graceful shutdown: drain what is left and write the state snapshot
+    close_start = loop.time()
+    await bot.close()
+    results['shutdown_s'] = loop.time() - close_start
+    if bot.snapshot_path and os.path.exists(bot.snapshot_path):
+        results['snapshot_bytes'] = os.path.getsize(bot.snapshot_path)
+    await stub.stop()
+    store_dir.cleanup()
+    return results
+
+def compare(current: dict, baseline: dict):
+    """Print the headline numbers next to a previous run."""
+    rows = [
+        ('throughput_events_per_s',),
+        ('throughput_incidents_per_s',),
+        ('reaction_to_flag_s', 'p50'), ('reaction_to_flag_s', 'p95'), ('reaction_to_flag_s', 'p99'),
+        ('reaction_to_ai_s', 'p50'), ('reaction_to_ai_s', 'p95'), ('reaction_to_ai_s', 'p99'),
+        ('discord_rest', 'sends'), ('discord_rest', 'rate_limited'),
+        ('openrouter', 'requests'),
+        ('peak_rss_kb',),
+    ]
+    print(f"\n{'metric':40} {baseline.get('revision', '?'):>12} {current.get('revision', '?'):>12} {'change':>9}")
+    for path in rows:
+        old, new = baseline, current
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+        fmt = lambda v: "n/a" if v is None else f"{v:.4g}"
+        print(f"{'.'.join(path):40} {fmt(old):>12} {fmt(new):>12} {change:>9}")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test for the Shit Tracker bot")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of reaction traffic")
+    parser.add_argument('--rate', type=float, default=50, help="reactions per second")
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--channels', type=int, default=3, help="channels per guild")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--distribution', choices=('uniform', 'hot'), default='uniform')
+    parser.add_argument('--hot-messages', type=int, default=5)
+    parser.add_argument('--hot-fraction', type=float, default=0.8)
+    parser.add_argument('--discord-latency', type=float, default=0.05)
+    parser.add_argument('--discord-jitter', type=float, default=0.02)
+    parser.add_argument('--ai-latency', type=float, default=0.5)
+    parser.add_argument('--ai-jitter', type=float, default=0.2)
+    parser.add_argument('--ai-error-rate', type=float, default=0.0)
+    parser.add_argument('--ai-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--no-ai', action='store_true', help="run without the AI stage")
+    parser.add_argument('--no-rate-limit', action='store_true', help="disable reaction rate limits")
+    parser.add_argument('--drain-timeout', type=float, default=30)
+    parser.add_argument('--trace-memory', action='store_true', help="report tracemalloc peak (slower)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results JSON to this file")
+    parser.add_argument('--compare', help="results JSON from an earlier run to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = asyncio.run(run_benchmark(args))
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+if __name__ == "__main__":
+    main()
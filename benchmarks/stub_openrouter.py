@@ -0,0 +1,97 @@
+"""
+Stub OpenRouter server
+Local aiohttp app that answers chat completions with configurable latency and error rates
+"""
+
+import asyncio
+import json
+import random
+import re
+
+from aiohttp import web
+
+_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+class StubOpenRouter:
+    """Serves /api/v1/chat/completions on 127.0.0.1 without any network access."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0, 'streams': 0, 'batches': 0}
+        self._runner = None
+        self.url = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post('/api/v1/chat/completions', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _delay(self) -> float:
+        return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.stats['requests'] += 1
+        body = await request.json()
+        await asyncio.sleep(self._delay())
+
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.stats['throttled'] += 1
+            return web.json_response({'error': {'message': 'rate limited'}}, status=429,
+                                     headers={'Retry-After': '1'})
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response({'error': {'message': 'upstream error'}}, status=500)
+
+        prompt = body['messages'][-1]['content']
+        content = self._improve(prompt)
+        usage = {'prompt_tokens': len(prompt) // 4 + 1, 'completion_tokens': len(content) // 4 + 1}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if body.get('stream'):
+            return await self._stream(request, content)
+        return web.json_response({
+            'id': 'stub',
+            'model': body.get('model'),
+            'choices': [{'message': {'role': 'assistant', 'content': content}}],
+            'usage': usage
+        })
+
+    def _improve(self, prompt: str) -> str:
+        # Batched prompts carry a JSON array of messages; answer one item per input
+        if 'JSON array' in prompt:
+            match = _ARRAY_RE.search(prompt)
+            if match:
+                self.stats['batches'] += 1
+                items = json.loads(match.group(0))
+                return json.dumps([f"Improved: {item}" for item in items])
+        return "Here is a more respectful way to say that."
+
+    async def _stream(self, request: web.Request, content: str) -> web.StreamResponse:
+        self.stats['streams'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await response.write(b': OPENROUTER PROCESSING\n\n')
+        for word in content.split(' '):
+            chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            await asyncio.sleep(0.01)
+        await response.write(b'data: [DONE]\n\n')
+        return response
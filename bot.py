@@ -12,281 +12,1701 @@ import sys
 import asyncio
 import aiohttp
 import json
+import signal
+import tempfile
+from dataclasses import asdict
 from datetime import datetime, timezone
-from typing import Optional
-from collections import defaultdict, deque
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 import time
+import uuid
+import weakref
 
-# Setup logging without emojis for Windows compatibility
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
+from aggregation import IncidentAggregator, OpenIncident
+from ai_cache import ImprovementCache, make_cache_key
+from batching import Improvement, ImprovementBatcher
+from bulk import FORMATS as BULK_FORMATS, BulkFileImprover, BulkProgress
+from concurrency import AdaptiveLimiter
+from guild_config import MAX_EMBED_CONTENT, ConfigManager, ConfigSnapshot
+from incident_store import IncidentRecord, IncidentStore
+from jobs import ImprovementJob, ImprovementQueue
+from logging_setup import setup_logging
+from message_cache import MessageSnapshot, MessageSnapshotCache
+from metrics import MetricsRegistry
+from prefilter import ESCALATE, LOCAL, TextPrefilter
+from profiling import LoopWatchdog, ProfileReport, SpanTimer, profile_event_loop
+from ratelimit import GCRALimit, RateLimiter
+from resilience import CircuitBreaker, RetryPolicy, UpstreamError, hedged, parse_retry_after
+from retroscan import ChannelScan, ScanCheckpoint, parse_scan_bound
+from scheduler import ChannelSendScheduler
+from shared_state import StateBackend, create_backend
+from snapshot import read_snapshot, write_snapshot
+from tokens import TokenBudget, TokenSizer, estimate_tokens
+
+# Reference point for the startup timing breakdown (module loaded, dependencies imported)
+STARTED_AT = time.monotonic()
+
+# Handlers are installed by setup_logging() in main(); log lines avoid emojis for Windows compatibility
 logger = logging.getLogger(__name__)
 
-# Add console handler without emojis
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
+# Bump when the prompt changes so cached improvements are not reused
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You improve text to be respectful and appropriate."
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    """Load bot configuration from config.json."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"Config file {path} not found, using defaults")
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid config file {path}: {e}")
+    return {}
 
 class OpenRouterTextImprover:
     """OpenRouter API integration for text improvement."""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, config: Optional[dict] = None, metrics: Optional[MetricsRegistry] = None,
+                 shared_state: Optional[StateBackend] = None, budget: Optional[TokenBudget] = None):
+        config = config or {}
         self.api_key = api_key
+        self.metrics = metrics
+        # Per-guild daily token allowance, charged with the usage each response reports
+        self.budget = budget
         self.api_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.model = "openrouter/auto"
+        # Ordered fallback chain; the first model also keys the cache
+        self.models = config.get('models') or [config.get('model', "openrouter/auto")]
+        self.model = self.models[0]
+        
+        # Fail fast while upstream is unhealthy, retry with jitter, optionally hedge slow calls
+        resilience = config.get('resilience', {})
+        circuit = resilience.get('circuit', {})
+        self.breaker = CircuitBreaker(circuit.get('failure_threshold', 5), circuit.get('recovery_time', 30))
+        self.retry_policy = RetryPolicy(
+            resilience.get('retries', 2),
+            resilience.get('retry_base_delay', 0.5),
+            resilience.get('retry_max_delay', 8.0)
+        )
+        hedge = resilience.get('hedge', {})
+        self.hedge_model = hedge.get('model')
+        self.hedge_delay = hedge.get('delay', 2.0)
+        
+        # Concurrent improvements adapt to upstream latency and throttling, shared fairly between guilds
+        concurrency_config = config.get('concurrency', {})
+        self.limiter = (
+            AdaptiveLimiter.from_config(concurrency_config)
+            if concurrency_config.get('enabled', True) else None
+        )
+        
+        # Prompt input is trimmed to a token budget and max_tokens scaled to it
+        self.sizer = TokenSizer.from_config(config.get('tokens'))
+        
+        # Connection pool settings
+        self.connection_limit = config.get('connection_limit', 20)
+        self.keepalive_timeout = config.get('keepalive_timeout', 30)
+        self.dns_cache_ttl = config.get('dns_cache_ttl', 300)
+        
+        # Per-phase timeouts (seconds)
+        timeouts = config.get('timeouts', {})
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeouts.get('total', 30),
+            connect=timeouts.get('connect', 5),
+            sock_read=timeouts.get('read', 20)
+        )
+        
+        # Shared session, opened by start() and closed by close()
+        self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Result cache in front of the API, shared between processes when the backend is
+        cache_config = config.get('cache', {})
+        self.cache = (
+            ImprovementCache.from_config(cache_config, shared_state)
+            if cache_config.get('enabled', True) else None
+        )
+        
+        # Optional streaming of improvements into a progressively edited embed
+        streaming_config = config.get('streaming', {})
+        self.streaming_enabled = streaming_config.get('enabled', False)
+        self.stream_edit_interval = streaming_config.get('edit_interval', 1.5)
+        self.stream_max_chars = streaming_config.get('max_chars', 1000)
+        
+        # Optional micro-batching of concurrent requests
+        batching_config = config.get('batching', {})
+        self.batcher = (
+            ImprovementBatcher.from_config(self._request_batch, self._request_improvement, batching_config)
+            if batching_config.get('enabled', False) else None
+        )
+        
+        # Connection reuse and latency statistics
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+            'streams': 0,
+            'ttft_total': 0.0,
+            'retries': 0,
+            'fallbacks': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'short_circuited': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0
+        }
     
-    async def improve_text(self, original_text: str) -> Optional[str]:
-        """Improve the flagged text using OpenRouter API."""
-        try:
-            if not original_text or original_text.strip() == "*No text content*":
-                return None
-            
-            prompt = f"""Improve this inappropriate message to be more respectful and constructive:
+    async def start(self):
+        """Open the shared HTTP session."""
+        if self.session and not self.session.closed:
+            return
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            trace_configs=[trace_config]
+        )
+        logger.info(f"OpenRouter session opened (pool size {self.connection_limit})")
+        
+        if self.cache:
+            await self.cache.open()
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self.batcher:
+            await self.batcher.close()
+        
+        if self.session and not self.session.closed:
+            await self.session.close()
+            logger.info("OpenRouter session closed")
+        self.session = None
+        
+        if self.cache:
+            await self.cache.close()
+    
+    async def _on_connection_create(self, session, context, params):
+        self.stats['connections_created'] += 1
+    
+    async def _on_connection_reuse(self, session, context, params):
+        self.stats['connections_reused'] += 1
+    
+    def get_stats(self) -> dict:
+        """Return connection reuse and latency statistics."""
+        stats = dict(self.stats)
+        connections = stats['connections_created'] + stats['connections_reused']
+        stats['reuse_ratio'] = stats['connections_reused'] / connections if connections else 0.0
+        stats['latency_avg'] = stats['latency_total'] / stats['requests'] if stats['requests'] else 0.0
+        stats['ttft_avg'] = stats['ttft_total'] / stats['streams'] if stats['streams'] else 0.0
+        stats['circuit'] = self.breaker.get_stats()
+        return stats
+    
+    def export_state(self) -> dict:
+        """Hot in-memory state (cached improvements, learned concurrency limit) for a snapshot."""
+        return {
+            'cache': self.cache.export_state() if self.cache else {},
+            'limiter': self.limiter.export_state() if self.limiter else {}
+        }
+    
+    def restore_state(self, state: dict):
+        """Reload state saved by export_state() in a previous run."""
+        if self.cache:
+            self.cache.restore_state(state.get('cache', {}))
+        if self.limiter:
+            self.limiter.restore_state(state.get('limiter', {}))
+    
+    @property
+    def available(self) -> bool:
+        """False while the circuit breaker is failing requests fast."""
+        return self.breaker.available
+    
+    def cache_key(self, text: str) -> str:
+        """Return the cache key for text under the current model and prompt."""
+        return make_cache_key(text, self.model, PROMPT_VERSION)
+    
+    def get_cached(self, text: str) -> Optional[str]:
+        """Return an in-memory cached improvement without calling the API."""
+        if not self.cache:
+            return None
+        return self.cache.get(self.cache_key(text))
+    
+    async def improve_text(self, original_text: str, guild_id: Optional[int] = None,
+                           weight: float = 1.0) -> Optional[str]:
+        """Improve the flagged text using OpenRouter API.
+        
+        guild_id and weight set this call's fair share of the concurrency limit.
+        Batched texts share their batch's request, which takes one slot for no
+        guild in particular.
+        """
+        if not original_text or original_text.strip() == "*No text content*":
+            return None
+        
+        async def compute() -> Optional[str]:
+            if self.batcher:
+                improvement = await self.batcher.submit(original_text)
+            else:
+                improvement = await self._request_improvement(original_text, guild_id, weight)
+            if self.budget:
+                self.budget.charge(guild_id, improvement.tokens, estimated=improvement.estimated)
+            return improvement.text
+        
+        if self.cache:
+            return await self.cache.get_or_compute(self.cache_key(original_text), compute)
+        return await compute()
+    
+    async def _acquire_slot(self, guild_id: Optional[int], weight: float):
+        waited = await self.limiter.acquire(guild_id, weight)
+        if self.metrics:
+            self.metrics.histogram('st_ai_limiter_wait_seconds').observe(waited)
+    
+    @staticmethod
+    def _usage_tokens(usage: Optional[dict]) -> int:
+        """Total tokens in a response's usage report (0 if there is none)."""
+        if not usage:
+            return 0
+        return usage.get('total_tokens') or (
+            (usage.get('prompt_tokens', 0) or 0) + (usage.get('completion_tokens', 0) or 0)
+        )
+    
+    def _build_messages(self, original_text: str) -> List[dict]:
+        """Build the chat messages for a single improvement (text already trimmed)."""
+        prompt = f"""Improve this inappropriate message to be more respectful and constructive:
 
 Original: "{original_text}"
 
 Provide only the improved text, no explanations."""
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+        
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    def clean_completion(text: str) -> str:
+        """Strip whitespace and wrapping quotes from a completion."""
+        return text.strip().strip('"').strip("'").strip()
+    
+    async def _request_improvement(self, original_text: str, guild_id: Optional[int] = None,
+                                   weight: float = 1.0) -> Improvement:
+        """Send a single improvement request to OpenRouter."""
+        text = self.sizer.trim(original_text)
+        improved_text, usage = await self._post_completion(
+            self._build_messages(text), max_tokens=self.sizer.output_tokens(text), guild_id=guild_id, weight=weight
+        )
+        if improved_text is None:
+            return Improvement(None)
+        
+        improved_text = self.clean_completion(improved_text) or None
+        logger.debug(f"AI improved text: {improved_text}")
+        if usage:
+            return Improvement(improved_text, self._usage_tokens(usage))
+        return Improvement(improved_text, estimate_tokens(text) + estimate_tokens(improved_text or ''), estimated=True)
+    
+    async def stream_improvement(self, original_text: str, guild_id: Optional[int] = None,
+                                 weight: float = 1.0) -> AsyncIterator[str]:
+        """Stream an improvement from OpenRouter, yielding text deltas as they arrive."""
+        if not self.breaker.allow():
+            self.stats['short_circuited'] += 1
+            return
+        
+        if self.limiter:
+            try:
+                await self._acquire_slot(guild_id, weight)
+            except BaseException:
+                # Cancelled while waiting for a slot: nothing was sent
+                self.breaker.release()
+                raise
+        start_time = time.perf_counter()
+        first_token = True
+        status = 'error'
+        usage = None
+        cancelled = False
+        try:
+            if not self.session or self.session.closed:
+                await self.start()
             
+            text = self.sizer.trim(original_text)
             data = {
                 "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "You improve text to be respectful and appropriate."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 150,
-                "temperature": 0.7
+                "messages": self._build_messages(text),
+                "max_tokens": self.sizer.output_tokens(text),
+                "temperature": 0.7,
+                "stream": True,
+                # The final chunk then carries the token usage
+                "stream_options": {"include_usage": True}
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        improved_text = result['choices'][0]['message']['content'].strip()
-                        improved_text = improved_text.strip('"').strip("'").strip()
-                        logger.debug(f"AI improved text: {improved_text}")
-                        return improved_text
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"OpenRouter API error {response.status}: {error_text}")
-                        return None
-                        
+            self.stats['requests'] += 1
+            async with self.session.post(self.api_url, json=data) as response:
+                status = response.status
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"OpenRouter API error {response.status}: {error_text}")
+                    self.stats['errors'] += 1
+                    return
+                
+                # Server-sent events: "data: {...}" lines, ": comment" keep-alives, "data: [DONE]" at the end
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8', errors='replace').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == '[DONE]':
+                        break
+                    
+                    try:
+                        chunk = json.loads(payload)
+                    except json.JSONDecodeError:
+                        continue
+                    
+                    usage = chunk.get('usage') or usage
+                    choices = chunk.get('choices') or [{}]
+                    delta = (choices[0].get('delta') or {}).get('content')
+                    if not delta:
+                        continue
+                    
+                    if first_token:
+                        first_token = False
+                        self.stats['streams'] += 1
+                        self.stats['ttft_total'] += time.perf_counter() - start_time
+                    yield delta
+                    
+        except asyncio.TimeoutError:
+            logger.error(f"OpenRouter stream timed out after {time.perf_counter() - start_time:.2f}s")
+            self.stats['timeouts'] += 1
+            status = 'timeout'
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled = True
+            raise
         except Exception as e:
-            logger.error(f"Error improving text: {e}")
-            return None
+            logger.error(f"Error streaming improvement: {e}")
+            self.stats['errors'] += 1
+        finally:
+            # A stream that produced text counts as healthy even if the caller stopped reading;
+            # as in _post_completion, rejected requests (bad input, auth) say nothing about upstream health
+            rejected = isinstance(status, int) and status >= 400 and not UpstreamError(status).retryable
+            if not first_token or rejected:
+                self.breaker.record_success()
+            elif cancelled:
+                self.breaker.release()
+            else:
+                self.breaker.record_failure()
+            if self.limiter:
+                # Stream duration depends on output length, so only the status is a signal
+                self.limiter.observe(status)
+                self.limiter.release()
+            self._record_request(time.perf_counter() - start_time, status)
+            if usage:
+                self._record_usage(usage)
+                if self.budget:
+                    self.budget.charge(guild_id, self._usage_tokens(usage))
+    
+    def remember(self, original_text: str, improved_text: str):
+        """Store an improvement obtained outside improve_text (e.g. streamed) in the cache."""
+        if self.cache:
+            self.cache.put(self.cache_key(original_text), improved_text)
+    
+    async def _request_batch(self, texts: List[str]) -> List[Improvement]:
+        """Improve several texts in one completion. Items that fail come back with no text.
+        
+        The batch's reported usage is split between its items in proportion to
+        their estimated size, so each caller's guild pays its own share.
+        """
+        texts = [self.sizer.trim(text) for text in texts]
+        prompt = f"""Improve each of these inappropriate messages to be more respectful and constructive.
+
+Messages (JSON array):
+{json.dumps(texts, ensure_ascii=False)}
+
+Respond with only a JSON array of {len(texts)} improved strings in the same order, no explanations."""
+        
+        content, usage = await self._post_completion(
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=min(
+                sum(self.sizer.output_tokens(text) for text in texts),
+                self.batcher.max_batch_tokens if self.batcher else 1200
+            ),
+            batched=True
+        )
+        if content is None:
+            return [Improvement(None) for _ in texts]
+        results = self._parse_batch_response(content, len(texts))
+        
+        sizes = [estimate_tokens(text) + estimate_tokens(result or '') for text, result in zip(texts, results)]
+        total = self._usage_tokens(usage)
+        if not total:
+            return [Improvement(result, size, estimated=True) for result, size in zip(results, sizes)]
+        weights = sum(sizes) or 1
+        return [Improvement(result, round(total * size / weights)) for result, size in zip(results, sizes)]
+    
+    @staticmethod
+    def _parse_batch_response(content: str, count: int) -> List[Optional[str]]:
+        """Parse a JSON array completion back into one result per input."""
+        results: List[Optional[str]] = [None] * count
+        start = content.find('[')
+        end = content.rfind(']')
+        if start == -1 or end <= start:
+            logger.warning("Batch completion did not contain a JSON array")
+            return results
+        
+        try:
+            items = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not parse batch completion: {e}")
+            return results
+        
+        if len(items) != count:
+            logger.warning(f"Batch completion returned {len(items)} items, expected {count}")
+        
+        for i, item in enumerate(items[:count]):
+            if isinstance(item, str) and item.strip():
+                results[i] = OpenRouterTextImprover.clean_completion(item)
+        return results
+    
+    async def _post_completion(self, messages: List[dict], max_tokens: int, guild_id: Optional[int] = None,
+                               weight: float = 1.0, batched: bool = False) -> Tuple[Optional[str], Optional[dict]]:
+        """Get a completion and its usage report through the circuit breaker, model fallbacks,
+        retries and hedging. The content is None if it failed.
+        
+        Each HTTP request takes its own concurrency slot (guild_id and weight
+        set its fair share); retry backoff holds none.
+        """
+        share = (guild_id, weight, batched)
+        if not self.breaker.allow():
+            self.stats['short_circuited'] += 1
+            return None, None
+        
+        settled = False
+        try:
+            if self.hedge_model:
+                completion = await hedged(
+                    lambda: self._complete_with_fallback(messages, max_tokens, *share),
+                    lambda: self._hedge_request(messages, max_tokens, *share),
+                    self.hedge_delay
+                )
+            else:
+                completion = await self._complete_with_fallback(messages, max_tokens, *share)
+            self.breaker.record_success()
+            settled = True
+            return completion
+        except UpstreamError as e:
+            # Rejected requests (bad input, auth) say nothing about upstream health
+            if e.retryable:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            settled = True
+            logger.error(f"OpenRouter request failed: {e}")
+            return None, None
+        finally:
+            # Cancelled (shutdown, lost hedge, deadline) or crashed: no verdict, but free the probe
+            if not settled:
+                self.breaker.release()
+    
+    async def _complete_with_fallback(self, messages: List[dict], max_tokens: int, guild_id: Optional[int] = None,
+                                      weight: float = 1.0, batched: bool = False) -> Tuple[str, Optional[dict]]:
+        """Try each model in order, retrying retryable failures with jittered backoff."""
+        error: Optional[UpstreamError] = None
+        for index, model in enumerate(self.models):
+            if index:
+                self.stats['fallbacks'] += 1
+                logger.warning(f"Falling back to model {model} after: {error}")
+            for attempt in range(self.retry_policy.retries + 1):
+                try:
+                    return await self._post_once(messages, max_tokens, model, guild_id, weight, batched)
+                except UpstreamError as e:
+                    error = e
+                if not error.retryable or attempt == self.retry_policy.retries:
+                    break
+                delay = self.retry_policy.delay(attempt, error.retry_after)
+                if delay is None:
+                    break
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+        raise error
+    
+    async def _hedge_request(self, messages: List[dict], max_tokens: int, guild_id: Optional[int] = None,
+                             weight: float = 1.0, batched: bool = False) -> Tuple[str, Optional[dict]]:
+        """The backup request sent when the primary chain is slow."""
+        self.stats['hedges'] += 1
+        completion = await self._post_once(messages, max_tokens, self.hedge_model, guild_id, weight, batched)
+        self.stats['hedge_wins'] += 1
+        return completion
+    
+    async def _post_once(self, messages: List[dict], max_tokens: int, model: str, guild_id: Optional[int] = None,
+                         weight: float = 1.0, batched: bool = False) -> Tuple[str, Optional[dict]]:
+        """POST one chat completion and return the message content and usage, or raise UpstreamError."""
+        if self.limiter:
+            await self._acquire_slot(guild_id, weight)
+        start_time = time.perf_counter()
+        status = 'error'
+        try:
+            if not self.session or self.session.closed:
+                await self.start()
+            
+            data = {
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": 0.7
+            }
+            
+            self.stats['requests'] += 1
+            async with self.session.post(self.api_url, json=data) as response:
+                status = response.status
+                if response.status == 200:
+                    result = await response.json()
+                    content = result['choices'][0]['message']['content'].strip()
+                    usage = result.get('usage')
+                    if usage:
+                        self._record_usage(usage)
+                    return content, usage
+                
+                error_text = await response.text()
+                self.stats['errors'] += 1
+                raise UpstreamError(
+                    response.status, error_text[:200], parse_retry_after(response.headers.get('Retry-After'))
+                )
+                    
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            status = 'timeout'
+            raise UpstreamError('timeout', f"{model} after {time.perf_counter() - start_time:.2f}s")
+        except asyncio.CancelledError:
+            # Lost a hedge race or shutting down
+            status = 'cancelled'
+            raise
+        except (aiohttp.ClientError, KeyError, IndexError, TypeError, ValueError) as e:
+            self.stats['errors'] += 1
+            raise UpstreamError('error', f"{model}: {e}")
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if self.limiter:
+                if status != 'cancelled':
+                    # A batch runs longer than the single requests the latency baseline is
+                    # learned from, so only its status is a signal
+                    self.limiter.observe(status, None if batched else elapsed)
+                self.limiter.release()
+            self._record_request(elapsed, status)
+
+    def _record_usage(self, usage: dict):
+        """Record the token usage one response reported."""
+        prompt_tokens = usage.get('prompt_tokens', 0) or 0
+        completion_tokens = usage.get('completion_tokens', 0) or 0
+        self.stats['prompt_tokens'] += prompt_tokens
+        self.stats['completion_tokens'] += completion_tokens
+        if self.metrics:
+            tokens = self.metrics.counter('st_ai_tokens_total')
+            tokens.inc(prompt_tokens, kind='prompt')
+            tokens.inc(completion_tokens, kind='completion')
+    
+    def _record_request(self, elapsed: float, status):
+        """Record latency and outcome of one API request."""
+        self.stats['latency_total'] += elapsed
+        self.stats['latency_max'] = max(self.stats['latency_max'], elapsed)
+        if self.metrics:
+            self.metrics.histogram('st_openrouter_request_seconds').observe(elapsed)
+            self.metrics.counter('st_openrouter_responses_total').inc(status=status)
+
+class IncidentHistoryView(discord.ui.View):
+    """Newer/Older buttons over a user's incident history, one keyset page at a time."""
+    
+    def __init__(self, bot: "ShitTrackerBot", owner_id: int, guild_id: int, user: discord.abc.User,
+                 role: str, total: int, page_size: int):
+        super().__init__(timeout=180)
+        self.bot = bot
+        self.owner_id = owner_id
+        self.guild_id = guild_id
+        self.user = user
+        self.role = role
+        self.total = total
+        self.page_size = page_size
+        # Cursor each visited page starts after (None for the newest page)
+        self.cursors: List[Optional[tuple]] = [None]
+        self.next_cursor: Optional[tuple] = None
+    
+    async def load(self) -> discord.Embed:
+        """Fetch the current page and return its embed."""
+        store = self.bot.incident_store
+        # One extra row tells whether an older page exists
+        records = await store.history(
+            self.guild_id, self.user.id, self.role, limit=self.page_size + 1, before=self.cursors[-1]
+        )
+        has_older = len(records) > self.page_size
+        records = records[:self.page_size]
+        self.next_cursor = store.cursor(records[-1]) if records else None
+        self.older.disabled = not has_older
+        self.newer.disabled = len(self.cursors) == 1
+        return self.bot._build_history_embed(self.user, self.role, records, self.total, len(self.cursors))
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the person who ran the command can page through it.",
+                                                    ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="Newer", emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+    
+    @discord.ui.button(label="Older", emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=await self.load(), view=self)
 
 class ShitTrackerBot(commands.Bot):
     """Discord bot for content monitoring with AI text improvement."""
     
-    def __init__(self):
-        # Configure intents
-        intents = discord.Intents.default()
-        intents.reactions = True
+    # Commands that do no real work and are never held back by command_cooldown
+    COOLDOWN_EXEMPT = ('help', 'ping')
+    
+    def __init__(self, cluster_id: int = 0, **options):
+        # Time spent in each startup phase, reported once the gateway is ready
+        self.startup_timings = {'pre_init': time.monotonic() - STARTED_AT}
+        self._phase_started = time.monotonic()
+        
+        # Only what the reaction flow and prefix commands use: guild and channel
+        # state, guild reactions, and guild and DM messages with their content
+        intents = discord.Intents.none()
         intents.guilds = True
+        intents.guild_reactions = True
+        intents.guild_messages = True
+        intents.dm_messages = True
         intents.message_content = True
         
+        config = load_config()
+        discord_config = config.get('discord', {})
+        
+        # config.json plus per-guild overrides, reloaded when the file changes
+        guild_config = ConfigManager(CONFIG_PATH, config, reload_interval=config.get('config_reload_interval', 2))
+        
+        # Reactions are handled from raw events and carry their member, so the
+        # message cache can stay small and members are neither chunked nor cached
         super().__init__(
             command_prefix='!st ',
             intents=intents,
             help_command=None,
-            case_insensitive=True
+            case_insensitive=True,
+            max_messages=discord_config.get('max_messages', 100),
+            chunk_guilds_at_startup=discord_config.get('chunk_guilds_at_startup', False),
+            member_cache_flags=(
+                discord.MemberCacheFlags.from_intents(intents)
+                if discord_config.get('cache_members', False) else discord.MemberCacheFlags.none()
+            ),
+            # Presence is sent with IDENTIFY, so it needs no extra call and survives reconnects
+            activity=self._presence_activity(guild_config.snapshot),
+            status=discord.Status.online,
+            **options
         )
         
         # Configuration
-        self.target_emoji = '💩'
+        self.config = config
+        self.cluster_id = cluster_id
+        self._ready_once = False
+        self.guild_config = guild_config
+        self.guild_config.on_reload(self._apply_config)
+        
+        # Last use per (guild, user, command), for the command cooldown
+        self._command_uses: Dict[tuple, float] = {}
+        self.add_check(self._check_command_cooldown)
+        
+        # Snapshots of flagged messages that are not in discord.py's cache
+        self.message_cache = MessageSnapshotCache.from_config(self.config.get('message_cache'))
+        
+        # Latency histograms and counters, optionally served on a local /metrics endpoint
+        self.metrics = MetricsRegistry()
+        
+        # Rate limiter, AI cache and counter state; shared between shard processes with redis
+        self.shared_state = create_backend(self.config.get('shared_state'))
+        
+        # Daily AI token allowance per guild (ai_daily_tokens, 0 for none)
+        self.token_budget = TokenBudget(lambda guild_id: self.guild_config.for_guild(guild_id).ai_daily_tokens)
         
         # Initialize AI text improver
         openrouter_key = os.getenv('OPENROUTER_API_KEY')
-        self.text_improver = OpenRouterTextImprover(openrouter_key) if openrouter_key else None
+        self.text_improver = (
+            OpenRouterTextImprover(
+                openrouter_key, self.config.get('openrouter'), self.metrics, self.shared_state, self.token_budget
+            )
+            if openrouter_key else None
+        )
         if not self.text_improver:
             logger.warning("OPENROUTER_API_KEY not set - AI text improvement disabled")
         
-        # Rate limiting
-        self.rate_limits = defaultdict(lambda: deque(maxlen=10))
-        self.rate_limit_window = 60  # seconds
-        self.rate_limit_max = 5      # max reactions per window
+        # Local stage that skips trivial flags and masks listed words without the model
+        prefilter_config = self.config.get('prefilter', {})
+        self.prefilter = (
+            TextPrefilter.from_config(prefilter_config, self.metrics)
+            if prefilter_config.get('enabled', True) else None
+        )
+        
+        # Outbound sends are paced per channel and merged into digests under load
+        self.send_scheduler = ChannelSendScheduler.from_config(
+            self._send_embeds, self._build_digest_embed, self.config.get('send_scheduler')
+        )
+        
+        # Incident rendering: 'separate' posts the AI result as its own message,
+        # 'single' edits it into the flagged message
+        self.render_mode = self.config.get('discord', {}).get('render_mode', 'single')
+        self.render_stats = {'incidents': 0, 'sends': 0, 'edits': 0}
+        # Flagged message ID -> lock held around each edit of it, so a slower edit
+        # built from older state cannot land after a newer one
+        self._edit_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+        
+        # Time from stream start to the first visible suggestion text
+        self.streaming_stats = {'streams': 0, 'cancelled': 0, 'first_visible_total': 0.0}
+        
+        # AI improvements run on a bounded worker pool, off the reaction path
+        self.improvement_queue = ImprovementQueue.from_config(
+            self._process_improvement, self.config.get('ai_queue')
+        )
+        
+        # Repeat flags on a message join its open incident instead of starting another
+        aggregation_config = self.config.get('incident_aggregation', {})
+        self.incident_index = (
+            IncidentAggregator.from_config(self._render_incident, aggregation_config)
+            if aggregation_config.get('enabled', True) else None
+        )
+        self.max_listed_flaggers = aggregation_config.get('max_listed_flaggers', 10)
+        
+        # Incidents are recorded to SQLite in batches for the history and top commands
+        store_config = self.config.get('incident_store', {})
+        self.incident_store = IncidentStore.from_config(store_config) if store_config.get('enabled', True) else None
+        self.history_page_size = store_config.get('page_size', 10)
+        
+        # Retro-scans of channel history, at most one per channel at a time
+        self.scan_config = self.config.get('scan', {})
+        self._active_scans: Set[int] = set()
+        
+        # !st improve with an attached file, one file per guild at a time
+        self.improve_file_config = self.config.get('improve_file', {})
+        self._active_files: Set[Optional[int]] = set()
+        
+        # Rate limiting: per user, guild, channel and global tiers from config.json
+        self.rate_limiter = RateLimiter.from_config(self.config, self.shared_state)
+        
+        # Shutdown drains in-flight work and saves in-memory state for the next start
+        self.snapshot_config = self.config.get('snapshot', {})
+        self.snapshot_path = None
+        if self.snapshot_config.get('enabled', True):
+            root, ext = os.path.splitext(self.snapshot_config.get('path', 'state.json.gz'))
+            self.snapshot_path = f"{root}.{cluster_id}{ext}" if cluster_id else f"{root}{ext}"
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._shutdown_task: Optional[asyncio.Task] = None
+        self._shutting_down = False
+        # Reactions between the rate-limit check and the flagged embed being sent
+        self._incidents_in_flight = 0
+        
+        # Event loop profiles (!st profile, ST_PROFILE_SECONDS) and a watchdog for blocking callbacks
+        self.profiling_config = self.config.get('profiling', {})
+        watchdog_config = self.profiling_config.get('watchdog', {})
+        self.loop_watchdog = LoopWatchdog.from_config(watchdog_config) if watchdog_config.get('enabled', True) else None
+        self._profiling = False
+        
+        self._register_metrics()
+        self._mark_startup('init')
+    
+    def _mark_startup(self, phase: str):
+        """Record the time since the previous startup phase ended."""
+        now = time.monotonic()
+        self.startup_timings[phase] = now - self._phase_started
+        self._phase_started = now
+    
+    @staticmethod
+    def _presence_activity(snapshot: ConfigSnapshot) -> discord.Activity:
+        return discord.Activity(
+            type=discord.ActivityType.watching,
+            name=f"{snapshot.defaults.emoji.display} reactions in all servers"
+        )
+    
+    async def _apply_config(self, snapshot: ConfigSnapshot):
+        """Apply a reloaded config.json to the components that can change live.
+        
+        Pool sizes, ports, intents and other startup settings still need a restart.
+        """
+        previous = self.config
+        self.config = snapshot.raw
+        self.rate_limiter.reload(snapshot.raw)
+        self.render_mode = snapshot.raw.get('discord', {}).get('render_mode', 'single')
+        
+        prefilter_config = snapshot.raw.get('prefilter', {})
+        if prefilter_config != previous.get('prefilter', {}):
+            self.prefilter = (
+                TextPrefilter.from_config(prefilter_config, self.metrics)
+                if prefilter_config.get('enabled', True) else None
+            )
+        
+        if snapshot.raw.get('target_emoji') != previous.get('target_emoji') and self.is_ready():
+            await self.change_presence(activity=self._presence_activity(snapshot), status=discord.Status.online)
+    
+    async def _check_command_cooldown(self, ctx) -> bool:
+        """Global command check: each command once per user per command_cooldown seconds in each guild."""
+        cooldown = self.guild_config.for_guild(ctx.guild and ctx.guild.id).command_cooldown
+        if not cooldown or ctx.command is None or ctx.command.qualified_name in self.COOLDOWN_EXEMPT:
+            return True
+        now = time.monotonic()
+        key = (ctx.guild and ctx.guild.id, ctx.author.id, ctx.command.qualified_name)
+        last = self._command_uses.get(key)
+        if last is not None and now - last < cooldown:
+            raise commands.CommandOnCooldown(commands.Cooldown(1, cooldown), cooldown - (now - last),
+                                             commands.BucketType.member)
+        if len(self._command_uses) >= 10000:
+            # Entries older than any plausible cooldown are safe to forget
+            self._command_uses = {k: t for k, t in self._command_uses.items() if now - t < 3600}
+        self._command_uses[key] = now
+        return True
+    
+    async def on_command_error(self, ctx, error):
+        """Reply to cooldowns and bad arguments; log anything else."""
+        if isinstance(error, commands.CommandNotFound):
+            return
+        if isinstance(error, commands.CommandOnCooldown):
+            await ctx.send(f"⏳ Slow down - try again in {error.retry_after:.0f}s")
+        elif isinstance(error, (commands.UserInputError, commands.CheckFailure)):
+            await ctx.send(f"❌ {error}")
+        else:
+            logger.error(f"Command {ctx.command} failed: {error}")
+    
+    def _register_metrics(self):
+        """Create the bot's metrics; gauges read live state at scrape time."""
+        m = self.metrics
+        self.reactions_counter = m.counter('st_reactions_total', 'Target emoji reactions seen')
+        self.rate_limited_counter = m.counter('st_reactions_rate_limited_total', 'Reactions dropped by the rate limiter')
+        self.incidents_counter = m.counter('st_incidents_total', 'Incidents handled')
+        self.merged_flags_counter = m.counter('st_incident_flags_merged_total',
+                                              'Flags merged into an already open incident')
+        self.ai_failures_counter = m.counter('st_ai_failures_total', 'AI improvements that could not be generated')
+        self.ai_skipped_counter = m.counter('st_ai_skipped_total', 'AI embeds skipped while the circuit breaker was open')
+        self.ai_budget_counter = m.counter('st_ai_budget_exhausted_total',
+                                           'AI requests skipped because the guild used its daily token budget')
+        self.reaction_to_flag = m.histogram('st_reaction_to_flag_seconds', 'Time from reaction to flagged embed sent')
+        self.reaction_to_ai = m.histogram('st_reaction_to_ai_seconds', 'Time from reaction to AI embed posted')
+        self.discord_send_latency = m.histogram('st_discord_send_seconds', 'Discord message send/edit latency')
+        m.histogram('st_openrouter_request_seconds', 'OpenRouter request latency')
+        m.histogram('st_prefilter_seconds', 'Time spent classifying flagged text locally',
+                    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+        m.counter('st_prefilter_decisions_total', 'Pre-filter decisions by outcome and reason')
+        m.counter('st_openrouter_responses_total', 'OpenRouter responses by HTTP status')
+        m.counter('st_ai_tokens_total', 'Tokens used by OpenRouter responses, by prompt and completion')
+        # Named spans on the reaction and incident hot paths, shown in profile reports too
+        self.spans = SpanTimer(m.histogram('st_span_seconds', 'Time spent in named hot-path spans',
+                                           buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+        
+        m.gauge('st_ai_queue_depth', 'AI jobs waiting for a worker', lambda: self.improvement_queue.depth)
+        m.gauge('st_send_queue_depth', 'Messages waiting in channel send queues',
+                lambda: self.send_scheduler.get_stats()['depth'])
+        m.gauge('st_rate_limiter_keys', 'Rate limiter keys tracked in this process',
+                lambda: self.rate_limiter.get_stats()['keys'])
+        m.gauge('st_ai_cache_hit_ratio', 'AI improvement cache hit ratio',
+                lambda: self.text_improver.cache.get_stats()['hit_rate']
+                if self.text_improver and self.text_improver.cache else 0)
+        m.gauge('st_incident_store_pending', 'Incidents buffered for the next store batch',
+                lambda: self.incident_store.get_stats()['pending'] if self.incident_store else 0)
+        m.histogram('st_ai_limiter_wait_seconds', 'Time AI requests waited for a concurrency slot')
+        m.gauge('st_ai_concurrency_limit', 'Current adaptive limit on concurrent AI requests',
+                lambda: self.text_improver.limiter.limit if self.text_improver and self.text_improver.limiter else 0)
+        m.gauge('st_ai_in_flight', 'AI requests holding a concurrency slot',
+                lambda: self.text_improver.limiter.in_flight if self.text_improver and self.text_improver.limiter else 0)
+        m.gauge('st_ai_circuit_open', 'Whether the AI circuit breaker is failing requests fast',
+                lambda: 0 if not self.text_improver or self.text_improver.available else 1)
+        m.gauge('st_open_incidents', 'Incidents still accepting merged flags',
+                lambda: self.incident_index.size if self.incident_index else 0)
+        m.gauge('st_guilds', 'Connected guilds', lambda: len(self.guilds))
+        m.gauge('st_loop_stalls', 'Callbacks that blocked the event loop past the watchdog threshold',
+                lambda: self.loop_watchdog.stats['stalls'] if self.loop_watchdog else 0)
+        m.gauge('st_startup_phase_seconds', 'Time spent in each startup phase',
+                lambda: dict(self.startup_timings), label='phase')
+    
+    async def setup_hook(self):
+        """Open long-lived resources before connecting to the gateway."""
+        self._mark_startup('login')
+        if self.loop_watchdog:
+            self.loop_watchdog.start()
+        profile_seconds = os.getenv('ST_PROFILE_SECONDS')
+        if profile_seconds:
+            # Profile startup and the first traffic without needing the command
+            try:
+                asyncio.create_task(self._run_profile(float(profile_seconds)), name='startup-profile')
+            except ValueError:
+                logger.error(f"ST_PROFILE_SECONDS must be a number of seconds, not {profile_seconds!r}")
+        self.guild_config.start()
+        await self.shared_state.start()
+        if self.shared_state.shared:
+            self.metrics.start_sync(self.shared_state, self.config.get('shared_state', {}).get('sync_interval', 15))
+        
+        metrics_config = self.config.get('metrics', {})
+        if metrics_config.get('enabled', False):
+            try:
+                await self.metrics.start_server(
+                    metrics_config.get('host', '127.0.0.1'), metrics_config.get('port', 9108) + self.cluster_id
+                )
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint: {e}")
+        
+        self.rate_limiter.start()
+        if self.incident_store:
+            await self.incident_store.open()
+        if self.text_improver:
+            await self.text_improver.start()
+            self.improvement_queue.start()
+        
+        if self.snapshot_path:
+            state = await asyncio.to_thread(read_snapshot, self.snapshot_path)
+            if state:
+                self._restore_state(state)
+            interval = self.snapshot_config.get('interval', 60)
+            if interval:
+                self._snapshot_task = asyncio.create_task(self._snapshot_loop(interval), name='state-snapshot')
+        self._mark_startup('setup_hook')
+    
+    def _export_state(self, jobs: List[ImprovementJob]) -> dict:
+        """Collect the in-memory state worth keeping across a restart.
+        
+        Jobs, caches and open incidents hold message text (or AI rewrites of
+        it), so they are only saved when snapshot.store_content is enabled.
+        """
+        state = {
+            'shared_state': self.shared_state.export_state(),
+            'token_budget': self.token_budget.export_state()
+        }
+        if self.snapshot_config.get('store_content', False):
+            state.update(
+                jobs=[asdict(job) for job in jobs],
+                improver=self.text_improver.export_state() if self.text_improver else {},
+                message_cache=self.message_cache.export_state(),
+                incidents=self.incident_index.export_state() if self.incident_index else {}
+            )
+        return state
+    
+    def _restore_state(self, state: dict):
+        """Warm caches from a snapshot and replay the AI jobs it holds.
+        
+        Each part is restored on its own, so one that does not fit this
+        version is skipped without losing the others or stopping startup.
+        """
+        if not isinstance(state, dict):
+            logger.error("Ignoring state snapshot: not a JSON object")
+            return
+        tiers = (
+            ('improver', self.text_improver),
+            ('message_cache', self.message_cache),
+            ('incidents', self.incident_index),
+            ('shared_state', self.shared_state),
+            ('token_budget', self.token_budget)
+        )
+        for name, tier in tiers:
+            if tier is None or name not in state:
+                continue
+            try:
+                if not isinstance(state[name], dict):
+                    raise TypeError(f"expected an object, not {type(state[name]).__name__}")
+                tier.restore_state(state[name])
+            except Exception as e:
+                logger.error(f"Could not restore {name} from the state snapshot: {e}")
+        
+        jobs = state.get('jobs', [])
+        if not jobs or not self.text_improver or not isinstance(jobs, list):
+            return
+        now = time.time()
+        max_age = self.snapshot_config.get('max_replay_age', 600)
+        replayed = 0
+        for fields in jobs:
+            job = self._job_from_snapshot(fields)
+            if job is None or now - (job.reaction_at or job.enqueued_at) > max_age:
+                continue
+            if job.published and not job.flagged_message_id:
+                # Its AI message was already posted (e.g. a partial stream); running it
+                # again would post a second one. Single-message jobs just edit again
+                continue
+            # A fresh queue deadline: time spent down does not count against the job
+            job.enqueued_at = now
+            job.deadline = 0.0
+            replayed += self.improvement_queue.submit(job)
+        logger.info(f"Replayed {replayed} of {len(jobs)} AI jobs from the state snapshot")
+    
+    @staticmethod
+    def _job_from_snapshot(fields) -> Optional[ImprovementJob]:
+        """Rebuild a saved job, or None (with a warning) if it does not fit this version."""
+        try:
+            job = ImprovementJob(**fields)
+            if not (isinstance(job.content, str) and all(
+                isinstance(value, int) for value in (job.guild_id, job.channel_id, job.message_id)
+            ) and isinstance(job.reaction_at, (int, float)) and isinstance(job.enqueued_at, (int, float))):
+                raise TypeError("unexpected field types")
+        except TypeError as e:
+            logger.warning(f"Skipping unusable AI job in the state snapshot: {e}")
+            return None
+        return job
+    
+    async def _save_snapshot(self, jobs: List[ImprovementJob]):
+        """Write the state snapshot off the event loop."""
+        state = self._export_state(jobs)
+        try:
+            await asyncio.to_thread(write_snapshot, self.snapshot_path, state)
+        except OSError as e:
+            logger.error(f"Could not write state snapshot {self.snapshot_path}: {e}")
+    
+    async def _snapshot_loop(self, interval: float):
+        """Save caches periodically, so a crash restart still starts warm.
+        
+        Queued jobs are left out: after a crash some of them may have been
+        posted already, and replaying those would post them twice.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self._save_snapshot([])
+    
+    async def _wait_idle(self, busy, deadline: float):
+        """Wait until busy() is false or the monotonic deadline passes."""
+        while busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+    
+    async def close(self):
+        """Drain in-flight work, save a state snapshot, release long-lived resources and disconnect.
+        
+        Safe to call more than once; later calls wait for the first.
+        """
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.create_task(self._shutdown(), name='shutdown')
+        await asyncio.shield(self._shutdown_task)
+    
+    async def _shutdown(self):
+        # New flags are ignored from here on
+        self._shutting_down = True
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+        
+        # Flags already accepted get their flagged embed, then the AI jobs finish,
+        # until drain_timeout; whatever is left goes into the snapshot
+        deadline = time.monotonic() + self.snapshot_config.get('drain_timeout', 10)
+        await self._wait_idle(lambda: self._incidents_in_flight, deadline)
+        if self._incidents_in_flight:
+            logger.warning(f"Shutting down with {self._incidents_in_flight} incidents not yet posted")
+        unfinished = await self.improvement_queue.drain(max(0.0, deadline - time.monotonic()))
+        await self._wait_idle(lambda: self.send_scheduler.get_stats()['depth'], deadline)
+        if self.snapshot_path:
+            await self._save_snapshot(unfinished)
+            if self.snapshot_config.get('store_content', False):
+                logger.info(f"State snapshot saved with {len(unfinished)} unfinished AI jobs")
+            else:
+                logger.info(f"State snapshot saved; {len(unfinished)} unfinished AI jobs dropped (store_content is off)")
+        
+        await self.guild_config.stop()
+        if self.incident_index:
+            await self.incident_index.stop()
+        await self.send_scheduler.stop()
+        await self.rate_limiter.stop()
+        if self.loop_watchdog:
+            await self.loop_watchdog.stop()
+        if self.incident_store:
+            await self.incident_store.close()
+        await self.metrics.stop_server()
+        if self.text_improver:
+            await self.text_improver.close()
+        if self.shared_state.shared:
+            try:
+                await self.metrics.stop_sync(self.shared_state)
+            except Exception as e:
+                logger.error(f"Final metrics sync failed: {e}")
+        await self.shared_state.close()
+        await super().close()
     
     async def on_ready(self):
-        """Bot ready event."""
-        logger.info(f'Bot {self.user} connected to Discord!')
-        logger.info(f'Monitoring {len(self.guilds)} guilds:')
+        """Bot ready event; also fires after a reconnect that could not resume."""
+        # One summary line instead of one line per guild
+        unavailable = sum(1 for guild in self.guilds if guild.unavailable)
+        members = sum(guild.member_count or 0 for guild in self.guilds)
+        logger.info(
+            f'Bot {self.user} connected to Discord: {len(self.guilds)} guilds '
+            f'({unavailable} unavailable, ~{members} members), shards {self.shard_count or 1}'
+        )
         
-        for guild in self.guilds:
-            logger.info(f'   - {guild.name} (ID: {guild.id})')
+        if self._ready_once:
+            return
+        self._ready_once = True
+        
+        self._mark_startup('gateway')
+        self.startup_timings['total'] = time.monotonic() - STARTED_AT
+        logger.info("Startup timings: " + ", ".join(
+            f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.startup_timings.items()
+        ))
         
         if self.text_improver:
             logger.info("OpenRouter AI text improvement enabled")
         else:
             logger.warning("AI text improvement disabled (no API key)")
         
-        # Set presence
-        await self.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.watching,
-                name=f"{self.target_emoji} reactions in all servers"
-            ),
-            status=discord.Status.online
-        )
-        
         logger.info("Bot ready and monitoring ALL servers!")
     
-    def _check_rate_limit(self, user_id: int) -> bool:
-        """Check if user is rate limited."""
-        now = time.time()
-        user_actions = self.rate_limits[user_id]
-        
-        # Remove old actions outside the window
-        while user_actions and now - user_actions[0] > self.rate_limit_window:
-            user_actions.popleft()
-        
-        # Check if user exceeded limit
-        if len(user_actions) >= self.rate_limit_max:
+    async def _check_rate_limit(self, user_id: int, guild_id: int, channel_id: int,
+                                user_limit: Optional[GCRALimit] = None) -> bool:
+        """Check if a reaction is rate limited."""
+        tier = await self.rate_limiter.hit(user_id, guild_id, channel_id, user_limit)
+        if tier is not None:
+            logger.debug(f"Reaction by user {user_id} limited by {tier} rate limit")
             return True
-        
-        # Add current action
-        user_actions.append(now)
         return False
     
-    async def on_reaction_add(self, reaction, user):
-        """Handle reaction events - works in ALL servers."""
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """Handle reaction events - works in ALL servers, cached message or not."""
+        received_at = time.time()
+        if self._shutting_down:
+            return
         try:
-            # Skip bot reactions
-            if user.bot:
-                return
-            
-            # Check if it's the target emoji
-            if str(reaction.emoji) != self.target_emoji:
+            # Check if it's the target emoji before doing any other work
+            settings = self.guild_config.for_guild(payload.guild_id)
+            if not settings.emoji.matches(payload.emoji):
                 return
             
             # Skip DMs
-            if not reaction.message.guild:
+            if payload.guild_id is None:
                 logger.debug("Reaction in DM, ignoring")
                 return
             
+            # Skip bot reactions
+            user = payload.member
+            if user is None or user.bot:
+                return
+            
+            self.reactions_counter.inc()
+            
+            # A later flag on an open incident costs one debounced edit, so it skips the rate limiter
+            incident = self.incident_index.get(payload.message_id) if self.incident_index else None
+            if incident is not None:
+                self._join_incident(incident, user.id, received_at)
+                return
+            
             # Rate limiting
-            if self._check_rate_limit(user.id):
+            with self.spans.span('reaction.rate_limit'):
+                limited = await self._check_rate_limit(
+                    user.id, payload.guild_id, payload.channel_id, settings.user_limit
+                )
+            if limited:
+                self.rate_limited_counter.inc()
                 logger.debug(f"Rate limited user {user.name}")
                 return
             
-            message = reaction.message
+            # Open the incident before fetching so flags arriving meanwhile join it
+            if self.incident_index:
+                incident = self.incident_index.open(
+                    uuid.uuid4().hex[:12], payload.message_id, payload.guild_id, payload.channel_id,
+                    user.id, received_at
+                )
             
-            # Log the reaction
-            logger.info(f"Poop reaction by {user.name} in guild: {message.guild.name} (ID: {message.guild.id})")
-            
-            # Handle the incident
-            await self._handle_incident(reaction, user)
+            # Shutdown waits for accepted flags to be posted
+            self._incidents_in_flight += 1
+            try:
+                with self.spans.span('reaction.fetch'):
+                    message = await self.message_cache.get_or_fetch(
+                        payload.message_id,
+                        lambda: self._fetch_snapshot(payload.guild_id, payload.channel_id, payload.message_id)
+                    )
+                if message is None:
+                    if incident:
+                        self.incident_index.discard(payload.message_id)
+                    return
+                
+                # Log the reaction
+                logger.info(
+                    "Poop reaction by %s in guild: %s (ID: %s)", user.name, message.guild_name, message.guild_id,
+                    extra={'sample': True, 'guild_id': message.guild_id, 'message_id': message.id, 'user_id': user.id}
+                )
+                
+                # Handle the incident
+                with self.spans.span('reaction.incident'):
+                    await self._handle_incident(message, user, received_at, incident)
+            finally:
+                self._incidents_in_flight -= 1
             
         except Exception as e:
-            logger.error(f"Error in on_reaction_add: {e}")
+            logger.error(f"Error in on_raw_reaction_add: {e}")
     
-    async def _handle_incident(self, reaction, user):
-        """Handle flagged content incident."""
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        """Withdraw a flag from its open incident when the reaction is removed."""
+        if not self.incident_index or payload.guild_id is None:
+            return
+        if not self.guild_config.for_guild(payload.guild_id).emoji.matches(payload.emoji):
+            return
+        if self.incident_index.remove_flagger(payload.message_id, payload.user_id):
+            logger.debug(f"Flag by user {payload.user_id} withdrawn from message {payload.message_id}")
+    
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """Drop stale snapshots when a message is edited."""
+        self.message_cache.invalidate(payload.message_id)
+    
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Drop snapshots and the open incident of deleted messages."""
+        self.message_cache.invalidate(payload.message_id)
+        if self.incident_index:
+            self.incident_index.discard(payload.message_id)
+    
+    def _join_incident(self, incident: OpenIncident, user_id: int, flagged_at: float):
+        """Merge a repeat flag into an open incident."""
+        if not self.incident_index.add_flagger(incident, user_id, flagged_at):
+            return
+        self.merged_flags_counter.inc()
+        # Until the message is fetched, _handle_incident records every flagger itself
+        if incident.snapshot:
+            self._record_flag(incident.snapshot, incident.incident_id, user_id, flagged_at)
+    
+    def _record_flag(self, message: MessageSnapshot, incident_id: str, flagger_id: int, flagged_at: float):
+        """Add one flag to the incident store."""
+        if self.incident_store:
+            self.incident_store.record(IncidentRecord(
+                incident_id=incident_id,
+                guild_id=message.guild_id,
+                channel_id=message.channel_id,
+                message_id=message.id,
+                author_id=message.author_id,
+                flagger_id=flagger_id,
+                created_at=flagged_at,
+                content=message.content
+            ))
+    
+    async def _render_incident(self, incident: OpenIncident):
+        """Aggregator callback: edit the flagged message to show the current flaggers."""
+        if incident.snapshot is None or incident.flagged_message_id is None:
+            return
+        channel = self._get_messageable(incident.channel_id, incident.guild_id)
+        async with self._edit_lock(incident.flagged_message_id):
+            # Built once the lock is held, so an AI result published meanwhile is kept
+            embeds = [self._build_flagged_embed(incident.snapshot, list(incident.flaggers), incident.content)]
+            embeds.extend(discord.Embed.from_dict(embed) for embed in incident.extra_embeds)
+            start_time = time.perf_counter()
+            await channel.get_partial_message(incident.flagged_message_id).edit(embeds=embeds)
+            self.discord_send_latency.observe(time.perf_counter() - start_time, op='edit')
+            self.render_stats['edits'] += 1
+    
+    def _edit_lock(self, flagged_message_id: int) -> asyncio.Lock:
+        """The lock serialising edits of one flagged message; it lives while anyone holds it."""
+        lock = self._edit_locks.get(flagged_message_id)
+        if lock is None:
+            lock = self._edit_locks[flagged_message_id] = asyncio.Lock()
+        return lock
+    
+    def _get_messageable(self, channel_id: int, guild_id: Optional[int] = None):
+        """Return a cached channel, or a partial one that needs no cache."""
+        return self.get_channel(channel_id) or self.get_partial_messageable(channel_id, guild_id=guild_id)
+    
+    async def _fetch_snapshot(self, guild_id: int, channel_id: int, message_id: int) -> Optional[MessageSnapshot]:
+        """Fetch a message over REST and keep only what the incident needs."""
+        guild = self.get_guild(guild_id)
+        guild_name = guild.name if guild else str(guild_id)
+        message = await self._get_messageable(channel_id, guild_id).fetch_message(message_id)
+        return MessageSnapshot.from_message(message, guild_id, guild_name)
+    
+    async def _handle_incident(self, message: MessageSnapshot, user, received_at: Optional[float] = None,
+                               incident: Optional[OpenIncident] = None):
+        """Handle flagged content incident.
+        
+        With an open incident, everyone who flagged the message so far is
+        shown and recorded, and later flags are merged into the posted embed.
+        """
         try:
-            message = reaction.message
-            
-            # Create the flagged content embed
-            embed = discord.Embed(
-                title="💩 Content Flagged",
-                color=0xFF6B35,
-                timestamp=datetime.now(timezone.utc)
-            )
+            incident_id = incident.incident_id if incident else uuid.uuid4().hex[:12]
+            log_context = {'incident_id': incident_id, 'guild_id': message.guild_id, 'message_id': message.id}
+            self.render_stats['incidents'] += 1
+            self.incidents_counter.inc()
+            received_at = received_at or time.time()
             
             # Add message content
+            max_length = self.guild_config.for_guild(message.guild_id).max_content_length
             content = message.content or "*No text content*"
-            if len(content) > 1000:
-                content = content[:997] + "..."
+            if len(content) > max_length:
+                content = content[:max_length - 3] + "..."
             
-            embed.add_field(
-                name="📝 Original Message",
-                value=f"```{content}```",
-                inline=False
-            )
+            flaggers = incident.flaggers if incident else {user.id: received_at}
+            with self.spans.span('incident.record'):
+                for flagger_id, flagged_at in flaggers.items():
+                    self._record_flag(message, incident_id, flagger_id, flagged_at)
+            if incident:
+                # Flags from here on are recorded as they are merged
+                incident.snapshot = message
+                incident.content = content
             
-            embed.add_field(
-                name="👤 Author",
-                value=f"{message.author.mention}",
-                inline=True
-            )
+            with self.spans.span('incident.embed'):
+                embed = self._build_flagged_embed(message, list(flaggers), content)
+            has_text = content != "*No text content*"
+            single_message = self.render_mode == 'single'
             
-            embed.add_field(
-                name="😡 Flagged by",
-                value=f"{user.mention}",
-                inline=True
-            )
+            # The model gets the whole message; the improver trims it to its token budget at a sentence end
+            text = message.content if has_text else content
             
-            embed.add_field(
-                name="📍 Server",
-                value=f"{message.guild.name}",
-                inline=True
+            # The pre-filter settles trivial and maskable flags; only escalated ones reach the model
+            with self.spans.span('incident.prefilter'):
+                verdict = self.prefilter.check(text) if has_text and self.prefilter else None
+            local_text = verdict.text if verdict and verdict.decision == LOCAL else None
+            wants_ai = (
+                self.text_improver is not None and has_text
+                and (verdict is None or verdict.decision == ESCALATE)
             )
+            if wants_ai and not self.text_improver.get_cached(text):
+                if not self.text_improver.available:
+                    # Upstream is failing: post the flag alone instead of queueing a doomed request
+                    wants_ai = False
+                    self.ai_skipped_counter.inc()
+                elif self.token_budget.exhausted(message.guild_id):
+                    # Today's tokens are spent: mask listed words locally if there are any
+                    wants_ai = False
+                    self.ai_budget_counter.inc()
+                    self.token_budget.record_refusal()
+                    local_text = self.prefilter.mask(content) if self.prefilter else None
             
-            embed.add_field(
-                name="🔗 Jump to Message",
-                value=f"[Click here]({message.jump_url})",
-                inline=False
+            # A cached improvement or local rewrite can go out in the same message as the flag
+            cached = self.text_improver.get_cached(text) if wants_ai and single_message else None
+            if local_text and single_message:
+                embeds = [embed, self._build_improvement_embed(local_text, local=True)]
+            elif cached:
+                embeds = [embed, self._build_improvement_embed(cached)]
+            else:
+                embeds = [embed]
+            
+            # Send the flagged content embed through the channel's send queue
+            summary = (
+                f"{message.author_mention} flagged by {user.mention}: "
+                f"{self._shorten(content)} ([jump]({message.jump_url}))"
             )
+            with self.spans.span('incident.send'):
+                flagged_message = await self.send_scheduler.send(
+                    message.channel_id, message.guild_id, embeds, summary
+                )
+            if flagged_message:
+                if incident:
+                    self.incident_index.posted(incident, flagged_message.id, [e.to_dict() for e in embeds[1:]])
+                self.reaction_to_flag.observe(time.time() - received_at)
+                logger.info("Flagged content logged in %s", message.guild_name, extra=dict(log_context, sample=True))
             
-            embed.set_footer(text=f"Message ID: {message.id}")
+            if local_text and not single_message:
+                await self.send_scheduler.send(
+                    message.channel_id, message.guild_id,
+                    [self._build_improvement_embed(local_text, local=True)], summary
+                )
             
-            # Send the flagged content embed
+            # Queue AI improvement so the reaction path never waits on the API
+            if wants_ai and not cached:
+                job = ImprovementJob(
+                    guild_id=message.guild_id,
+                    channel_id=message.channel_id,
+                    message_id=message.id,
+                    content=text,
+                    incident_id=incident_id,
+                    reaction_at=received_at
+                )
+                if single_message and flagged_message:
+                    job.flagged_message_id = flagged_message.id
+                    job.flagged_embed = embed.to_dict()
+                if self.improvement_queue.submit(job):
+                    logger.debug("Queued AI text improvement", extra=log_context)
+            
+        except Exception as e:
+            logger.error(f"Error handling incident: {e}", extra={'message_id': message.id})
+    
+    def _build_flagged_embed(self, message: MessageSnapshot, flaggers: List[int], content: str) -> discord.Embed:
+        """Build the flagged content embed for the users who flagged it, in flag order."""
+        embed = discord.Embed(
+            title="💩 Content Flagged" + (f" ×{len(flaggers)}" if len(flaggers) > 1 else ""),
+            color=0xFF6B35,
+            timestamp=datetime.now(timezone.utc)
+        )
+        
+        embed.add_field(
+            name="📝 Original Message",
+            value=f"```{content}```",
+            inline=False
+        )
+        
+        embed.add_field(
+            name="👤 Author",
+            value=f"{message.author_mention}",
+            inline=True
+        )
+        
+        listed = " ".join(f"<@{flagger_id}>" for flagger_id in flaggers[:self.max_listed_flaggers])
+        if len(flaggers) > self.max_listed_flaggers:
+            listed += f" and {len(flaggers) - self.max_listed_flaggers} more"
+        embed.add_field(
+            name="😡 Flagged by" + (f" ({len(flaggers)})" if len(flaggers) > 1 else ""),
+            value=listed or "*All flags withdrawn*",
+            inline=True
+        )
+        
+        embed.add_field(
+            name="📍 Server",
+            value=f"{message.guild_name}",
+            inline=True
+        )
+        
+        embed.add_field(
+            name="🔗 Jump to Message",
+            value=f"[Click here]({message.jump_url})",
+            inline=False
+        )
+        
+        embed.set_footer(text=f"Message ID: {message.id}")
+        return embed
+    
+    async def _process_improvement(self, job: ImprovementJob):
+        """Worker handler: request the AI improvement and post the result."""
+        channel = self._get_messageable(job.channel_id, job.guild_id)
+        
+        if not self.text_improver.available and self.text_improver.get_cached(job.content) is None:
+            self.ai_skipped_counter.inc()
+            logger.debug("AI backend unavailable, skipping AI embed", extra=self._job_log_context(job))
+            return
+        
+        if self.token_budget.exhausted(job.guild_id) and self.text_improver.get_cached(job.content) is None:
+            # The budget ran out while this job was queued
+            self.ai_budget_counter.inc()
+            self.token_budget.record_refusal()
+            logger.debug("Daily AI token budget used, skipping AI embed", extra=self._job_log_context(job))
+            return
+        
+        if self.text_improver.streaming_enabled and self.text_improver.get_cached(job.content) is None:
+            await self._stream_improvement(channel, job)
+            return
+        
+        logger.debug("Requesting AI text improvement...")
+        weight = self.guild_config.for_guild(job.guild_id).ai_weight
+        improved_text = await self.text_improver.improve_text(job.content, job.guild_id, weight)
+        
+        if improved_text:
             try:
-                await message.channel.send(embed=embed)
-                logger.info(f"Flagged content logged in {message.guild.name}")
+                await self._publish_ai_embed(channel, job, self._build_improvement_embed(improved_text))
+                self._record_ai_posted(job)
+                logger.info("AI improvement sent", extra=self._job_log_context(job, sample=True))
             except Exception as e:
-                logger.error(f"Failed to send flagged embed: {e}")
-            
-            # Try to get AI improvement
-            if self.text_improver and content != "*No text content*":
-                logger.debug("Requesting AI text improvement...")
-                improved_text = await self.text_improver.improve_text(content)
-                
-                if improved_text:
-                    # Send AI improvement
-                    improvement_embed = discord.Embed(
-                        title="🤖 AI-Improved Version",
-                        description="Here's how this message could be improved:",
-                        color=0x00D4AA,
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    
-                    improvement_embed.add_field(
-                        name="✨ Suggested Improvement",
-                        value=f"```{improved_text}```",
-                        inline=False
-                    )
-                    
-                    improvement_embed.set_footer(text="Powered by OpenRouter AI • Use as guidance only")
-                    
-                    try:
-                        await message.channel.send(embed=improvement_embed)
-                        logger.info("AI improvement sent")
-                    except Exception as e:
-                        logger.error(f"Failed to send AI improvement: {e}")
-                else:
-                    # Send error message
-                    error_embed = discord.Embed(
-                        title="🤖 AI Improvement",
-                        description="❌ Could not generate improved text for this message.",
-                        color=0xFF4444
+                logger.error(f"Failed to send AI improvement: {e}")
+        else:
+            self.ai_failures_counter.inc()
+            if not self.text_improver.available:
+                # The breaker opened while this job waited; one error per incident is just noise
+                logger.debug("AI backend unavailable, skipping AI error embed", extra=self._job_log_context(job))
+                return
+            try:
+                await self._publish_ai_embed(channel, job, self._build_ai_error_embed())
+            except Exception as e:
+                logger.error(f"Failed to send AI error: {e}")
+    
+    def _record_ai_posted(self, job: ImprovementJob):
+        if job.reaction_at:
+            self.reaction_to_ai.observe(time.time() - job.reaction_at)
+    
+    @staticmethod
+    def _job_log_context(job: ImprovementJob, **extra) -> dict:
+        """Structured log fields for an AI job."""
+        return dict(
+            incident_id=job.incident_id,
+            guild_id=job.guild_id,
+            message_id=job.message_id,
+            **extra
+        )
+    
+    async def _publish_ai_embed(self, channel, job: ImprovementJob, embed: discord.Embed, ai_message=None):
+        """Post or update the AI embed and return the message that carries it."""
+        job.published = True
+        if job.flagged_message_id and job.flagged_embed:
+            # Single-message mode: the AI embed sits under the flagged embed
+            target = ai_message or channel.get_partial_message(job.flagged_message_id)
+            async with self._edit_lock(job.flagged_message_id):
+                flagged_embed = discord.Embed.from_dict(job.flagged_embed)
+                incident = self.incident_index.get(job.message_id) if self.incident_index else None
+                if incident and incident.incident_id == job.incident_id and incident.snapshot:
+                    # Show the current flaggers, and keep the AI embed in later flagger edits
+                    flagged_embed = self._build_flagged_embed(
+                        incident.snapshot, list(incident.flaggers), incident.content
                     )
-                    try:
-                        await message.channel.send(embed=error_embed)
-                    except Exception as e:
-                        logger.error(f"Failed to send AI error: {e}")
+                    incident.extra_embeds = [embed.to_dict()]
+                start_time = time.perf_counter()
+                await target.edit(embeds=[flagged_embed, embed])
+                self.discord_send_latency.observe(time.perf_counter() - start_time, op='edit')
+                self.render_stats['edits'] += 1
+            return target
+        
+        if ai_message:
+            start_time = time.perf_counter()
+            await ai_message.edit(embed=embed)
+            self.discord_send_latency.observe(time.perf_counter() - start_time, op='edit')
+            self.render_stats['edits'] += 1
+            return ai_message
+        
+        jump_url = f"https://discord.com/channels/{job.guild_id}/{job.channel_id}/{job.message_id}"
+        detail = embed.fields[0].value.strip('`') if embed.fields else embed.description
+        summary = f"🤖 [Message]({jump_url}): {self._shorten(detail or '')}"
+        return await self.send_scheduler.send(job.channel_id, job.guild_id, [embed], summary)
+    
+    async def _send_embeds(self, channel_id: int, guild_id: int, embeds: List[discord.Embed]):
+        """Scheduler send callback: one REST call to post embeds in a channel."""
+        start_time = time.perf_counter()
+        message = await self._get_messageable(channel_id, guild_id).send(embeds=embeds)
+        self.discord_send_latency.observe(time.perf_counter() - start_time, op='send')
+        self.render_stats['sends'] += 1
+        return message
+    
+    def _build_digest_embed(self, summaries: List[str], overflow: int) -> discord.Embed:
+        """Build one embed that stands in for a backlog of queued messages."""
+        embed = discord.Embed(
+            title=f"💩 {len(summaries) + overflow} Incidents (digest)",
+            description="\n".join(f"• {summary}" for summary in summaries)[:4000],
+            color=0xFF6B35,
+            timestamp=datetime.now(timezone.utc)
+        )
+        if overflow:
+            embed.set_footer(text=f"{overflow} older items were dropped")
+        return embed
+    
+    def _build_history_embed(self, user: discord.abc.User, role: str, records: List[IncidentRecord],
+                             total: int, page: int) -> discord.Embed:
+        """Build one page of a user's incident history."""
+        embed = discord.Embed(
+            title=f"📜 {'Flagged messages' if role == 'author' else 'Flags given'}: {user.display_name}",
+            color=0xFF6B35
+        )
+        lines = []
+        for record in records:
+            other = f"by <@{record.flagger_id}>" if role == 'author' else f"on <@{record.author_id}>"
+            url = f"https://discord.com/channels/{record.guild_id}/{record.channel_id}/{record.message_id}"
+            line = f"<t:{int(record.created_at)}:R> {other} ([jump]({url}))"
+            if record.content:
+                line += f"\n> {self._shorten(record.content)}"
+            lines.append(line)
+        embed.description = "\n".join(lines) or "No incidents recorded."
+        embed.set_footer(text=f"Page {page} · {total} total")
+        return embed
+    
+    @staticmethod
+    def _truncate(text: str, limit: int = MAX_EMBED_CONTENT) -> str:
+        """Cut text to fit a code-block embed field."""
+        return text if len(text) <= limit else text[:limit - 3] + "..."
+    
+    @staticmethod
+    def _shorten(text: str, limit: int = 80) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= limit else text[:limit - 3] + "..."
+    
+    async def _stream_improvement(self, channel, job: ImprovementJob):
+        """Stream the AI improvement into one embed, editing it in throttled steps."""
+        improver = self.text_improver
+        start_time = time.perf_counter()
+        
+        # Nothing is shown until text arrives: the flagged message is edited in
+        # single-message mode, and the AI message is posted in separate mode
+        ai_message = None
+        can_edit = True
+        
+        text = ""
+        shown = ""
+        last_edit = time.monotonic()
+        aborted = False
+        
+        weight = self.guild_config.for_guild(job.guild_id).ai_weight
+        async for delta in improver.stream_improvement(job.content, job.guild_id, weight):
+            text += delta
+            
+            # Runaway generations will not fit the embed and are not worth waiting for
+            if len(text) > improver.stream_max_chars:
+                logger.warning(f"Cancelled AI stream for message {job.message_id} after {len(text)} characters")
+                self.streaming_stats['cancelled'] += 1
+                aborted = True
+                break
             
+            # Stay well inside Discord's message edit rate limit
+            now = time.monotonic()
+            if not can_edit or now - last_edit < improver.stream_edit_interval:
+                continue
+            
+            partial = improver.clean_completion(text)
+            if not partial or partial == shown:
+                continue
+            try:
+                ai_message = await self._publish_ai_embed(
+                    channel, job, self._build_improvement_embed(partial, in_progress=True), ai_message
+                )
+            except Exception as e:
+                logger.error(f"Failed to update AI improvement: {e}")
+            # A post merged into a digest cannot be edited, so only the final result follows
+            if not job.flagged_message_id and ai_message is None:
+                can_edit = False
+            if not shown:
+                self._record_first_visible(start_time)
+            shown = partial
+            last_edit = time.monotonic()
+        
+        improved_text = improver.clean_completion(text)
+        try:
+            if improved_text and not aborted:
+                await self._publish_ai_embed(channel, job, self._build_improvement_embed(improved_text), ai_message)
+                self._record_ai_posted(job)
+                if not shown:
+                    self._record_first_visible(start_time)
+                improver.remember(job.content, improved_text)
+                logger.info("AI improvement streamed", extra=self._job_log_context(job, sample=True))
+            else:
+                self.ai_failures_counter.inc()
+                if not shown and not improver.available:
+                    # As in _process_improvement: with the breaker open, one error per incident is just noise
+                    logger.debug("AI backend unavailable, skipping AI error embed", extra=self._job_log_context(job))
+                    return
+                # Replaces the partial result, if one is showing
+                await self._publish_ai_embed(channel, job, self._build_ai_error_embed(), ai_message)
         except Exception as e:
-            logger.error(f"Error handling incident: {e}")
+            logger.error(f"Failed to finish AI improvement: {e}")
+    
+    def _record_first_visible(self, start_time: float):
+        self.streaming_stats['streams'] += 1
+        self.streaming_stats['first_visible_total'] += time.perf_counter() - start_time
+    
+    def _build_improvement_embed(self, improved_text: str, in_progress: bool = False,
+                                 local: bool = False) -> discord.Embed:
+        """Build the AI-improved (or locally masked) version embed."""
+        improvement_embed = discord.Embed(
+            title="🧹 Cleaned-Up Version" if local else "🤖 AI-Improved Version",
+            description="Generating a suggestion..." if in_progress else "Here's how this message could be improved:",
+            color=0x00D4AA,
+            timestamp=datetime.now(timezone.utc)
+        )
+        
+        improvement_embed.add_field(
+            name="✨ Suggested Improvement",
+            value=f"```{self._truncate(improved_text) or '...'}```",
+            inline=False
+        )
+        
+        improvement_embed.set_footer(
+            text="Listed words masked automatically" if local else "Powered by OpenRouter AI • Use as guidance only"
+        )
+        return improvement_embed
+    
+    def _build_ai_error_embed(self) -> discord.Embed:
+        """Build the embed shown when no improvement could be generated."""
+        return discord.Embed(
+            title="🤖 AI Improvement",
+            description="❌ Could not generate improved text for this message.",
+            color=0xFF4444
+        )
     
     @commands.command(name='help')
     async def help_command(self, ctx):
@@ -301,13 +1721,19 @@ class ShitTrackerBot(commands.Bot):
             name="📋 Commands",
             value="`!st help` - Show this help\n"
                   "`!st ping` - Check bot status\n"
-                  "`!st improve <text>` - Test AI text improvement",
+                  "`!st stats` - Show performance statistics\n"
+                  "`!st history @user [author|flagger]` - Incidents for a user\n"
+                  "`!st top [days] [authors|flaggers] [page]` - Most flagged users\n"
+                  "`!st scan #channel [count|7d|YYYY-MM-DD]` - Process earlier flags in a channel\n"
+                  "`!st improve <text>` - Test AI text improvement (or attach a .txt/.jsonl file)\n"
+                  "`!st profile [seconds]` - Profile the event loop (bot owner only)",
             inline=False
         )
         
         embed.add_field(
             name="🎯 How it works",
-            value=f"React with {self.target_emoji} to any message to flag it for review.\n"
+            value=f"React with {self.guild_config.for_guild(ctx.guild and ctx.guild.id).emoji.display} "
+                  "to any message to flag it for review.\n"
                   "The bot will log the incident and provide an AI-improved version.",
             inline=False
         )
@@ -316,7 +1742,7 @@ class ShitTrackerBot(commands.Bot):
             name="⚙️ Configuration",
             value=f"• Works in: **All servers where bot is added**\n"
                   f"• AI Improvement: `{'Enabled' if self.text_improver else 'Disabled'}`\n"
-                  f"• Rate Limit: 5 reactions per minute per user",
+                  f"• Rate Limit: {self.rate_limiter.describe('user')}",
             inline=False
         )
         
@@ -361,21 +1787,347 @@ class ShitTrackerBot(commands.Bot):
             inline=True
         )
         
+        if self.text_improver:
+            queue_stats = self.improvement_queue.get_stats()
+            embed.add_field(
+                name="📥 AI Queue",
+                value=f"{queue_stats['depth']}/{queue_stats['capacity']} queued, "
+                      f"avg wait {queue_stats['wait_avg'] * 1000:.0f}ms",
+                inline=True
+            )
+        
         await message.edit(content=None, embed=embed)
     
+    @commands.command(name='stats')
+    async def stats(self, ctx):
+        """Show performance statistics."""
+        embed = discord.Embed(
+            title="📊 Bot Statistics",
+            color=0x3498DB
+        )
+        
+        embed.add_field(
+            name="🔢 Counters",
+            value=f"Reactions: {self.reactions_counter.total():.0f}\n"
+                  f"Rate limited: {self.rate_limited_counter.total():.0f}\n"
+                  f"Incidents: {self.incidents_counter.total():.0f}\n"
+                  f"Merged flags: {self.merged_flags_counter.total():.0f}\n"
+                  f"AI failures: {self.ai_failures_counter.total():.0f}"
+                  + (f"\nLoop stalls: {self.loop_watchdog.stats['stalls']}" if self.loop_watchdog else ""),
+            inline=True
+        )
+        
+        latencies = []
+        for label, histogram in (
+            ("Reaction → flag", self.reaction_to_flag),
+            ("Reaction → AI", self.reaction_to_ai),
+            ("OpenRouter", self.metrics.histogram('st_openrouter_request_seconds')),
+            ("Discord send", self.discord_send_latency)
+        ):
+            p50 = histogram.percentile(0.5)
+            p95 = histogram.percentile(0.95)
+            if p50 is None:
+                latencies.append(f"{label}: no data")
+            else:
+                latencies.append(f"{label}: p50 ≤{p50 * 1000:.0f}ms, p95 ≤{p95 * 1000:.0f}ms")
+        
+        embed.add_field(
+            name="⏱️ Latency",
+            value="\n".join(latencies),
+            inline=False
+        )
+        
+        if self.text_improver:
+            queue_stats = self.improvement_queue.get_stats()
+            statuses = self.metrics.counter('st_openrouter_responses_total').values
+            limiter = self.text_improver.limiter
+            ai_stats = self.text_improver.stats
+            budget_left = self.token_budget.remaining(ctx.guild and ctx.guild.id)
+            embed.add_field(
+                name="🤖 AI",
+                value=f"Queue: {queue_stats['depth']}/{queue_stats['capacity']}\n"
+                      + (f"Concurrency: {limiter.limit:.1f} ({limiter.in_flight} in flight, {limiter.waiting} waiting)\n"
+                         if limiter else "")
+                      + f"Tokens: {ai_stats['prompt_tokens']} in, {ai_stats['completion_tokens']} out"
+                      + (f" ({budget_left} left today here)" if budget_left is not None else "") + "\n"
+                      + "Responses: " + (", ".join(f"{dict(key)['status']}={value:.0f}" for key, value in statuses.items()) or "none"),
+                inline=True
+            )
+        
+        if self.prefilter:
+            prefilter_stats = self.prefilter.get_stats()
+            decisions = prefilter_stats['decisions']
+            embed.add_field(
+                name="🧹 Pre-filter",
+                value=f"Skipped: {decisions['skip']}\n"
+                      f"Masked locally: {decisions['local']}\n"
+                      f"Sent to AI: {decisions['escalate']}\n"
+                      f"Avg time: {prefilter_stats['time_avg'] * 1e6:.0f}µs",
+                inline=True
+            )
+        
+        if self.shared_state.shared:
+            try:
+                totals = await self.shared_state.get_counters()
+            except Exception as e:
+                logger.error(f"Could not read cluster counters: {e}")
+                totals = None
+            if totals is not None:
+                def cluster_total(name: str) -> float:
+                    return sum(value for series, value in totals.items() if series.split('{', 1)[0] == name)
+                
+                embed.add_field(
+                    name="🌐 Cluster",
+                    value=f"Reactions: {cluster_total(self.reactions_counter.name):.0f}\n"
+                          f"Rate limited: {cluster_total(self.rate_limited_counter.name):.0f}\n"
+                          f"Incidents: {cluster_total(self.incidents_counter.name):.0f}\n"
+                          f"AI failures: {cluster_total(self.ai_failures_counter.name):.0f}",
+                    inline=True
+                )
+        
+        shard_ids = sorted(self.shards) if isinstance(self, commands.AutoShardedBot) else [self.shard_id or 0]
+        embed.set_footer(
+            text=f"Cluster {self.cluster_id} · shards {', '.join(map(str, shard_ids))}/{self.shard_count or 1} · "
+                 "Latencies are bucketed upper bounds"
+        )
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='profile')
+    @commands.is_owner()
+    async def profile(self, ctx, seconds: float = 10):
+        """Sample the event loop for a while and reply with the report (bot owner only)."""
+        max_seconds = self.profiling_config.get('max_seconds', 120)
+        if not 0 < seconds <= max_seconds:
+            await ctx.send(f"❌ Profile for 1-{max_seconds:g} seconds")
+            return
+        if self._profiling:
+            await ctx.send("❌ A profile is already running")
+            return
+        
+        await ctx.send(f"🔬 Profiling the event loop for {seconds:g}s...")
+        report, report_path, collapsed_path = await self._run_profile(seconds)
+        top = "\n".join(f"{n:>6}  {frame}" for frame, n in report.busy_top(8))
+        await ctx.send(
+            f"🔬 {report.samples} samples, {report.samples - report.idle} with the loop busy. "
+            f"Top functions:\n```{self._truncate(top, 1800)}```",
+            files=[discord.File(report_path), discord.File(collapsed_path)]
+        )
+    
+    async def _run_profile(self, seconds: float) -> Tuple[ProfileReport, str, str]:
+        """Profile the event loop and write the report files under profiling.dir."""
+        self._profiling = True
+        try:
+            report = await profile_event_loop(seconds, self.profiling_config.get('sample_interval', 0.005), self.spans)
+        finally:
+            self._profiling = False
+        name = datetime.now().strftime('profile-%Y%m%d-%H%M%S') + (f'-{self.cluster_id}' if self.cluster_id else '')
+        report_path, collapsed_path = await asyncio.to_thread(
+            report.write, self.profiling_config.get('dir', 'profiles'), name
+        )
+        logger.info(f"Event loop profile written to {report_path} and {collapsed_path}")
+        return report, report_path, collapsed_path
+    
+    @commands.command(name='history')
+    async def history(self, ctx, user: discord.User, role: str = 'author'):
+        """Show a user's incidents in this server, newest first."""
+        if not self.incident_store or not self.incident_store.is_open:
+            await ctx.send("❌ The incident store is not enabled")
+            return
+        if ctx.guild is None:
+            await ctx.send("❌ This command only works in a server")
+            return
+        role = role.lower().rstrip('s')
+        if role not in IncidentStore.ROLES:
+            await ctx.send("❌ Role must be `author` or `flagger`")
+            return
+        
+        try:
+            total = await self.incident_store.count(ctx.guild.id, user.id, role)
+            view = IncidentHistoryView(self, ctx.author.id, ctx.guild.id, user, role, total, self.history_page_size)
+            embed = await view.load()
+        except Exception as e:
+            logger.error(f"History query failed: {e}")
+            await ctx.send("❌ Could not read incident history")
+            return
+        await ctx.send(embed=embed, view=view)
+    
+    @commands.command(name='top')
+    async def top(self, ctx, days: float = 7, role: str = 'authors', page: int = 1):
+        """Show the most flagged authors (or most active flaggers) in this server."""
+        if not self.incident_store or not self.incident_store.is_open:
+            await ctx.send("❌ The incident store is not enabled")
+            return
+        if ctx.guild is None:
+            await ctx.send("❌ This command only works in a server")
+            return
+        role = role.lower().rstrip('s')
+        if role not in IncidentStore.ROLES:
+            await ctx.send("❌ Choose `authors` or `flaggers`")
+            return
+        page = max(1, page)
+        
+        try:
+            rows = await self.incident_store.top(
+                ctx.guild.id, time.time() - days * 86400, role,
+                limit=self.history_page_size, offset=(page - 1) * self.history_page_size
+            )
+        except Exception as e:
+            logger.error(f"Top query failed: {e}")
+            await ctx.send("❌ Could not read incident statistics")
+            return
+        
+        start = (page - 1) * self.history_page_size
+        embed = discord.Embed(
+            title=f"🏆 Most {'flagged users' if role == 'author' else 'active flaggers'} · last {days:g} days",
+            description="\n".join(
+                f"**{start + i}.** <@{user_id}> — {count}" for i, (user_id, count) in enumerate(rows, 1)
+            ) or "No incidents recorded.",
+            color=0xFF6B35
+        )
+        embed.set_footer(text=f"Page {page}")
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='scan')
+    @commands.has_permissions(manage_messages=True)
+    async def scan(self, ctx, channel: discord.TextChannel, bound: Optional[str] = None):
+        """Process target-emoji reactions left in a channel's history, e.g. while the bot was offline.
+        
+        The bound is a message count, a duration (7d, 12h) or a date. Without
+        one, an interrupted scan of the channel resumes from its checkpoint.
+        """
+        if not self.incident_store or not self.incident_store.is_open:
+            await ctx.send("❌ The incident store is not enabled")
+            return
+        if ctx.guild is None or channel.guild.id != ctx.guild.id:
+            await ctx.send("❌ Choose a channel in this server")
+            return
+        if channel.id in self._active_scans:
+            await ctx.send(f"❌ {channel.mention} is already being scanned")
+            return
+        try:
+            limit, since = parse_scan_bound(bound)
+        except ValueError as e:
+            await ctx.send(f"❌ {e}")
+            return
+        
+        checkpoint = None if bound else await self.incident_store.load_checkpoint(channel.id)
+        resumed = checkpoint is not None
+        if checkpoint is None:
+            checkpoint = ScanCheckpoint(
+                channel.id, ctx.guild.id,
+                after_id=discord.utils.time_snowflake(since, high=True) if since else None,
+                limit=limit or self.scan_config.get('default_limit', 10000)
+            )
+        
+        self._active_scans.add(channel.id)
+        try:
+            progress_message = await ctx.send(self._scan_progress_text(channel, checkpoint, resumed))
+            
+            async def report(cp: ScanCheckpoint):
+                try:
+                    await progress_message.edit(content=self._scan_progress_text(channel, cp, resumed))
+                except discord.HTTPException as e:
+                    logger.warning(f"Could not update scan progress: {e}")
+            
+            scan = ChannelScan(
+                channel, checkpoint, self._scan_is_flagged,
+                lambda batch: self._scan_filter(ctx.guild.id, batch), self._scan_message,
+                self.incident_store.save_checkpoint, report,
+                concurrency=self.scan_config.get('concurrency', 4),
+                batch_size=self.scan_config.get('batch_size', 50),
+                checkpoint_interval=self.scan_config.get('checkpoint_interval', 10),
+                progress_interval=self.scan_config.get('progress_interval', 5)
+            )
+            logger.info(f"Scanning channel {channel.id} in guild {ctx.guild.id}"
+                        f"{' (resumed)' if resumed else ''}, requested by {ctx.author.id}")
+            await scan.run()
+        except discord.Forbidden:
+            await ctx.send(f"❌ I can't read the message history of {channel.mention}")
+        except Exception as e:
+            logger.error(f"Scan of channel {channel.id} failed: {e}")
+            await ctx.send(f"❌ The scan of {channel.mention} stopped; run `!st scan` again to resume it")
+        finally:
+            self._active_scans.discard(channel.id)
+    
+    @staticmethod
+    def _scan_progress_text(channel, cp: ScanCheckpoint, resumed: bool) -> str:
+        elapsed = time.time() - cp.started_at
+        state = "✅ Scanned" if cp.done else "🔎 Scanning" + (" (resumed)" if resumed else "")
+        return (f"{state} {channel.mention}: {cp.scanned:,} messages checked, {cp.flagged:,} new incidents, "
+                f"{cp.skipped:,} already handled · {elapsed:.0f}s")
+    
+    @staticmethod
+    def _reaction_emoji(reaction: discord.Reaction):
+        """A reaction's emoji in the shape EmojiMatcher expects."""
+        return discord.PartialEmoji(name=reaction.emoji) if isinstance(reaction.emoji, str) else reaction.emoji
+    
+    def _scan_is_flagged(self, message: discord.Message) -> bool:
+        emoji = self.guild_config.for_guild(message.guild and message.guild.id).emoji
+        return any(emoji.matches(self._reaction_emoji(reaction)) for reaction in message.reactions)
+    
+    async def _scan_filter(self, guild_id: int, batch: List[discord.Message]) -> List[discord.Message]:
+        """Drop scanned messages that already have an incident."""
+        recorded = await self.incident_store.recorded_messages(guild_id, (message.id for message in batch))
+        return [
+            message for message in batch
+            if message.id not in recorded and not (self.incident_index and self.incident_index.get(message.id))
+        ]
+    
+    async def _scan_message(self, message: discord.Message) -> bool:
+        """Run one scanned message through the incident pipeline. Returns False if nobody real flagged it."""
+        emoji = self.guild_config.for_guild(message.guild.id).emoji
+        reaction = next((r for r in message.reactions if emoji.matches(self._reaction_emoji(r))), None)
+        if reaction is None:
+            return False
+        flaggers = [user async for user in reaction.users(limit=100) if not user.bot]
+        if not flaggers:
+            return False
+        
+        # Leave room in the AI queue for live flags
+        capacity = self.improvement_queue.get_stats()['capacity']
+        while capacity and self.improvement_queue.depth >= capacity // 2:
+            await asyncio.sleep(0.5)
+        
+        snapshot = MessageSnapshot.from_message(message, message.guild.id, message.guild.name)
+        incident = None
+        if self.incident_index:
+            incident = self.incident_index.open(
+                uuid.uuid4().hex[:12], message.id, message.guild.id, message.channel.id, flaggers[0].id
+            )
+            # When each reaction was added is unknown; the message time stands in for all of them
+            flagged_at = message.created_at.timestamp()
+            incident.flaggers = {user.id: flagged_at for user in flaggers}
+        await self._handle_incident(snapshot, flaggers[0], time.time(), incident)
+        return True
+    
     @commands.command(name='improve')
-    async def improve_text(self, ctx, *, text: str):
-        """Test AI text improvement."""
+    async def improve_text(self, ctx, *, text: Optional[str] = None):
+        """Test AI text improvement, or improve every line of an attached .txt/.jsonl file."""
         if not self.text_improver:
             await ctx.send("❌ AI text improvement is not available (no OpenRouter API key configured)")
             return
         
+        if ctx.message.attachments:
+            await self._improve_file(ctx, ctx.message.attachments[0])
+            return
+        if not text:
+            await ctx.send("❌ Give some text, or attach a .txt or .jsonl file")
+            return
+        
         if len(text) > 500:
             await ctx.send("❌ Text too long (max 500 characters)")
             return
         
+        guild_id = ctx.guild and ctx.guild.id
+        if self.token_budget.exhausted(guild_id) and self.text_improver.get_cached(text) is None:
+            self.token_budget.record_refusal()
+            await ctx.send("❌ This server has used its AI budget for today. Try again tomorrow.")
+            return
+        
         async with ctx.typing():
-            improved = await self.text_improver.improve_text(text)
+            improved = await self.text_improver.improve_text(
+                text, guild_id, self.guild_config.for_guild(guild_id).ai_weight
+            )
         
         if improved:
             embed = discord.Embed(
@@ -398,14 +2150,99 @@ class ShitTrackerBot(commands.Bot):
             await ctx.send(embed=embed)
         else:
             await ctx.send("❌ Failed to improve text. Please try again later.")
+    
+    async def _improve_file(self, ctx, attachment: discord.Attachment):
+        """Stream an attached file through the improver and reply with the improved file."""
+        fmt = os.path.splitext(attachment.filename)[1].lower()
+        if fmt not in BULK_FORMATS:
+            await ctx.send(f"❌ Attach a {' or '.join(BULK_FORMATS)} file")
+            return
+        max_bytes = self.improve_file_config.get('max_bytes', 1048576)
+        if attachment.size > max_bytes:
+            await ctx.send(f"❌ File too large (max {max_bytes // 1024} KB)")
+            return
+        guild_id = ctx.guild and ctx.guild.id
+        if guild_id in self._active_files:
+            await ctx.send("❌ A file is already being improved here; wait for it to finish")
+            return
+        
+        weight = self.guild_config.for_guild(guild_id).ai_weight
+        
+        async def improve(line: str) -> Optional[str]:
+            # Cached lines cost nothing, so they still go through once the budget is spent
+            if self.token_budget.exhausted(guild_id) and self.text_improver.get_cached(line) is None:
+                self.token_budget.record_refusal()
+                return None
+            return await self.text_improver.improve_text(line, guild_id, weight)
+        
+        bulk = BulkFileImprover.from_config(improve, self.improve_file_config)
+        self._active_files.add(guild_id)
+        try:
+            progress_message = await ctx.send(f"📝 Improving `{attachment.filename}`...")
+            
+            async def report(progress: BulkProgress):
+                try:
+                    await progress_message.edit(content=self._bulk_progress_text(attachment.filename, progress))
+                except discord.HTTPException as e:
+                    logger.warning(f"Could not update file progress: {e}")
+            
+            # The improved file is spooled to disk, the upload read a line at a time
+            with tempfile.TemporaryFile() as out:
+                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=30)) as session:
+                    async with session.get(attachment.url) as response:
+                        response.raise_for_status()
+                        progress = await bulk.run(response.content, fmt, out, report)
+                
+                out.seek(0)
+                await ctx.send(
+                    self._bulk_progress_text(attachment.filename, progress),
+                    file=discord.File(out, filename=f"improved_{attachment.filename}")
+                )
+            logger.info(f"Improved file with {progress.lines} lines for guild {guild_id}")
+        except (aiohttp.ClientError, ValueError) as e:
+            # ValueError: a line longer than the stream reader's buffer
+            logger.error(f"Could not read attachment {attachment.filename}: {e}")
+            await ctx.send("❌ Could not read that file")
+        except discord.HTTPException as e:
+            logger.error(f"Could not send improved file: {e}")
+        finally:
+            self._active_files.discard(guild_id)
+    
+    @staticmethod
+    def _bulk_progress_text(filename: str, progress: BulkProgress) -> str:
+        state = "✅ Improved" if progress.done else "📝 Improving"
+        text = f"{state} `{filename}`: {progress.lines:,} lines read, {progress.improved:,} improved"
+        if progress.unchanged:
+            text += f", {progress.unchanged:,} left unchanged"
+        if progress.done and progress.truncated:
+            text += f" (stopped at the {progress.lines:,} line limit)"
+        return text
 
-async def main():
-    """Main function."""
+class ShardedShitTrackerBot(ShitTrackerBot, commands.AutoShardedBot):
+    """ShitTrackerBot running several gateway shards in one process."""
+
+async def main(shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None, cluster_id: int = 0):
+    """Main function.
+    
+    With shard_count set, runs the given shards (all of them by default) on an
+    AutoShardedBot; run.py starts one such process per cluster.
+    """
     # Load environment variables
     try:
         from dotenv import load_dotenv
         load_dotenv()
+        dotenv_available = True
     except ImportError:
+        dotenv_available = False
+    
+    # Log handlers run on a background thread from here on; each cluster process
+    # rotates its own file
+    logging_config = dict(load_config().get('logging') or {})
+    if cluster_id:
+        root, ext = os.path.splitext(logging_config.get('file', 'bot.log'))
+        logging_config['file'] = f"{root}.{cluster_id}{ext}"
+    setup_logging(logging_config)
+    if not dotenv_available:
         logger.warning("python-dotenv not installed, using system environment variables")
     
     # Check required environment variables
@@ -415,10 +2252,35 @@ async def main():
         return
     
     # Create and run bot
-    bot = ShitTrackerBot()
+    if shard_count:
+        bot = ShardedShitTrackerBot(cluster_id=cluster_id, shard_ids=shard_ids, shard_count=shard_count)
+    else:
+        bot = ShitTrackerBot()
+    
+    # SIGINT/SIGTERM start a graceful close; bot.start() returns once it is done.
+    # Where the loop cannot take signal handlers (Windows), Ctrl+C still raises
+    # KeyboardInterrupt and the finally below closes the bot
+    loop = asyncio.get_running_loop()
+    
+    def request_shutdown(signum: int):
+        if bot._shutdown_task is None:
+            logger.info(f"Received signal {signum}, draining and shutting down...")
+            asyncio.create_task(bot.close())
+        else:
+            logger.info(f"Received signal {signum}, already shutting down")
+    
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, request_shutdown, signum)
+        except (NotImplementedError, RuntimeError):
+            pass
     
     try:
-        logger.info("Starting Discord Shit Tracker Bot...")
+        if shard_count:
+            logger.info(f"Starting Discord Shit Tracker Bot cluster {cluster_id} "
+                        f"(shards {shard_ids if shard_ids is not None else 'all'} of {shard_count})...")
+        else:
+            logger.info("Starting Discord Shit Tracker Bot...")
         await bot.start(token)
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt, shutting down...")
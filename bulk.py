@@ -0,0 +1,138 @@
+"""
+Bulk File Improvement
+Streams an uploaded .txt or .jsonl file through the improver line by line and writes the results in order
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterable, Awaitable, BinaryIO, Callable, Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('.txt', '.jsonl')
+
+@dataclass
+class BulkProgress:
+    """Line counts for one file."""
+    lines: int = 0
+    improved: int = 0
+    # Lines left as they were: the improvement failed, or the line was unusable
+    unchanged: int = 0
+    # Input stopped at max_lines
+    truncated: bool = False
+    done: bool = False
+
+ImproveLine = Callable[[str], Awaitable[Optional[str]]]
+ReportProgress = Callable[[BulkProgress], Awaitable[None]]
+
+class BulkFileImprover:
+    """Improves the lines of a file with at most `workers` requests in flight.
+
+    Lines are read one at a time and at most 2 x `workers` are held at once:
+    when the window is full, the oldest line is awaited and written before the
+    next is read, so output order matches input order and memory does not grow
+    with the file.
+
+    .txt lines are replaced by their improvement. .jsonl lines may be a JSON
+    string or an object with a "text" (or "content") field; each becomes an
+    object with an added "improved" field (null when it failed). Blank lines
+    pass through unchanged.
+    """
+
+    def __init__(self, improve: ImproveLine, workers: int = 4, max_lines: int = 5000,
+                 max_line_chars: int = 2000, progress_interval: float = 3.0):
+        self.improve = improve
+        self.workers = workers
+        self.max_lines = max_lines
+        self.max_line_chars = max_line_chars
+        self.progress_interval = progress_interval
+
+    @classmethod
+    def from_config(cls, improve: ImproveLine, config: Optional[dict]) -> "BulkFileImprover":
+        """Create a bulk improver from the improve_file config section."""
+        config = config or {}
+        return cls(
+            improve,
+            workers=config.get('workers', 4),
+            max_lines=config.get('max_lines', 5000),
+            max_line_chars=config.get('max_line_chars', 2000),
+            progress_interval=config.get('progress_interval', 3)
+        )
+
+    async def run(self, lines: AsyncIterable[bytes], fmt: str, out: BinaryIO,
+                  progress: ReportProgress) -> BulkProgress:
+        """Improve every line from `lines` (raw bytes, one per line) into `out`."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        stats = BulkProgress()
+        semaphore = asyncio.Semaphore(self.workers)
+        window: Deque[asyncio.Task] = deque()
+        last_progress = time.monotonic()
+
+        async def process(raw: bytes) -> bytes:
+            async with semaphore:
+                line, improved = await self._process_line(raw.decode('utf-8', errors='replace'), fmt)
+            stats.improved += improved
+            stats.unchanged += not improved and bool(line.strip())
+            return line.encode('utf-8') + b'\n'
+
+        try:
+            async for raw in lines:
+                if stats.lines >= self.max_lines:
+                    stats.truncated = True
+                    break
+                stats.lines += 1
+                window.append(asyncio.create_task(process(raw)))
+                if len(window) >= 2 * self.workers:
+                    out.write(await window.popleft())
+
+                now = time.monotonic()
+                if now - last_progress >= self.progress_interval:
+                    await progress(stats)
+                    last_progress = now
+
+            while window:
+                out.write(await window.popleft())
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+
+        stats.done = True
+        await progress(stats)
+        return stats
+
+    async def _process_line(self, line: str, fmt: str) -> Tuple[str, bool]:
+        """Return the output line and whether it was improved."""
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            return line, False
+        if fmt == '.txt':
+            if len(line) > self.max_line_chars:
+                return line, False
+            improved = await self._improve(line)
+            # One line in, one line out
+            return (' '.join(improved.splitlines()), True) if improved else (line, False)
+
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            return line, False
+        if isinstance(item, str):
+            item = {'text': item}
+        text = item.get('text', item.get('content')) if isinstance(item, dict) else None
+        if not isinstance(text, str) or not text.strip() or len(text) > self.max_line_chars:
+            return line, False
+        item['improved'] = await self._improve(text)
+        return json.dumps(item, ensure_ascii=False), item['improved'] is not None
+
+    async def _improve(self, text: str) -> Optional[str]:
+        try:
+            return await self.improve(text)
+        except Exception as e:
+            logger.error(f"Bulk line improvement failed: {e}")
+            return None
@@ -0,0 +1,200 @@
+"""
+Adaptive Concurrency Limiter
+AIMD limit on concurrent AI requests, driven by latency and throttling, with weighted fair sharing between guilds
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """Caps in-flight requests at a limit that adapts to upstream behaviour.
+
+    Additive increase: each healthy response adds 1/limit while the limit is
+    actually in use. Multiplicative decrease: a 429, 5xx or timeout multiplies
+    it by `backoff`; a response slower than `latency_tolerance` times the
+    baseline latency shrinks it by 10%. Decreases are spaced by `cooldown`
+    seconds so one burst of failures counts once.
+
+    Waiters are granted slots in weighted fair order: each key (a guild) has a
+    virtual time that advances by 1/weight per grant, and the waiting key with
+    the lowest virtual time goes next.
+    """
+
+    def __init__(self, initial: float = 4, min_limit: float = 1, max_limit: float = 64,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+
+        # key -> waiting (future, weight) pairs, oldest first
+        self._waiters: Dict[Hashable, Deque[Tuple[asyncio.Future, float]]] = {}
+        self._vtime: Dict[Hashable, float] = {}
+        self._clock = 0.0
+
+        self.stats = {
+            'acquired': 0,
+            'waited': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'increases': 0,
+            'decreases': 0
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "AdaptiveLimiter":
+        """Create a limiter from the openrouter.concurrency config section."""
+        config = config or {}
+        return cls(
+            initial=config.get('initial', 4),
+            min_limit=config.get('min', 1),
+            max_limit=config.get('max', 64),
+            backoff=config.get('backoff', 0.5),
+            latency_tolerance=config.get('latency_tolerance', 2.0),
+            cooldown=config.get('cooldown', 1.0)
+        )
+
+    async def acquire(self, key: Hashable = None, weight: float = 1.0) -> float:
+        """Wait for a slot. Returns the time spent waiting."""
+        start = time.monotonic()
+        if not self._waiters and self.in_flight < self._capacity():
+            self._charge(key, weight)
+            self.in_flight += 1
+            self.stats['acquired'] += 1
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiters.get(key)
+        if queue is None:
+            queue = self._waiters[key] = deque()
+            # A key that was idle starts level with the current round, not with its old credit
+            self._vtime[key] = max(self._vtime.get(key, 0.0), self._clock)
+        queue.append((future, weight))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: hand the slot on
+                self.release()
+            else:
+                self._discard(key, future)
+            raise
+
+        waited = time.monotonic() - start
+        self.stats['acquired'] += 1
+        self.stats['waited'] += 1
+        self.stats['wait_total'] += waited
+        self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+        return waited
+
+    def release(self):
+        """Return a slot taken by acquire()."""
+        self.in_flight -= 1
+        self._wake()
+
+    def observe(self, status, latency: Optional[float] = None):
+        """Feed back the outcome of one upstream request."""
+        now = time.monotonic()
+        overloaded = status == 'timeout' or (isinstance(status, int) and (status == 429 or status >= 500))
+        if overloaded:
+            self._decrease(now, self.backoff, status)
+            return
+        if status != 200 or latency is None:
+            return
+
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Drift up slowly so a permanently slower upstream becomes the new normal
+            self.baseline += (latency - self.baseline) * 0.01
+
+        if latency > self.baseline * self.latency_tolerance:
+            self._decrease(now, 0.9, f"latency {latency:.2f}s")
+        elif self.in_flight >= self.limit - 1 and self.limit < self.max_limit:
+            # Only grow when the current limit is the bottleneck
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.stats['increases'] += 1
+            self._wake()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def get_stats(self) -> dict:
+        """Return the current limit, load and queue wait statistics."""
+        waited = self.stats['waited']
+        return dict(
+            self.stats,
+            limit=self.limit,
+            in_flight=self.in_flight,
+            waiting=self.waiting,
+            waiting_keys=len(self._waiters),
+            baseline_latency=self.baseline,
+            wait_avg=self.stats['wait_total'] / waited if waited else 0.0
+        )
+
+    def export_state(self) -> dict:
+        """The learned limit and latency baseline, for a warm-restart snapshot."""
+        return {'limit': self.limit, 'baseline': self.baseline}
+
+    def restore_state(self, state: dict):
+        """Start from a previous run's limit instead of relearning it."""
+        if state.get('limit'):
+            self.limit = max(self.min_limit, min(self.max_limit, float(state['limit'])))
+        if state.get('baseline'):
+            self.baseline = float(state['baseline'])
+
+    def _capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    def _decrease(self, now: float, factor: float, reason):
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * factor)
+        self.stats['decreases'] += 1
+        logger.debug(f"AI concurrency limit {previous:.1f} -> {self.limit:.1f} ({reason})")
+
+    def _charge(self, key: Hashable, weight: float):
+        start = max(self._vtime.get(key, 0.0), self._clock)
+        self._clock = start
+        self._vtime[key] = start + 1.0 / max(weight, 0.01)
+        if len(self._vtime) > 10000:
+            # Forget keys that have fallen behind the clock; they would restart from it anyway
+            self._vtime = {k: v for k, v in self._vtime.items() if v > self._clock or k in self._waiters}
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self._capacity():
+            key = min(self._waiters, key=lambda k: self._vtime.get(k, 0.0))
+            queue = self._waiters[key]
+            future, weight = queue.popleft()
+            if not queue:
+                del self._waiters[key]
+            if future.done():
+                continue
+            self._charge(key, weight)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _discard(self, key: Hashable, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if not queue:
+            return
+        for entry in queue:
+            if entry[0] is future:
+                queue.remove(entry)
+                break
+        if not queue:
+            del self._waiters[key]
@@ -0,0 +1,7 @@
+"""
+Pytest Configuration
+Keeps the manual Discord connection script out of the automated test run
+"""
+
+# test_bot.py logs in to Discord with a real token; run it by hand (see README)
+collect_ignore = ['test_bot.py']
@@ -0,0 +1,184 @@
+"""
+Guild Configuration
+config.json plus per-guild overrides, compiled into immutable snapshots and reloaded when the file changes
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from ratelimit import GCRALimit
+
+logger = logging.getLogger(__name__)
+
+# Longest flagged text shown in an embed field (1024 characters, minus the code block)
+MAX_EMBED_CONTENT = 1000
+
+_CUSTOM_EMOJI = re.compile(r'<a?:\w+:(\d+)>')
+
+VARIATION_SELECTOR = '\ufe0f'
+
+class EmojiMatcher:
+    """Set of target emoji: custom emoji by ID, unicode emoji by name."""
+
+    __slots__ = ('ids', 'names', 'display')
+
+    def __init__(self, entries: Union[str, Iterable[str]]):
+        if isinstance(entries, str):
+            entries = [entries]
+        ids = set()
+        names = set()
+        display = []
+        for entry in entries:
+            entry = str(entry).strip()
+            custom = _CUSTOM_EMOJI.fullmatch(entry)
+            if custom or entry.isdigit():
+                ids.add(int(custom.group(1) if custom else entry))
+                display.append(entry if custom else f"<:emoji:{entry}>")
+            elif entry:
+                # Clients send some emoji with and some without the variation selector
+                base = entry.replace(VARIATION_SELECTOR, '')
+                names.update((entry, base, base + VARIATION_SELECTOR))
+                display.append(entry)
+        self.ids: FrozenSet[int] = frozenset(ids)
+        self.names: FrozenSet[str] = frozenset(names)
+        self.display = ' '.join(display)
+
+    def matches(self, emoji) -> bool:
+        """True if a discord.PartialEmoji is one of the targets."""
+        if emoji.id is not None:
+            return emoji.id in self.ids
+        return emoji.name in self.names
+
+@dataclass(frozen=True)
+class GuildSettings:
+    """Effective settings for one guild, compiled once per config load."""
+    emoji: EmojiMatcher
+    max_content_length: int
+    command_cooldown: float
+    # None means the global user tier applies
+    user_limit: Optional[GCRALimit]
+    # Share of AI request slots relative to other guilds when they compete
+    ai_weight: float = 1.0
+    # AI tokens the guild may use per UTC day, 0 for no limit
+    ai_daily_tokens: int = 0
+
+class ConfigSnapshot:
+    """One parsed config file: the raw dict plus compiled default and per-guild settings."""
+
+    # Keys a "guilds" entry may override
+    GUILD_KEYS = ('target_emoji', 'max_content_length', 'command_cooldown', 'rate_limit_max', 'rate_limit_window',
+                  'ai_weight', 'ai_daily_tokens')
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self.defaults = self._compile(raw, None)
+        self.guilds: Dict[int, GuildSettings] = {}
+        for guild_id, overrides in (raw.get('guilds') or {}).items():
+            unknown = set(overrides) - set(self.GUILD_KEYS)
+            if unknown:
+                logger.warning(f"Ignoring unknown settings for guild {guild_id}: {', '.join(sorted(unknown))}")
+            self.guilds[int(guild_id)] = self._compile(dict(raw, **overrides), overrides)
+
+    def for_guild(self, guild_id: Optional[int]) -> GuildSettings:
+        return self.guilds.get(guild_id, self.defaults)
+
+    @staticmethod
+    def _compile(values: dict, overrides: Optional[dict]) -> GuildSettings:
+        user_limit = None
+        if overrides and ('rate_limit_max' in overrides or 'rate_limit_window' in overrides):
+            user_limit = GCRALimit('user', values.get('rate_limit_max', 5), values.get('rate_limit_window', 60))
+        return GuildSettings(
+            emoji=EmojiMatcher(values.get('target_emoji', '💩')),
+            max_content_length=max(10, min(values.get('max_content_length', MAX_EMBED_CONTENT), MAX_EMBED_CONTENT)),
+            command_cooldown=values.get('command_cooldown', values.get('discord', {}).get('command_cooldown', 0)),
+            user_limit=user_limit,
+            ai_weight=max(0.01, float(values.get('ai_weight', 1.0))),
+            ai_daily_tokens=max(0, int(values.get('ai_daily_tokens') or 0))
+        )
+
+ReloadListener = Callable[[ConfigSnapshot], Union[None, Awaitable[None]]]
+
+class ConfigManager:
+    """Holds the current ConfigSnapshot and swaps in a new one when the file changes.
+
+    Readers always see one complete snapshot; a file that fails to parse or
+    compile leaves the current one in place.
+    """
+
+    def __init__(self, path: str, raw: Optional[dict] = None, reload_interval: float = 2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.snapshot = ConfigSnapshot(raw if raw is not None else self._read(path))
+        self._listeners: List[ReloadListener] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self._file_state = self._stat()
+        self.stats = {'reloads': 0, 'errors': 0}
+
+    def for_guild(self, guild_id: Optional[int]) -> GuildSettings:
+        """Settings for a guild (the defaults when it has no overrides)."""
+        return self.snapshot.for_guild(guild_id)
+
+    def on_reload(self, listener: ReloadListener):
+        """Call listener with each new snapshot after it is swapped in."""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Start watching the config file."""
+        if self._watch_task is None and self.reload_interval > 0:
+            self._watch_task = asyncio.create_task(self._watch(), name='config-watch')
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+
+    async def reload(self) -> bool:
+        """Re-read the file now. Returns True if a new snapshot was installed."""
+        try:
+            # Parsing and compiling stay off the event loop
+            snapshot = await asyncio.to_thread(lambda: ConfigSnapshot(self._read(self.path)))
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Config reload failed, keeping current settings: {e}")
+            return False
+
+        self.snapshot = snapshot
+        self.stats['reloads'] += 1
+        logger.info(f"Config reloaded from {self.path} ({len(snapshot.guilds)} guild overrides)")
+        for listener in self._listeners:
+            try:
+                result = listener(snapshot)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Config reload listener failed: {e}")
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            state = self._stat()
+            if state != self._file_state:
+                self._file_state = state
+                await self.reload()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict):
+            raise ValueError("config root must be an object")
+        return raw
@@ -0,0 +1,335 @@
+"""
+Incident Store
+SQLite record of flagged messages, written in batches off the event loop and queried by index
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set, Tuple
+
+from retroscan import ScanCheckpoint
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class IncidentRecord:
+    """One flagged message."""
+    incident_id: str
+    guild_id: int
+    channel_id: int
+    message_id: int
+    author_id: int
+    flagger_id: int
+    created_at: float = field(default_factory=time.time)
+    content: Optional[str] = None
+    # Row id, set on records read back from the store
+    id: Optional[int] = None
+
+# (created_at, id) of the last row on a page; the next page starts after it
+Cursor = Tuple[float, int]
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS incidents ('
+    'id INTEGER PRIMARY KEY, incident_id TEXT NOT NULL, guild_id INTEGER NOT NULL, '
+    'channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, author_id INTEGER NOT NULL, '
+    'flagger_id INTEGER NOT NULL, created_at REAL NOT NULL, content TEXT)',
+    # History queries walk these newest first; top queries scan a time range of
+    # the guild index and never touch the table
+    'CREATE INDEX IF NOT EXISTS idx_incidents_guild_time ON incidents (guild_id, created_at, author_id, flagger_id)',
+    'CREATE INDEX IF NOT EXISTS idx_incidents_author ON incidents (guild_id, author_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_incidents_flagger ON incidents (guild_id, flagger_id, created_at)',
+    # Lets a channel scan skip messages that already have an incident
+    'CREATE INDEX IF NOT EXISTS idx_incidents_message ON incidents (guild_id, message_id)',
+    'CREATE TABLE IF NOT EXISTS scan_checkpoints ('
+    'channel_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, after_id INTEGER, "limit" INTEGER, '
+    'before_id INTEGER, scanned INTEGER NOT NULL, flagged INTEGER NOT NULL, skipped INTEGER NOT NULL, '
+    'started_at REAL NOT NULL)'
+)
+
+_CHECKPOINT_COLUMNS = 'channel_id, guild_id, after_id, "limit", before_id, scanned, flagged, skipped, started_at'
+
+_COLUMNS = 'id, incident_id, guild_id, channel_id, message_id, author_id, flagger_id, created_at, content'
+
+class IncidentStore:
+    """Incident table in a WAL-mode SQLite file.
+
+    record() only appends to an in-memory buffer; a background task flushes it
+    in one transaction per batch on a writer thread. Queries use their own
+    connection on a reader thread, which WAL lets run alongside writes.
+    """
+
+    ROLES = ('author', 'flagger')
+
+    def __init__(self, db_path: str = 'incidents.db', batch_size: int = 100, flush_interval: float = 1.0,
+                 max_pending: int = 10000, store_content: bool = False):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.store_content = store_content
+
+        self._pending: List[IncidentRecord] = []
+        self._flush_now = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        # Each connection is only used from its own executor thread
+        self._write_db: Optional[sqlite3.Connection] = None
+        self._read_db: Optional[sqlite3.Connection] = None
+
+        self.stats = {
+            'recorded': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'errors': 0,
+            'queries': 0
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "IncidentStore":
+        """Create a store from the incident_store config section."""
+        config = config or {}
+        return cls(
+            db_path=config.get('db_path', 'incidents.db'),
+            batch_size=config.get('batch_size', 100),
+            flush_interval=config.get('flush_interval', 1.0),
+            max_pending=config.get('max_pending', 10000),
+            store_content=config.get('store_content', False)
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        """Open the database and start the background writer."""
+        if self._writer:
+            return
+        loop = asyncio.get_running_loop()
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='incident-writer')
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='incident-reader')
+        try:
+            await loop.run_in_executor(self._write_executor, self._open_writer)
+            await loop.run_in_executor(self._read_executor, self._open_reader)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open incident store {self.db_path}: {e}")
+            self._write_executor.shutdown(wait=False)
+            self._read_executor.shutdown(wait=False)
+            self._write_executor = self._read_executor = None
+            return
+        self._writer = asyncio.create_task(self._write_loop(), name='incident-writer')
+        logger.info(f"Incident store opened at {self.db_path}")
+
+    async def close(self):
+        """Flush buffered incidents and close the database."""
+        if not self._writer:
+            return
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+        await self._flush()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._write_executor, self._close_writer)
+        await loop.run_in_executor(self._read_executor, self._close_reader)
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._write_executor = self._read_executor = None
+
+    def record(self, record: IncidentRecord) -> bool:
+        """Buffer an incident for the next batch. Never blocks; returns False if dropped."""
+        if not self._writer:
+            return False
+        if len(self._pending) >= self.max_pending:
+            self.stats['dropped'] += 1
+            return False
+        if not self.store_content:
+            record.content = None
+        self._pending.append(record)
+        self.stats['recorded'] += 1
+        if len(self._pending) >= self.batch_size:
+            self._flush_now.set()
+        return True
+
+    async def history(self, guild_id: int, user_id: int, role: str = 'author', limit: int = 10,
+                      before: Optional[Cursor] = None) -> List[IncidentRecord]:
+        """Incidents for a user as author or flagger, newest first.
+
+        Pass the cursor of the last record of a page as `before` to get the next
+        page; keyset paging costs the same on every page.
+        """
+        if role not in self.ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        sql = f'SELECT {_COLUMNS} FROM incidents WHERE guild_id = ? AND {role}_id = ?'
+        params: list = [guild_id, user_id]
+        if before is not None:
+            sql += ' AND (created_at < ? OR (created_at = ? AND id < ?))'
+            params.extend((before[0], before[0], before[1]))
+        sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+        rows = await self._query(sql, params)
+        return [self._to_record(row) for row in rows]
+
+    async def count(self, guild_id: int, user_id: int, role: str = 'author') -> int:
+        """Total incidents for a user as author or flagger."""
+        if role not in self.ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        rows = await self._query(
+            f'SELECT COUNT(*) FROM incidents WHERE guild_id = ? AND {role}_id = ?', (guild_id, user_id)
+        )
+        return rows[0][0] if rows else 0
+
+    async def top(self, guild_id: int, since: float, role: str = 'author', limit: int = 10,
+                  offset: int = 0) -> List[Tuple[int, int]]:
+        """Most frequent authors (or flaggers) since a timestamp, as (user_id, count) pairs."""
+        if role not in self.ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        return [
+            (row[0], row[1]) for row in await self._query(
+                f'SELECT {role}_id, COUNT(*) AS n FROM incidents '
+                'INDEXED BY idx_incidents_guild_time '
+                f'WHERE guild_id = ? AND created_at >= ? GROUP BY {role}_id '
+                'ORDER BY n DESC, 1 LIMIT ? OFFSET ?',
+                (guild_id, since, limit, offset)
+            )
+        ]
+
+    async def recorded_messages(self, guild_id: int, message_ids: Iterable[int]) -> Set[int]:
+        """The subset of message_ids that already have an incident, stored or still buffered."""
+        ids = set(message_ids)
+        found = {r.message_id for r in self._pending if r.guild_id == guild_id and r.message_id in ids}
+        remaining = list(ids - found)
+        if remaining:
+            rows = await self._query(
+                'SELECT DISTINCT message_id FROM incidents INDEXED BY idx_incidents_message '
+                f'WHERE guild_id = ? AND message_id IN ({", ".join("?" * len(remaining))})',
+                [guild_id, *remaining]
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    async def load_checkpoint(self, channel_id: int) -> Optional[ScanCheckpoint]:
+        """The saved progress of an unfinished scan of a channel."""
+        rows = await self._query(
+            f'SELECT {_CHECKPOINT_COLUMNS} FROM scan_checkpoints WHERE channel_id = ?', (channel_id,)
+        )
+        return ScanCheckpoint(*rows[0]) if rows else None
+
+    async def save_checkpoint(self, checkpoint: ScanCheckpoint):
+        """Store scan progress; a finished scan's checkpoint is removed."""
+        if not self._writer:
+            return
+        if checkpoint.done:
+            sql, params = 'DELETE FROM scan_checkpoints WHERE channel_id = ?', (checkpoint.channel_id,)
+        else:
+            sql = f'INSERT OR REPLACE INTO scan_checkpoints ({_CHECKPOINT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            params = (
+                checkpoint.channel_id, checkpoint.guild_id, checkpoint.after_id, checkpoint.limit,
+                checkpoint.before_id, checkpoint.scanned, checkpoint.flagged, checkpoint.skipped,
+                checkpoint.started_at
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._write_executor, self._db_execute, sql, params)
+        except sqlite3.Error as e:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to save scan checkpoint for channel {checkpoint.channel_id}: {e}")
+
+    async def delete_checkpoint(self, channel_id: int):
+        """Forget a channel's scan progress."""
+        await self.save_checkpoint(ScanCheckpoint(channel_id, 0, done=True))
+
+    def get_stats(self) -> dict:
+        """Return buffer depth and write/query counters."""
+        return dict(self.stats, pending=len(self._pending), enabled=self.is_open)
+
+    @staticmethod
+    def cursor(record: IncidentRecord) -> Cursor:
+        return (record.created_at, record.id)
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush()
+
+    async def _flush(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._write_executor, self._db_insert, batch)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                logger.error(f"Failed to write {len(batch)} incidents: {e}")
+
+    async def _query(self, sql: str, params) -> list:
+        if not self._read_executor:
+            return []
+        self.stats['queries'] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._db_query, sql, tuple(params))
+
+    @staticmethod
+    def _to_record(row) -> IncidentRecord:
+        return IncidentRecord(
+            id=row[0], incident_id=row[1], guild_id=row[2], channel_id=row[3], message_id=row[4],
+            author_id=row[5], flagger_id=row[6], created_at=row[7], content=row[8]
+        )
+
+    # The methods below run on the writer or reader thread
+
+    def _open_writer(self):
+        self._write_db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._write_db.execute('PRAGMA journal_mode=WAL')
+        # WAL keeps the database consistent without an fsync per commit
+        self._write_db.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            self._write_db.execute(statement)
+        self._write_db.commit()
+
+    def _open_reader(self):
+        self._read_db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._read_db.execute('PRAGMA query_only=ON')
+
+    def _close_writer(self):
+        if self._write_db:
+            self._write_db.close()
+            self._write_db = None
+
+    def _close_reader(self):
+        if self._read_db:
+            self._read_db.close()
+            self._read_db = None
+
+    def _db_insert(self, batch: List[IncidentRecord]):
+        with self._write_db:
+            self._write_db.executemany(
+                'INSERT INTO incidents (incident_id, guild_id, channel_id, message_id, author_id, '
+                'flagger_id, created_at, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (r.incident_id, r.guild_id, r.channel_id, r.message_id, r.author_id,
+                     r.flagger_id, r.created_at, r.content)
+                    for r in batch
+                ]
+            )
+
+    def _db_execute(self, sql: str, params: tuple):
+        with self._write_db:
+            self._write_db.execute(sql, params)
+
+    def _db_query(self, sql: str, params: tuple) -> list:
+        if not self._read_db:
+            return []
+        return self._read_db.execute(sql, params).fetchall()
@@ -0,0 +1,173 @@
+"""
+AI Improvement Job Queue
+Bounded asyncio queue and worker pool that keeps AI latency off the reaction path
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ImprovementJob:
+    """A flagged message waiting for an AI improvement."""
+    guild_id: int
+    channel_id: int
+    message_id: int
+    content: str
+    incident_id: str = ""
+    reaction_at: float = 0.0
+    enqueued_at: float = field(default_factory=time.time)
+    deadline: float = 0.0
+    # Set in single-message mode so the worker edits the flagged message
+    flagged_message_id: Optional[int] = None
+    flagged_embed: Optional[dict] = None
+    # Set once anything for this job has been sent to Discord, so a replay does not post twice
+    published: bool = False
+
+class ImprovementQueue:
+    """Bounded job queue drained by a fixed pool of workers."""
+
+    OVERFLOW_POLICIES = ('drop_oldest', 'reject')
+
+    def __init__(self, handler: Callable[[ImprovementJob], Awaitable[None]],
+                 workers: int = 4, max_size: int = 100, max_job_age: float = 60,
+                 overflow: str = 'drop_oldest'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.handler = handler
+        self.worker_count = workers
+        self.max_job_age = max_job_age
+        self.overflow = overflow
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        # Worker task -> the job it is handling
+        self._running: Dict[asyncio.Task, ImprovementJob] = {}
+
+        self.stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'expired': 0,
+            'dropped': 0,
+            'rejected': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0
+        }
+
+    @classmethod
+    def from_config(cls, handler: Callable[[ImprovementJob], Awaitable[None]],
+                    config: Optional[dict]) -> "ImprovementQueue":
+        """Create a queue from the ai_queue config section."""
+        config = config or {}
+        return cls(
+            handler,
+            workers=config.get('workers', 4),
+            max_size=config.get('max_queue_size', 100),
+            max_job_age=config.get('max_job_age', 60),
+            overflow=config.get('overflow', 'drop_oldest')
+        )
+
+    def start(self):
+        """Start the worker pool."""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f'ai-worker-{i}')
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"AI job queue started with {self.worker_count} workers")
+
+    async def stop(self):
+        """Cancel the worker pool."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def drain(self, timeout: float) -> List[ImprovementJob]:
+        """Let the workers finish queued jobs for up to `timeout` seconds, then stop them.
+
+        Returns the jobs that did not get done: those still running at the
+        deadline (they are cancelled) followed by those still queued.
+        """
+        deadline = time.monotonic() + timeout
+        while (self._queue.qsize() or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        unfinished = list(self._running.values())
+        await self.stop()
+        while not self._queue.empty():
+            unfinished.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if unfinished:
+            logger.info(f"AI job queue stopped with {len(unfinished)} jobs unfinished")
+        return unfinished
+
+    def submit(self, job: ImprovementJob) -> bool:
+        """Queue a job without blocking. Returns False if it was shed."""
+        if not job.deadline:
+            job.deadline = job.enqueued_at + self.max_job_age
+
+        if self._queue.full():
+            if self.overflow == 'reject':
+                self.stats['rejected'] += 1
+                logger.warning(f"AI queue full, rejected job for message {job.message_id}")
+                return False
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            self.stats['dropped'] += 1
+            logger.warning(f"AI queue full, dropped oldest job for message {dropped.message_id}")
+
+        self._queue.put_nowait(job)
+        self.stats['submitted'] += 1
+        return True
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def get_stats(self) -> dict:
+        """Return queue depth, wait time and outcome counters."""
+        stats = dict(self.stats)
+        started = stats['processed'] + stats['failed'] + stats['expired']
+        stats['depth'] = self.depth
+        stats['capacity'] = self._queue.maxsize
+        stats['in_flight'] = self._in_flight
+        stats['workers'] = len(self._workers)
+        stats['wait_avg'] = stats['wait_total'] / started if started else 0.0
+        return stats
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                now = time.time()
+                wait = now - job.enqueued_at
+                self.stats['wait_total'] += wait
+                self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+
+                # Stale suggestions are not worth an API call
+                if now > job.deadline:
+                    self.stats['expired'] += 1
+                    logger.debug(f"Dropped stale AI job for message {job.message_id} after {wait:.1f}s")
+                    continue
+
+                self._in_flight += 1
+                self._running[asyncio.current_task()] = job
+                try:
+                    await self.handler(job)
+                    self.stats['processed'] += 1
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logger.error(f"AI job for message {job.message_id} failed: {e}")
+                finally:
+                    self._in_flight -= 1
+                    self._running.pop(asyncio.current_task(), None)
+            finally:
+                self._queue.task_done()
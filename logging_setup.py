@@ -0,0 +1,95 @@
+"""
+Logging Setup
+Queue-based logging so handler I/O runs on a background thread, not the event loop
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Extra fields copied into JSON output when present on a record
+STRUCTURED_FIELDS = ('incident_id', 'guild_id', 'channel_id', 'message_id', 'user_id')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with incident context as top-level fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records logged with extra={'sample': True}."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sample', False) or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def setup_logging(config: Optional[dict] = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to file and console handlers on a background thread.
+
+    Returns the started listener; it is stopped (and flushed) at interpreter exit.
+    """
+    config = config or {}
+    level = os.getenv('LOG_LEVEL', config.get('level', 'INFO')).upper()
+
+    if config.get('json', False):
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(config.get('format', DEFAULT_FORMAT))
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        config.get('file', 'bot.log'),
+        maxBytes=config.get('max_bytes', 10 * 1024 * 1024),
+        backupCount=config.get('backup_count', 5),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config.get('sample_rate', 1.0)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,147 @@
+"""
+Message Snapshot Cache
+Small LRU/TTL cache of the message fields the incident pipeline needs
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class MessageSnapshot:
+    """The subset of a discord.Message used by _handle_incident."""
+    __slots__ = ('id', 'channel_id', 'guild_id', 'guild_name', 'author_id', 'author_mention', 'content')
+
+    id: int
+    channel_id: int
+    guild_id: int
+    guild_name: str
+    author_id: int
+    author_mention: str
+    content: str
+
+    @classmethod
+    def from_message(cls, message, guild_id: int, guild_name: str) -> "MessageSnapshot":
+        """Copy the needed fields out of a full discord.Message."""
+        return cls(
+            id=message.id,
+            channel_id=message.channel.id,
+            guild_id=guild_id,
+            guild_name=guild_name,
+            author_id=message.author.id,
+            author_mention=message.author.mention,
+            content=message.content or ""
+        )
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.id}"
+
+class MessageSnapshotCache:
+    """Bounded LRU of message snapshots with TTL and de-duplicated fetches."""
+
+    def __init__(self, max_entries: int = 500, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # message_id -> (expires_at, snapshot), oldest first
+        self._entries: "OrderedDict[int, Tuple[float, MessageSnapshot]]" = OrderedDict()
+        self._pending: Dict[int, asyncio.Future] = {}
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'fetch_errors': 0
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "MessageSnapshotCache":
+        """Create a cache from the message_cache config section."""
+        config = config or {}
+        return cls(
+            max_entries=config.get('max_entries', 500),
+            ttl=config.get('ttl', 300)
+        )
+
+    def get(self, message_id: int) -> Optional[MessageSnapshot]:
+        """Return a fresh snapshot if one is cached."""
+        entry = self._entries.get(message_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.time():
+            del self._entries[message_id]
+            return None
+        self._entries.move_to_end(message_id)
+        return snapshot
+
+    def put(self, snapshot: MessageSnapshot):
+        """Store a snapshot, evicting the least recently used entries."""
+        self._entries[snapshot.id] = (time.time() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, message_id: int):
+        """Forget a snapshot, e.g. after the message was edited or deleted."""
+        self._entries.pop(message_id, None)
+
+    async def get_or_fetch(self, message_id: int,
+                           fetch: Callable[[], Awaitable[Optional[MessageSnapshot]]]) -> Optional[MessageSnapshot]:
+        """Return a snapshot, fetching it at most once across concurrent callers."""
+        snapshot = self.get(message_id)
+        if snapshot is not None:
+            self.stats['hits'] += 1
+            return snapshot
+
+        pending = self._pending.get(message_id)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        snapshot = None
+        try:
+            snapshot = await fetch()
+            if snapshot is not None:
+                self.put(snapshot)
+            return snapshot
+        except Exception as e:
+            self.stats['fetch_errors'] += 1
+            logger.error(f"Failed to fetch message {message_id}: {e}")
+            return None
+        finally:
+            if not future.done():
+                future.set_result(snapshot)
+            self._pending.pop(message_id, None)
+
+    def export_state(self) -> dict:
+        """Unexpired snapshots, oldest first, for a warm-restart snapshot."""
+        now = time.time()
+        return {'entries': [[expires_at, asdict(snapshot)] for expires_at, snapshot in self._entries.values()
+                            if expires_at > now]}
+
+    def restore_state(self, state: dict):
+        now = time.time()
+        for expires_at, fields in state.get('entries', []):
+            if expires_at > now:
+                snapshot = MessageSnapshot(**fields)
+                self._entries[snapshot.id] = (expires_at, snapshot)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        """Return hit, miss and eviction counters."""
+        stats = dict(self.stats)
+        stats['size'] = len(self._entries)
+        return stats
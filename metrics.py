@@ -0,0 +1,220 @@
+"""
+Bot Metrics
+Counters, histograms and gauges rendered in Prometheus text format, with an optional local endpoint
+"""
+
+import asyncio
+import bisect
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in self.values.items():
+            lines.append(f'{self.name}{_format_labels(key)} {value:g}')
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def count(self) -> int:
+        return sum(sum(counts) for counts in self._counts.values())
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate percentile across all labels, as the upper bound of the matching bucket."""
+        merged = [0] * (len(self.buckets) + 1)
+        for counts in self._counts.values():
+            for i, n in enumerate(counts):
+                merged[i] += n
+        total = sum(merged)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(merged):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_format_labels(key, ("le", f"{bound:g}"))} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{_format_labels(key, ("le", "+Inf"))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {self._sums[key]:g}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, func: Callable[[], Union[float, Dict[str, float]]], label: str = ''):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.error(f"Gauge {self.name} failed: {e}")
+            return lines
+        if isinstance(value, dict):
+            for label_value, v in value.items():
+                lines.append(f'{self.name}{_format_labels(((self.label, str(label_value)),))} {v:g}')
+        else:
+            lines.append(f'{self.name} {value:g}')
+        return lines
+
+class MetricsRegistry:
+    """Holds the bot's metrics and serves them over HTTP."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram, Gauge]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+        # Counter values already pushed to the shared backend, by series
+        self._synced: Dict[str, float] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def counter(self, name: str, help_text: str = '') -> Counter:
+        return self._register(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, func: Callable[[], Union[float, Dict[str, float]]],
+              label: str = '') -> Gauge:
+        return self._register(name, lambda: Gauge(name, help_text, func, label))
+
+    def render(self) -> str:
+        """Render every metric in Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    async def start_server(self, host: str = '127.0.0.1', port: int = 9108):
+        """Serve /metrics on a local port."""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+    async def stop_server(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_sync(self, backend, interval: float = 15):
+        """Periodically add this process's counter increments to a shared backend's totals."""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop(backend, interval), name='metrics-sync')
+
+    async def stop_sync(self, backend=None):
+        """Stop syncing, pushing any increments not yet sent when a backend is given."""
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+            if backend is not None:
+                await self.sync(backend)
+
+    async def sync(self, backend):
+        """Push counter deltas since the last sync, keyed by series name and labels."""
+        deltas: Dict[str, float] = {}
+        for metric in self._metrics.values():
+            if not isinstance(metric, Counter):
+                continue
+            for key, value in list(metric.values.items()):
+                series = metric.name + _format_labels(key)
+                delta = value - self._synced.get(series, 0.0)
+                if delta:
+                    deltas[series] = delta
+        if not deltas:
+            return
+        await backend.incr_counters(deltas)
+        for series, delta in deltas.items():
+            self._synced[series] = self._synced.get(series, 0.0) + delta
+
+    async def _sync_loop(self, backend, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync(backend)
+            except Exception as e:
+                logger.error(f"Metrics sync failed: {e}")
+
+    def _register(self, name: str, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = factory()
+        return metric
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
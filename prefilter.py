@@ -0,0 +1,209 @@
+"""
+Flagged Text Pre-filter
+Word-list matching and cheap heuristics that decide whether a flagged message needs the AI model
+"""
+
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SKIP = 'skip'
+LOCAL = 'local'
+ESCALATE = 'escalate'
+
+# Links, Discord mentions/channels/roles and custom emoji carry no text worth rewriting
+_NON_TEXT = re.compile(r'https?://\S+|<a?:\w+:\d+>|<[@#][!&]?\d+>')
+_WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every listed word or phrase in one pass over the text."""
+
+    def __init__(self, patterns: Iterable[str]):
+        # Node i: goto[i] transitions, fail[i] fallback node, out[i] lengths of patterns ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.size = 0
+        for pattern in patterns:
+            pattern = pattern.strip().lower()
+            if pattern:
+                self._add(pattern)
+                self.size += 1
+        self._build()
+
+    def _add(self, pattern: str):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(len(pattern))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """Return (start, end) spans of whole-word matches in lowercased text, longest first per end."""
+        spans = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length in self._out[node]:
+                start, end = i - length + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    spans.append((start, end))
+        return spans
+
+@dataclass
+class PrefilterResult:
+    """Where a flagged message should go, and the local rewrite if one was made."""
+    decision: str
+    reason: str
+    text: Optional[str] = None
+
+class TextPrefilter:
+    """Sorts flagged text into skip, local rewrite and escalate-to-model.
+
+    Words in `mask_words` are masked locally; any word in `escalate_words`
+    (hostility a mask cannot fix) sends the message to the model.
+    """
+
+    def __init__(self, mask_words: Iterable[str] = (), escalate_words: Iterable[str] = (),
+                 min_words: int = 2, max_mask_ratio: float = 0.34, max_local_length: int = 300,
+                 skip_clean: bool = False, metrics=None):
+        self.metrics = metrics
+        self.mask_matcher = AhoCorasick(mask_words)
+        self.escalate_matcher = AhoCorasick(escalate_words)
+        self.min_words = min_words
+        self.max_mask_ratio = max_mask_ratio
+        self.max_local_length = max_local_length
+        self.skip_clean = skip_clean
+
+        self.decisions: Dict[str, int] = {}
+        self.stats = {'checked': 0, 'time_total': 0.0, 'time_max': 0.0}
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], metrics=None) -> "TextPrefilter":
+        """Create a pre-filter from the prefilter config section."""
+        config = config or {}
+        return cls(
+            mask_words=config.get('mask_words', []),
+            escalate_words=config.get('escalate_words', []),
+            min_words=config.get('min_words', 2),
+            max_mask_ratio=config.get('max_mask_ratio', 0.34),
+            max_local_length=config.get('max_local_length', 300),
+            skip_clean=config.get('skip_clean', False),
+            metrics=metrics
+        )
+
+    def check(self, text: str) -> PrefilterResult:
+        """Classify one message."""
+        start = time.perf_counter()
+        result = self._classify(text)
+        elapsed = time.perf_counter() - start
+
+        self.stats['checked'] += 1
+        self.stats['time_total'] += elapsed
+        self.stats['time_max'] = max(self.stats['time_max'], elapsed)
+        key = f"{result.decision}:{result.reason}"
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        if self.metrics:
+            self.metrics.histogram('st_prefilter_seconds').observe(elapsed)
+            self.metrics.counter('st_prefilter_decisions_total').inc(decision=result.decision, reason=result.reason)
+        return result
+
+    def get_stats(self) -> dict:
+        """Return decision counts by decision and reason, plus matcher time."""
+        totals = {SKIP: 0, LOCAL: 0, ESCALATE: 0}
+        for key, count in self.decisions.items():
+            totals[key.split(':', 1)[0]] += count
+        checked = self.stats['checked']
+        return dict(
+            self.stats,
+            decisions=totals,
+            reasons=dict(self.decisions),
+            time_avg=self.stats['time_total'] / checked if checked else 0.0
+        )
+
+    def _classify(self, text: str) -> PrefilterResult:
+        stripped = _NON_TEXT.sub(' ', text)
+        words = _WORD.findall(stripped)
+        if not words:
+            # Emoji, links, mentions or punctuation only
+            return PrefilterResult(SKIP, 'no_text')
+
+        lowered = self._lower(text)
+        if self.escalate_matcher.size and self.escalate_matcher.find(lowered):
+            return PrefilterResult(ESCALATE, 'hostile')
+
+        if len(words) < self.min_words:
+            return PrefilterResult(SKIP, 'too_short')
+
+        masked = self._merge(self.mask_matcher.find(lowered)) if self.mask_matcher.size else []
+        if not masked:
+            if self.skip_clean:
+                return PrefilterResult(SKIP, 'clean')
+            return PrefilterResult(ESCALATE, 'unlisted')
+
+        if len(text) > self.max_local_length:
+            return PrefilterResult(ESCALATE, 'too_long')
+        if len(masked) / len(words) > self.max_mask_ratio:
+            # Mostly listed words: a masked version would say nothing
+            return PrefilterResult(ESCALATE, 'dense')
+        return PrefilterResult(LOCAL, 'masked', self._mask(text, masked))
+
+    def mask(self, text: str) -> Optional[str]:
+        """Mask listed words whatever the heuristics say; None if nothing is listed."""
+        masked = self._merge(self.mask_matcher.find(self._lower(text))) if self.mask_matcher.size else []
+        return self._mask(text, masked) if masked else None
+
+    @staticmethod
+    def _lower(text: str) -> str:
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Keep match offsets valid for the original text
+            lowered = ''.join(c if len(c.lower()) != 1 else c.lower() for c in text)
+        return lowered
+
+    @staticmethod
+    def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(spans):
+            if merged and start < merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def _mask(text: str, spans: List[Tuple[int, int]]) -> str:
+        parts = []
+        last = 0
+        for start, end in spans:
+            word = text[start:end]
+            parts.append(text[last:start])
+            parts.append(word[0] + ''.join('*' if c.isalnum() else c for c in word[1:]))
+            last = end
+        parts.append(text[last:])
+        return ''.join(parts)
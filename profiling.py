@@ -0,0 +1,282 @@
+"""
+Event Loop Profiling
+Sampling profiler for the event loop thread, a watchdog for blocking callbacks, and named timing spans
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as Tally
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Deepest stack kept per sample; asyncio adds a dozen frames below the bot's own
+MAX_STACK_DEPTH = 128
+
+# The event loop runs each callback from here; frames below it are the loop's own
+_CALLBACK_FRAME = 'events.py:Handle._run'
+
+# GIL switch interval while sampling; lower catches shorter callbacks but slows every thread more
+SAMPLE_SWITCH_INTERVAL = 0.001
+
+class SpanTimer:
+    """Named wall-clock spans around hot-path steps, awaits included.
+
+    Each span feeds the span histogram and running totals, which a profile
+    report compares before and after its window.
+    """
+
+    def __init__(self, histogram: Optional[Histogram] = None):
+        self.histogram = histogram
+        # span name -> [count, total seconds, max seconds]
+        self._totals: Dict[str, List[float]] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            totals = self._totals.get(name)
+            if totals is None:
+                totals = self._totals[name] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] = max(totals[2], elapsed)
+            if self.histogram:
+                self.histogram.observe(elapsed, span=name)
+
+    def totals(self) -> Dict[str, Tuple[int, float]]:
+        """Span name -> (count, total seconds) so far."""
+        return {name: (int(count), total) for name, (count, total, _) in self._totals.items()}
+
+    def get_stats(self) -> dict:
+        """Return count, average and maximum seconds per span."""
+        return {
+            name: {'count': int(count), 'avg': total / count if count else 0.0, 'max': longest}
+            for name, (count, total, longest) in self._totals.items()
+        }
+
+@dataclass
+class ProfileReport:
+    """Stack samples of the event loop thread over one window."""
+    seconds: float
+    interval: float
+    samples: int = 0
+    # Samples where the loop was waiting in its selector for I/O
+    idle: int = 0
+    # Collapsed stack (root first, ';'-separated) -> samples
+    stacks: Tally = field(default_factory=Tally)
+    # Span name -> (count, total seconds) within the window
+    spans: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+
+    def top(self, limit: int = 15, inclusive: bool = False) -> List[Tuple[str, int]]:
+        """Functions with the most samples: on top of the stack, or anywhere on it when inclusive."""
+        counts: Tally = Tally()
+        for stack, n in self.stacks.items():
+            frames = stack.split(';')
+            if inclusive:
+                # Every callback sits under the loop's frames; counting those says nothing
+                if _CALLBACK_FRAME in frames:
+                    frames = frames[len(frames) - frames[::-1].index(_CALLBACK_FRAME):] or frames
+                for frame in set(frames):
+                    counts[frame] += n
+            else:
+                counts[frames[-1]] += n
+        return counts.most_common(limit)
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and similar tools."""
+        return ''.join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def render(self, limit: int = 15) -> str:
+        """Plain-text summary: idle share, spans and the top functions."""
+        busy = self.samples - self.idle
+        lines = [
+            f"Event loop profile: {self.seconds:g}s, {self.samples} samples every {self.interval * 1000:g}ms, "
+            f"{self.idle / self.samples:.0%} of them idle" if self.samples else
+            f"Event loop profile: {self.seconds:g}s, no samples"
+        ]
+        if self.spans:
+            lines += ["", "Spans (count, total, average):"]
+            for name, (count, total) in sorted(self.spans.items(), key=lambda item: -item[1][1]):
+                lines.append(f"  {name:<28} {count:>7} {total:>9.3f}s {total / count * 1000:>9.2f}ms")
+        for title, inclusive in (("Top functions (own samples, loop busy):", False),
+                                 ("Top functions (including callees, loop busy):", True)):
+            lines += ["", title]
+            for frame, n in self.busy_top(limit, inclusive):
+                lines.append(f"  {n / busy:>6.1%} {n:>7}  {frame}" if busy else f"  {n:>7}  {frame}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str, name: str) -> Tuple[str, str]:
+        """Write the summary and the collapsed stacks; returns both paths. Blocking."""
+        os.makedirs(directory, exist_ok=True)
+        report_path = os.path.join(directory, f"{name}.txt")
+        collapsed_path = os.path.join(directory, f"{name}.collapsed")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        return report_path, collapsed_path
+
+    def busy_top(self, limit: int = 15, inclusive: bool = False) -> List[Tuple[str, int]]:
+        """Like top(), leaving out samples where the loop was waiting for I/O."""
+        busy = ProfileReport(self.seconds, self.interval, stacks=Tally(
+            {stack: n for stack, n in self.stacks.items() if not _is_idle(stack)}
+        ))
+        return busy.top(limit, inclusive)
+
+_frame_names: Dict[object, str] = {}
+
+def _frame_name(code) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        qualname = getattr(code, 'co_qualname', code.co_name)
+        name = _frame_names[code] = f"{os.path.basename(code.co_filename)}:{qualname}"
+    return name
+
+def _is_idle(stack: str) -> bool:
+    # The loop blocks in its selector when there is nothing to run
+    return stack.rsplit(';', 1)[-1].startswith('selectors.py:')
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def sample_thread(thread_id: int, seconds: float, interval: float = 0.005) -> ProfileReport:
+    """Sample another thread's stack every `interval` seconds for `seconds`. Blocking.
+
+    The sampler only runs when it gets the GIL, which a busy thread gives up
+    every switch interval (5ms by default) or when it blocks, e.g. in select().
+    Short callbacks would then be missed and the loop look idle, so the switch
+    interval is lowered to SAMPLE_SWITCH_INTERVAL for the whole process while
+    sampling. That makes every thread hand off the GIL more often and slows
+    CPU-bound work somewhat for the duration. Callbacks shorter than that are
+    still missed and samples lean towards idle time; the busy samples are what
+    to compare.
+    """
+    report = ProfileReport(seconds, interval)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(min(switch_interval, SAMPLE_SWITCH_INTERVAL))
+    try:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stack = _collapse(frame)
+            del frame
+            report.stacks[stack] += 1
+            report.samples += 1
+            report.idle += _is_idle(stack)
+            time.sleep(interval)
+    finally:
+        sys.setswitchinterval(switch_interval)
+    return report
+
+async def profile_event_loop(seconds: float, interval: float = 0.005,
+                             spans: Optional[SpanTimer] = None) -> ProfileReport:
+    """Sample the running event loop's thread from a worker thread for `seconds`.
+
+    The loop keeps running meanwhile, but it pays for the sampler's GIL
+    hand-offs and the shorter switch interval (see sample_thread), so keep
+    profiles on a live bot short.
+    """
+    before = spans.totals() if spans else {}
+    report = await asyncio.to_thread(sample_thread, threading.get_ident(), seconds, interval)
+    if spans:
+        for name, (count, total) in spans.totals().items():
+            previous_count, previous_total = before.get(name, (0, 0.0))
+            if count > previous_count:
+                report.spans[name] = (count - previous_count, total - previous_total)
+    return report
+
+class LoopWatchdog:
+    """Logs the stack of any callback that blocks the event loop longer than `threshold` seconds.
+
+    A heartbeat task stamps the time every `interval` seconds; a daemon thread
+    checks the stamp and, when it goes stale, captures the loop thread's stack
+    while the blocking callback is still running.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+
+        self._beat = time.monotonic()
+        self._thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+        self.stats = {'stalls': 0, 'stall_max': 0.0}
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "LoopWatchdog":
+        """Create a watchdog from the profiling.watchdog config section."""
+        config = config or {}
+        return cls(threshold=config.get('threshold', 0.25), interval=config.get('interval', 0.05))
+
+    def start(self):
+        """Start watching the running loop."""
+        if self._heartbeat:
+            return
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.create_task(self._beat_loop(), name='loop-heartbeat')
+        self._watcher = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watcher.start()
+
+    async def stop(self):
+        """Stop the heartbeat and the watcher thread."""
+        self._stopped.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        if self._watcher:
+            await asyncio.to_thread(self._watcher.join)
+            self._watcher = None
+
+    def get_stats(self) -> dict:
+        """Return the stall count and the longest stall seen, in seconds."""
+        return dict(self.stats)
+
+    async def _beat_loop(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            late = time.monotonic() - beat - self.interval
+            if late <= self.threshold:
+                if stalled_since is not None:
+                    # The stamp moved on: the stall has ended
+                    self.stats['stall_max'] = max(self.stats['stall_max'], beat - stalled_since - self.interval)
+                    stalled_since = None
+                continue
+            if stalled_since is not None:
+                continue
+            stalled_since = beat
+            self.stats['stalls'] += 1
+            frame = sys._current_frames().get(self._thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            del frame
+            logger.warning(f"Event loop blocked for over {late * 1000:.0f}ms in:\n{stack}")
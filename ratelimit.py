@@ -0,0 +1,126 @@
+"""
+Reaction Rate Limiter
+GCRA limits stacked per user, guild, channel and globally, with idle-key eviction
+"""
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from shared_state import MemoryStateBackend, StateBackend
+
+logger = logging.getLogger(__name__)
+
+class GCRALimit:
+    """Generic cell rate limit: `max_events` per `window` seconds, one float of state per key."""
+
+    def __init__(self, name: str, max_events: int, window: float):
+        self.name = name
+        self.max_events = max_events
+        self.window = window
+        self.emission_interval = window / max_events
+        self.limited = 0
+
+class RateLimiter:
+    """Stacked reaction limits; an event must pass every tier to be allowed.
+
+    Per-key state (the theoretical arrival time) lives in a StateBackend, so
+    limits hold across shards when the backend is shared.
+    """
+
+    TIERS = ('user', 'guild', 'channel', 'global')
+
+    def __init__(self, limits: List[GCRALimit], backend: Optional[StateBackend] = None,
+                 sweep_interval: float = 300):
+        self.limits = limits
+        self.backend = backend or MemoryStateBackend()
+        self.sweep_interval = sweep_interval
+        self.evictions = 0
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config: dict, backend: Optional[StateBackend] = None) -> "RateLimiter":
+        """Build tiers from the rate_limit_* keys and the rate_limits section of config.json."""
+        return cls(cls.limits_from_config(config), backend,
+                   sweep_interval=config.get('rate_limit_sweep_interval', 300))
+
+    @classmethod
+    def limits_from_config(cls, config: dict) -> List[GCRALimit]:
+        """The user tier first, then any configured guild, channel and global tiers."""
+        limits = [GCRALimit('user', config.get('rate_limit_max', 5), config.get('rate_limit_window', 60))]
+        tiers = config.get('rate_limits', {})
+        for name in cls.TIERS[1:]:
+            tier = tiers.get(name) or {}
+            if tier.get('max'):
+                limits.append(GCRALimit(name, tier['max'], tier.get('window', 60)))
+        return limits
+
+    def reload(self, config: dict):
+        """Swap in tiers from a reloaded config; key state and rejection counts carry over."""
+        limits = self.limits_from_config(config)
+        previous = {limit.name: limit.limited for limit in self.limits}
+        for limit in limits:
+            limit.limited = previous.get(limit.name, 0)
+        self.limits = limits
+        self.sweep_interval = config.get('rate_limit_sweep_interval', self.sweep_interval)
+
+    async def hit(self, user_id: int, guild_id: int, channel_id: int,
+                  user_limit: Optional[GCRALimit] = None) -> Optional[str]:
+        """Record an event. Returns the name of the tier that limited it, or None if allowed.
+
+        `user_limit` replaces the user tier, e.g. for a guild with its own limit.
+        """
+        ids = {'user': user_id, 'guild': guild_id, 'channel': channel_id, 'global': 0}
+        # Held locally: a config reload may swap self.limits while the backend call is awaited
+        base = self.limits
+        limits = base if user_limit is None else [user_limit] + base[1:]
+        limited = await self.backend.gcra(
+            [f"{limit.name}:{ids[limit.name]}" for limit in limits],
+            [limit.emission_interval for limit in limits],
+            [limit.window for limit in limits]
+        )
+        if limited is None:
+            return None
+        # Rejections by a guild's own user limit count towards the user tier
+        limit = base[limited]
+        limit.limited += 1
+        return limit.name
+
+    def describe(self, name: str = 'user') -> str:
+        """Human readable description of one tier, e.g. for the help command."""
+        for limit in self.limits:
+            if limit.name == name:
+                return f"{limit.max_events} reactions per {limit.window:g}s per {name}"
+        return "disabled"
+
+    def start(self):
+        """Start the periodic idle-key sweep."""
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop(), name='rate-limit-sweep')
+
+    async def stop(self):
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            await asyncio.gather(self._sweep_task, return_exceptions=True)
+            self._sweep_task = None
+
+    async def sweep(self) -> int:
+        """Evict idle keys; a key whose arrival time has passed is equivalent to a new key."""
+        evicted = await self.backend.sweep()
+        self.evictions += evicted
+        return evicted
+
+    def get_stats(self) -> dict:
+        """Return key count, evictions and rejections per tier."""
+        return {
+            'keys': self.backend.key_count(),
+            'evictions': self.evictions,
+            'limited': {limit.name: limit.limited for limit in self.limits}
+        }
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = await self.sweep()
+            if evicted:
+                logger.debug(f"Rate limiter evicted {evicted} idle keys")
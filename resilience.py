@@ -0,0 +1,158 @@
+"""
+AI Backend Resilience
+Circuit breaker, retry policy with jitter and Retry-After, and request hedging
+"""
+
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class UpstreamError(Exception):
+    """A failed upstream request: HTTP status (or 'timeout'/'error') and any Retry-After hint."""
+
+    def __init__(self, status, message: str = '', retry_after: Optional[float] = None):
+        super().__init__(f"{status}: {message}" if message else str(status))
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """Timeouts, connection errors, throttling and server errors may succeed on retry."""
+        if not isinstance(self.status, int):
+            return True
+        return self.status in (408, 409, 429) or self.status >= 500
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures.
+
+    Closed: calls pass. After `failure_threshold` consecutive failures it opens
+    and rejects calls for `recovery_time` seconds, then lets one probe through
+    (half-open); the probe's outcome closes or re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    @property
+    def available(self) -> bool:
+        """True if a call would currently be allowed, without claiming the probe."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.recovery_time
+        if self.state == self.HALF_OPEN:
+            return not self._probe_in_flight
+        return True
+
+    def allow(self) -> bool:
+        """Claim permission for one call."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("AI circuit breaker closed, upstream recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Give back a call claimed by allow() that ended without a verdict (cancelled or crashed).
+
+        Only matters for the half-open probe: without this, the breaker would
+        wait for its outcome forever and reject every later call.
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats['opened'] += 1
+                logger.warning(f"AI circuit breaker opened after {self.failures} failures, "
+                               f"retrying in {self.recovery_time:g}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, state=self.state, failures=self.failures)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, deferring to Retry-After up to a cap."""
+
+    def __init__(self, retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to sleep before retry number `attempt` (0-based), or None to give up on this model."""
+        if retry_after is not None:
+            # Waiting longer than max_delay would blow the latency budget; try another model instead
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+async def hedged(primary: Callable[[], Awaitable[T]], secondary: Callable[[], Awaitable[T]],
+                 delay: float) -> T:
+    """Run primary; if it has not finished after `delay` seconds, also run secondary.
+
+    Returns the first successful result and cancels the other call. If both
+    fail, the last error is raised.
+    """
+    tasks = [asyncio.create_task(primary())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        tasks.append(asyncio.create_task(secondary()))
+        error: Optional[BaseException] = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
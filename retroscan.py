@@ -0,0 +1,160 @@
+"""
+Channel Retro-Scan
+Walks a channel's history newest first and feeds already-flagged messages to the incident pipeline, with checkpoints
+"""
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+_DURATION = re.compile(r'(\d+)([mhdw])')
+_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+@dataclass
+class ScanCheckpoint:
+    """Progress of one channel scan; everything newer than before_id has been handled."""
+    channel_id: int
+    guild_id: int
+    # Oldest message ID to scan past (exclusive), from the since bound
+    after_id: Optional[int] = None
+    # Messages to scan in total, None for the whole range
+    limit: Optional[int] = None
+    # Resume point: the next page starts below this ID
+    before_id: Optional[int] = None
+    scanned: int = 0
+    flagged: int = 0
+    skipped: int = 0
+    started_at: float = field(default_factory=time.time)
+    done: bool = False
+
+def parse_scan_bound(value: Optional[str]) -> Tuple[Optional[int], Optional[datetime]]:
+    """Parse the scan command's bound: a message count, a duration like 7d / 12h, or a YYYY-MM-DD date.
+
+    Returns (limit, since); raises ValueError for anything else.
+    """
+    if value is None:
+        return None, None
+    value = value.strip().lower()
+    if value.isdigit():
+        limit = int(value)
+        if limit < 1:
+            raise ValueError("the message count must be at least 1")
+        return limit, None
+    duration = _DURATION.fullmatch(value)
+    if duration:
+        delta = timedelta(**{_UNITS[duration.group(2)]: int(duration.group(1))})
+        return None, datetime.now(timezone.utc) - delta
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"expected a message count, a duration like 7d or a date like 2024-01-31, not {value!r}")
+    return None, since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+FilterBatch = Callable[[List[discord.Message]], Awaitable[List[discord.Message]]]
+HandleMessage = Callable[[discord.Message], Awaitable[bool]]
+SaveCheckpoint = Callable[[ScanCheckpoint], Awaitable[None]]
+ReportProgress = Callable[[ScanCheckpoint], Awaitable[None]]
+
+class ChannelScan:
+    """One pass over a channel's history, resumable from its checkpoint.
+
+    Messages are streamed from discord.py's history iterator; flagged ones
+    are collected into batches of `batch_size`, filtered (e.g. against
+    incidents already recorded) and handled `concurrency` at a time. The
+    iterator is only advanced once a batch is done, so the checkpoint can
+    simply be the last message scanned, and memory stays bounded by one
+    history page plus one batch however long the channel is.
+    """
+
+    def __init__(self, channel, checkpoint: ScanCheckpoint, is_flagged: Callable[[discord.Message], bool],
+                 filter_batch: FilterBatch, handle: HandleMessage, save: SaveCheckpoint, progress: ReportProgress,
+                 concurrency: int = 4, batch_size: int = 50, checkpoint_interval: float = 10.0,
+                 progress_interval: float = 5.0):
+        self.channel = channel
+        self.checkpoint = checkpoint
+        self.is_flagged = is_flagged
+        self.filter_batch = filter_batch
+        self.handle = handle
+        self.save = save
+        self.progress = progress
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.progress_interval = progress_interval
+
+        self._batch: List[discord.Message] = []
+        self._last_scanned: Optional[int] = None
+        # Messages scanned since before_id last moved
+        self._unflushed = 0
+
+    async def run(self) -> ScanCheckpoint:
+        """Scan to the end of the range. The checkpoint is saved on the way and on interruption."""
+        cp = self.checkpoint
+        remaining = None if cp.limit is None else max(0, cp.limit - cp.scanned)
+        last_save = last_progress = time.monotonic()
+        try:
+            if remaining != 0:
+                async for message in self.channel.history(
+                    limit=remaining,
+                    before=discord.Object(id=cp.before_id) if cp.before_id else None,
+                    after=discord.Object(id=cp.after_id) if cp.after_id else None,
+                    oldest_first=False
+                ):
+                    cp.scanned += 1
+                    self._unflushed += 1
+                    self._last_scanned = message.id
+                    if message.reactions and self.is_flagged(message):
+                        self._batch.append(message)
+                        if len(self._batch) >= self.batch_size:
+                            await self._flush()
+
+                    now = time.monotonic()
+                    if now - last_save >= self.checkpoint_interval:
+                        await self._flush()
+                        await self.save(cp)
+                        last_save = now
+                    if now - last_progress >= self.progress_interval:
+                        await self.progress(cp)
+                        last_progress = now
+            await self._flush()
+            cp.done = True
+        finally:
+            if not cp.done:
+                # Messages past before_id are scanned again on resume, so they are not counted yet
+                cp.scanned -= self._unflushed
+                self._unflushed = 0
+            await self.save(cp)
+        await self.progress(cp)
+        return cp
+
+    async def _flush(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            fresh = await self.filter_batch(batch)
+            self.checkpoint.skipped += len(batch) - len(fresh)
+            if fresh:
+                semaphore = asyncio.Semaphore(self.concurrency)
+
+                async def handle(message: discord.Message) -> bool:
+                    async with semaphore:
+                        return await self.handle(message)
+
+                results = await asyncio.gather(*(handle(message) for message in fresh), return_exceptions=True)
+                for message, result in zip(fresh, results):
+                    if isinstance(result, BaseException):
+                        logger.error(f"Scan could not process message {message.id}: {result}")
+                    elif result:
+                        self.checkpoint.flagged += 1
+                    else:
+                        self.checkpoint.skipped += 1
+        if self._last_scanned is not None:
+            self.checkpoint.before_id = self._last_scanned
+        self._unflushed = 0
@@ -4,7 +4,12 @@ Discord Shit Tracker Bot Runner
 Production-ready launcher with error handling and monitoring
 """
 
+import argparse
 import asyncio
+import importlib.util
+import json
+import math
+import multiprocessing
 import sys
 import os
 import signal
@@ -15,10 +20,15 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 def setup_signal_handlers():
-    """Setup signal handlers for graceful shutdown."""
+    """Setup signal handlers for graceful shutdown.
+    
+    bot.main() replaces these with event loop handlers that drain in-flight work
+    and save a state snapshot before exiting. Until then (or where the loop cannot
+    handle signals), a signal unwinds like Ctrl+C so the bot still closes cleanly.
+    """
     def signal_handler(signum, frame):
         print(f"\n🛑 Received signal {signum}, shutting down gracefully...")
-        sys.exit(0)
+        raise KeyboardInterrupt
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -30,7 +40,7 @@ def check_python_version():
         sys.exit(1)
 
 def check_dependencies():
-    """Check if required dependencies are installed."""
+    """Check if required dependencies are installed, without importing them."""
     required_packages = [
         'discord',
         'aiohttp'
@@ -38,9 +48,7 @@ def check_dependencies():
     
     missing_packages = []
     for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
+        if importlib.util.find_spec(package) is None:
             missing_packages.append(package)
     
     if missing_packages:
@@ -73,6 +81,88 @@ def check_environment():
     
     return True
 
+def load_config_section(name: str) -> dict:
+    """Read one section of config.json, if present."""
+    try:
+        with open(Path(__file__).parent / 'config.json', 'r', encoding='utf-8') as f:
+            return json.load(f).get(name) or {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+async def fetch_recommended_shards(token: str) -> int:
+    """Ask Discord how many shards this bot should run."""
+    import aiohttp
+    
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            'https://discord.com/api/v10/gateway/bot',
+            headers={'Authorization': f'Bot {token}'}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards']
+
+def _stop_cluster_process(signum, frame):
+    raise KeyboardInterrupt
+
+def run_cluster(cluster_id: int, shard_ids: list, shard_count: int):
+    """Entry point of one cluster process: run its shard range until stopped."""
+    # Terminate from the launcher unwinds like Ctrl+C so the bot closes cleanly
+    signal.signal(signal.SIGTERM, _stop_cluster_process)
+    
+    from bot import main
+    
+    try:
+        asyncio.run(main(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id))
+    except KeyboardInterrupt:
+        pass
+
+def launch_cluster(processes: int, shard_count: int) -> int:
+    """Spread shards over worker processes and wait for them to exit."""
+    per_process = math.ceil(shard_count / processes)
+    ranges = [
+        list(range(start, min(start + per_process, shard_count)))
+        for start in range(0, shard_count, per_process)
+    ]
+    
+    context = multiprocessing.get_context('spawn')
+    children = []
+    for cluster_id, shard_ids in enumerate(ranges):
+        child = context.Process(
+            target=run_cluster,
+            args=(cluster_id, shard_ids, shard_count),
+            name=f'cluster-{cluster_id}'
+        )
+        child.start()
+        children.append(child)
+        print(f"🧩 Cluster {cluster_id} started (pid {child.pid}, shards {shard_ids[0]}-{shard_ids[-1]})")
+    
+    def signal_handler(signum, frame):
+        print(f"\n🛑 Received signal {signum}, stopping {len(children)} clusters...")
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    for child in children:
+        child.join()
+    return max((child.exitcode or 0) for child in children)
+
+def parse_args():
+    sharding = load_config_section('sharding')
+    parser = argparse.ArgumentParser(description="Run the Discord Shit Tracker Bot")
+    parser.add_argument(
+        '--processes', type=int, default=sharding.get('processes', 1),
+        help="Number of cluster processes; more than 1 enables sharded mode"
+    )
+    parser.add_argument(
+        '--shard-count', type=int, default=sharding.get('shard_count'),
+        help="Total number of shards (default: Discord's recommendation)"
+    )
+    return parser.parse_args()
+
 async def run_bot():
     """Run the bot with error handling."""
     try:
@@ -93,11 +183,9 @@ async def run_bot():
 
 def main():
     """Main entry point with comprehensive checks."""
+    args = parse_args()
     print("🔍 Performing pre-flight checks...")
     
-    # Setup signal handlers
-    setup_signal_handlers()
-    
     # Check Python version
     check_python_version()
     print("✅ Python version compatible")
@@ -111,18 +199,28 @@ def main():
         sys.exit(1)
     print("✅ Environment configured")
     
-    # Setup basic logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('bot_runner.log'),
-            logging.StreamHandler()
-        ]
-    )
+    # Logging is configured by bot.main() from the logging section of config.json
     
     print("🎯 All checks passed, launching bot...")
     
+    # Cluster mode: one AutoShardedBot process per shard range
+    if args.processes > 1 or args.shard_count:
+        shard_count = args.shard_count
+        if not shard_count:
+            try:
+                shard_count = asyncio.run(fetch_recommended_shards(os.getenv('DISCORD_BOT_TOKEN')))
+            except Exception as e:
+                print(f"💥 Could not fetch recommended shard count: {e}")
+                sys.exit(1)
+        processes = max(1, min(args.processes, shard_count))
+        if processes > 1 and load_config_section('shared_state').get('backend', 'memory') == 'memory':
+            print("⚠️ shared_state backend is 'memory': rate limits and AI cache are per process")
+        print(f"🚀 Launching {shard_count} shards across {processes} processes...")
+        sys.exit(launch_cluster(processes, shard_count))
+    
+    # Setup signal handlers
+    setup_signal_handlers()
+    
     # Run the bot
     try:
         exit_code = asyncio.run(run_bot())
@@ -0,0 +1,205 @@
+"""
+Outbound Send Scheduler
+Per-channel send queues paced to Discord's channel rate limit, with digest coalescing
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SendFunc = Callable[[int, int, List[Any]], Awaitable[Any]]
+DigestFunc = Callable[[List[str], int], Any]
+
+@dataclass
+class OutboundItem:
+    """One pending send: its embeds plus a one-line summary used in digests."""
+    embeds: List[Any]
+    summary: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class _ChannelQueue:
+    """Pending items and token bucket for one channel."""
+
+    def __init__(self, channel_id: int, guild_id: int, capacity: float):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.items: Deque[OutboundItem] = deque()
+        self.tokens = capacity
+        self.refilled_at = time.monotonic()
+        self.worker: Optional[asyncio.Task] = None
+        self.stats = {
+            'sent': 0,
+            'digests': 0,
+            'digested': 0,
+            'dropped': 0,
+            'errors': 0,
+            'wait_max': 0.0
+        }
+
+class ChannelSendScheduler:
+    """Serializes sends per channel and merges backlogs into digest messages."""
+
+    def __init__(self, send: SendFunc, build_digest: DigestFunc, rate: int = 5, per: float = 5.0,
+                 digest_threshold: int = 4, max_digest_items: int = 15, max_age: float = 60,
+                 max_tracked_channels: int = 1000):
+        self.send_func = send
+        self.build_digest = build_digest
+        self.rate = rate
+        self.per = per
+        self.digest_threshold = digest_threshold
+        self.max_digest_items = max_digest_items
+        self.max_age = max_age
+        self.max_tracked_channels = max_tracked_channels
+
+        self._channels: "OrderedDict[int, _ChannelQueue]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls, send: SendFunc, build_digest: DigestFunc,
+                    config: Optional[dict]) -> "ChannelSendScheduler":
+        """Create a scheduler from the send_scheduler config section."""
+        config = config or {}
+        return cls(
+            send,
+            build_digest,
+            rate=config.get('rate', 5),
+            per=config.get('per', 5.0),
+            digest_threshold=config.get('digest_threshold', 4),
+            max_digest_items=config.get('max_digest_items', 15),
+            max_age=config.get('max_age', 60),
+            max_tracked_channels=config.get('max_tracked_channels', 1000)
+        )
+
+    async def send(self, channel_id: int, guild_id: int, embeds: List[Any], summary: str):
+        """Queue embeds for a channel. Returns the sent message, or None if digested or dropped."""
+        state = self._get_channel(channel_id, guild_id)
+        future = asyncio.get_running_loop().create_future()
+        state.items.append(OutboundItem(embeds, summary, future))
+        if state.worker is None or state.worker.done():
+            state.worker = asyncio.create_task(self._drain(state), name=f'send-{channel_id}')
+        return await future
+
+    async def stop(self):
+        """Cancel channel workers; pending sends resolve to None."""
+        for state in self._channels.values():
+            if state.worker:
+                state.worker.cancel()
+        await asyncio.gather(
+            *(state.worker for state in self._channels.values() if state.worker),
+            return_exceptions=True
+        )
+        for state in self._channels.values():
+            while state.items:
+                item = state.items.popleft()
+                if not item.future.done():
+                    item.future.set_result(None)
+
+    def get_stats(self) -> dict:
+        """Return per-channel queue depth and outcome counters."""
+        channels = {
+            channel_id: dict(state.stats, depth=len(state.items))
+            for channel_id, state in self._channels.items()
+        }
+        return {
+            'channels': channels,
+            'depth': sum(stats['depth'] for stats in channels.values()),
+            'digests': sum(stats['digests'] for stats in channels.values())
+        }
+
+    def _get_channel(self, channel_id: int, guild_id: int) -> _ChannelQueue:
+        state = self._channels.get(channel_id)
+        if state is None:
+            state = _ChannelQueue(channel_id, guild_id, self.rate)
+            self._channels[channel_id] = state
+            self._evict_idle()
+        else:
+            self._channels.move_to_end(channel_id)
+        return state
+
+    def _evict_idle(self):
+        # Forget the least recently used channels that have nothing queued
+        excess = len(self._channels) - self.max_tracked_channels
+        if excess <= 0:
+            return
+        for channel_id in list(self._channels):
+            state = self._channels[channel_id]
+            if not state.items and (state.worker is None or state.worker.done()):
+                del self._channels[channel_id]
+                excess -= 1
+                if excess <= 0:
+                    break
+
+    async def _acquire(self, state: _ChannelQueue):
+        """Wait for a token from the channel's bucket."""
+        while True:
+            now = time.monotonic()
+            state.tokens = min(self.rate, state.tokens + (now - state.refilled_at) * self.rate / self.per)
+            state.refilled_at = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return
+            await asyncio.sleep((1 - state.tokens) * self.per / self.rate)
+
+    async def _drain(self, state: _ChannelQueue):
+        while state.items:
+            await self._acquire(state)
+            if not state.items:
+                return
+
+            now = time.monotonic()
+            stale = sum(1 for item in state.items if now - item.enqueued_at > self.max_age)
+
+            # Merge the backlog (or anything too old to send on its own) into one digest
+            if len(state.items) >= self.digest_threshold or stale:
+                batch = [state.items.popleft() for _ in range(min(len(state.items), self.max_digest_items))]
+                overflow = 0
+                if stale > len(batch):
+                    # Stale items that do not fit in this digest are dropped
+                    while state.items and now - state.items[0].enqueued_at > self.max_age:
+                        dropped = state.items.popleft()
+                        if not dropped.future.done():
+                            dropped.future.set_result(None)
+                        overflow += 1
+                    state.stats['dropped'] += overflow
+                await self._send_digest(state, batch, overflow)
+            else:
+                item = state.items.popleft()
+                await self._send_item(state, item)
+
+    async def _send_item(self, state: _ChannelQueue, item: OutboundItem):
+        self._record_wait(state, item)
+        result = None
+        try:
+            result = await self.send_func(state.channel_id, state.guild_id, item.embeds)
+            state.stats['sent'] += 1
+        except Exception as e:
+            state.stats['errors'] += 1
+            logger.error(f"Failed to send to channel {state.channel_id}: {e}")
+        finally:
+            if not item.future.done():
+                item.future.set_result(result)
+
+    async def _send_digest(self, state: _ChannelQueue, batch: List[OutboundItem], overflow: int):
+        for item in batch:
+            self._record_wait(state, item)
+        try:
+            digest = self.build_digest([item.summary for item in batch], overflow)
+            await self.send_func(state.channel_id, state.guild_id, [digest])
+            state.stats['digests'] += 1
+            state.stats['digested'] += len(batch)
+            logger.info(f"Sent digest of {len(batch)} items to channel {state.channel_id}")
+        except Exception as e:
+            state.stats['errors'] += 1
+            logger.error(f"Failed to send digest to channel {state.channel_id}: {e}")
+        finally:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(None)
+
+    def _record_wait(self, state: _ChannelQueue, item: OutboundItem):
+        state.stats['wait_max'] = max(state.stats['wait_max'], time.monotonic() - item.enqueued_at)
@@ -0,0 +1,215 @@
+"""
+Shared State Backends
+Rate limiter, AI cache and counter state that can be shared between shards and processes
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+class StateBackend:
+    """State the bot keeps per key: GCRA arrival times, cached improvements and counters."""
+
+    # True when the state is visible to other processes
+    shared = False
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def gcra(self, keys: Sequence[str], intervals: Sequence[float],
+                   windows: Sequence[float]) -> Optional[int]:
+        """Check stacked GCRA limits atomically.
+
+        Every key is charged only if all pass. Returns the index of the first
+        limiting key, or None if the event is allowed.
+        """
+        raise NotImplementedError
+
+    async def sweep(self) -> int:
+        """Evict idle rate limiter keys. Returns the number evicted."""
+        return 0
+
+    def key_count(self) -> int:
+        """Number of rate limiter keys held locally (0 if held remotely)."""
+        return 0
+
+    async def cache_get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def cache_set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+    async def incr_counters(self, deltas: Dict[str, float]):
+        raise NotImplementedError
+
+    async def get_counters(self) -> Dict[str, float]:
+        raise NotImplementedError
+
+    def export_state(self) -> dict:
+        """Locally held state for a warm-restart snapshot (nothing if it lives elsewhere)."""
+        return {}
+
+    def restore_state(self, state: dict):
+        pass
+
+class MemoryStateBackend(StateBackend):
+    """In-process backend; the default for a single process."""
+
+    def __init__(self):
+        self._tat: Dict[str, float] = {}
+        self._cache: Dict[str, Tuple[float, str]] = {}
+        self._counters: Dict[str, float] = {}
+
+    async def gcra(self, keys: Sequence[str], intervals: Sequence[float],
+                   windows: Sequence[float]) -> Optional[int]:
+        now = time.monotonic()
+        new_tats: List[float] = []
+        for i, (key, interval, window) in enumerate(zip(keys, intervals, windows)):
+            new_tat = max(self._tat.get(key, now), now) + interval
+            if new_tat - now > window:
+                return i
+            new_tats.append(new_tat)
+        for key, new_tat in zip(keys, new_tats):
+            self._tat[key] = new_tat
+        return None
+
+    async def sweep(self) -> int:
+        now = time.monotonic()
+        idle = [key for key, tat in self._tat.items() if tat <= now]
+        for key in idle:
+            del self._tat[key]
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._cache.items() if expires_at <= now]
+        for key in expired:
+            del self._cache[key]
+        return len(idle)
+
+    def key_count(self) -> int:
+        return len(self._tat)
+
+    async def cache_get(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    async def cache_set(self, key: str, value: str, ttl: float):
+        self._cache[key] = (time.time() + ttl, value)
+
+    async def incr_counters(self, deltas: Dict[str, float]):
+        for name, delta in deltas.items():
+            self._counters[name] = self._counters.get(name, 0.0) + delta
+
+    async def get_counters(self) -> Dict[str, float]:
+        return dict(self._counters)
+
+    def export_state(self) -> dict:
+        # Arrival times are monotonic, so they are saved as seconds from now
+        now = time.monotonic()
+        wall = time.time()
+        return {
+            'tat': {key: tat - now for key, tat in self._tat.items() if tat > now},
+            'cache': {key: entry for key, entry in self._cache.items() if entry[0] > wall}
+        }
+
+    def restore_state(self, state: dict):
+        now = time.monotonic()
+        for key, remaining in state.get('tat', {}).items():
+            self._tat[key] = max(self._tat.get(key, now), now + remaining)
+        wall = time.time()
+        for key, (expires_at, value) in state.get('cache', {}).items():
+            if expires_at > wall:
+                self._cache[key] = (expires_at, value)
+
+# KEYS: one key per tier. ARGV: interval and window for each key, in order.
+# Uses the server clock so every process agrees on "now"; idle keys expire on their own.
+_GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local window = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    if new_tat - now > window then
+        return i
+    end
+    tats[i] = new_tat
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000) + 1)
+end
+return 0
+"""
+
+class RedisStateBackend(StateBackend):
+    """Backend on a local Redis-compatible server, shared by every shard process."""
+
+    shared = True
+
+    def __init__(self, url: str = 'redis://127.0.0.1:6379/0', prefix: str = 'st:'):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for the redis shared state backend")
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._gcra = None
+
+    async def start(self):
+        self._redis = aioredis.from_url(self.url, decode_responses=True)
+        await self._redis.ping()
+        self._gcra = self._redis.register_script(_GCRA_SCRIPT)
+        logger.info(f"Connected to shared state at {self.url}")
+
+    async def close(self):
+        if self._redis is not None:
+            # redis-py 5 renamed close() to aclose()
+            close = getattr(self._redis, 'aclose', None) or self._redis.close
+            await close()
+            self._redis = None
+
+    async def gcra(self, keys: Sequence[str], intervals: Sequence[float],
+                   windows: Sequence[float]) -> Optional[int]:
+        args: List[float] = []
+        for interval, window in zip(intervals, windows):
+            args.extend((interval, window))
+        limited = await self._gcra(keys=[self.prefix + 'rl:' + key for key in keys], args=args)
+        return int(limited) - 1 if int(limited) else None
+
+    async def cache_get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self.prefix + 'cache:' + key)
+
+    async def cache_set(self, key: str, value: str, ttl: float):
+        await self._redis.set(self.prefix + 'cache:' + key, value, ex=max(1, int(ttl)))
+
+    async def incr_counters(self, deltas: Dict[str, float]):
+        pipe = self._redis.pipeline(transaction=False)
+        for name, delta in deltas.items():
+            pipe.hincrbyfloat(self.prefix + 'counters', name, delta)
+        await pipe.execute()
+
+    async def get_counters(self) -> Dict[str, float]:
+        values = await self._redis.hgetall(self.prefix + 'counters')
+        return {name: float(value) for name, value in values.items()}
+
+def create_backend(config: Optional[dict]) -> StateBackend:
+    """Create the backend named in the shared_state config section."""
+    config = config or {}
+    backend = config.get('backend', 'memory')
+    if backend == 'memory':
+        return MemoryStateBackend()
+    if backend == 'redis':
+        return RedisStateBackend(config.get('url', 'redis://127.0.0.1:6379/0'), config.get('prefix', 'st:'))
+    raise ValueError(f"Unknown shared state backend: {backend}")
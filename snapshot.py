@@ -0,0 +1,51 @@
+"""
+Warm-Restart Snapshots
+Compact gzip/JSON file of in-memory state, written on shutdown (and periodically) and loaded at startup
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+def write_snapshot(path: str, state: dict):
+    """Write state atomically: a crash mid-write leaves the previous snapshot in place. Blocking."""
+    payload = json.dumps(
+        {'version': SNAPSHOT_VERSION, 'written_at': time.time(), 'state': state},
+        ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(gzip.compress(payload, compresslevel=6))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_snapshot(path: str) -> Optional[dict]:
+    """Load and remove a snapshot, so it is never applied twice. Returns None if missing or unusable. Blocking."""
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(gzip.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logger.error(f"Ignoring unreadable state snapshot {path}: {e}")
+        return None
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        logger.warning(f"Ignoring state snapshot {path} from another version")
+        return None
+    logger.info(f"Loaded state snapshot written {time.time() - data.get('written_at', 0):.0f}s ago")
+    return data.get('state') or {}
@@ -0,0 +1,28 @@
+"""
+Shared Test Fixtures
+A controllable clock for the time-based logic in the bot's modules
+"""
+
+import pytest
+
+class FakeClock:
+    """Stands in for the time module of one module under test; only moves when told to."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,151 @@
+"""
+Incident Aggregation Tests
+Open-incident windows, flag merging, debounced edits, eviction and warm-restart state
+"""
+
+import asyncio
+
+import pytest
+
+import aggregation
+from aggregation import IncidentAggregator
+from message_cache import MessageSnapshot
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(aggregation, 'time', clock)
+
+class Renderer:
+    def __init__(self):
+        self.rendered = []
+        self.fail = False
+
+    async def __call__(self, incident):
+        if self.fail:
+            raise RuntimeError("edit failed")
+        self.rendered.append(sorted(incident.flaggers))
+
+def make_index(**options):
+    renderer = Renderer()
+    options = dict(dict(window=600, max_open=3, edit_debounce=0), **options)
+    return IncidentAggregator(renderer, **options), renderer
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def test_incident_closes_after_its_window(clock):
+    index, _ = make_index()
+    index.open('i1', 1, 10, 100, flagger_id=7)
+    clock.advance(599)
+    assert index.get(1) is not None
+    clock.advance(1)
+    assert index.get(1) is None
+    assert index.get_stats()['expired'] == 1
+
+def test_repeat_flag_from_the_same_user_is_ignored():
+    index, _ = make_index()
+    incident = index.open('i1', 1, 10, 100, flagger_id=7)
+    assert not index.add_flagger(incident, 7)
+    assert index.get_stats()['merged'] == 0
+
+def test_flags_before_posting_are_rendered_once_posted():
+    async def run():
+        index, renderer = make_index()
+        incident = index.open('i1', 1, 10, 100, flagger_id=7)
+        index.add_flagger(incident, 8)
+        await settle()
+        before = list(renderer.rendered)
+        index.posted(incident, 555, [])
+        await settle()
+        return before, renderer.rendered
+    assert asyncio.run(run()) == ([], [[7, 8]])
+
+def test_flags_within_the_debounce_share_one_edit():
+    async def run():
+        index, renderer = make_index(edit_debounce=0.01)
+        incident = index.open('i1', 1, 10, 100, flagger_id=7)
+        index.posted(incident, 555, [])
+        for user_id in (8, 9, 10):
+            index.add_flagger(incident, user_id)
+        await asyncio.sleep(0.05)
+        return renderer.rendered, index.get_stats()['edits']
+    assert asyncio.run(run()) == ([[7, 8, 9, 10]], 1)
+
+def test_withdrawn_flag_updates_the_incident():
+    async def run():
+        index, renderer = make_index()
+        incident = index.open('i1', 1, 10, 100, flagger_id=7)
+        index.posted(incident, 555, [])
+        index.add_flagger(incident, 8)
+        await settle()
+        assert index.remove_flagger(1, 8) is incident
+        assert index.remove_flagger(1, 8) is None
+        await settle()
+        return renderer.rendered
+    assert asyncio.run(run()) == [[7, 8], [7]]
+
+def test_failed_edit_is_counted():
+    async def run():
+        index, renderer = make_index()
+        renderer.fail = True
+        incident = index.open('i1', 1, 10, 100, flagger_id=7)
+        index.posted(incident, 555, [])
+        index.add_flagger(incident, 8)
+        await settle()
+        return index.get_stats()['edit_errors']
+    assert asyncio.run(run()) == 1
+
+def test_least_recently_flagged_incident_is_evicted():
+    index, _ = make_index(max_open=2)
+    first = index.open('i1', 1, 10, 100, flagger_id=7)
+    index.open('i2', 2, 10, 100, flagger_id=7)
+    # A new flag makes incident 1 the most recent
+    index.add_flagger(first, 8)
+    index.open('i3', 3, 10, 100, flagger_id=7)
+    assert (index.get(1), index.get(2)) == (first, None)
+    assert index.get_stats()['evicted'] == 1
+
+def test_discard_cancels_a_pending_edit():
+    async def run():
+        index, renderer = make_index(edit_debounce=0.01)
+        incident = index.open('i1', 1, 10, 100, flagger_id=7)
+        index.posted(incident, 555, [])
+        index.add_flagger(incident, 8)
+        index.discard(1)
+        await asyncio.sleep(0.03)
+        return renderer.rendered, index.get(1)
+    assert asyncio.run(run()) == ([], None)
+
+def test_posted_incidents_survive_a_restart(clock):
+    index, _ = make_index()
+    incident = index.open('i1', 1, 10, 100, flagger_id=7)
+    incident.snapshot = MessageSnapshot(1, 100, 10, 'guild', 42, '<@42>', 'text')
+    incident.content = 'text'
+    index.add_flagger(incident, 8)
+    incident.flagged_message_id = 555
+    incident.extra_embeds = [{'title': 'AI'}]
+    # Not posted yet, so nothing to edit after a restart
+    index.open('i2', 2, 10, 100, flagger_id=7)
+
+    restored, _ = make_index()
+    restored.restore_state(index.export_state())
+    again = restored.get(1)
+    assert again.flaggers == incident.flaggers
+    assert list(again.flaggers) == [7, 8]
+    assert again.snapshot == incident.snapshot
+    assert again.extra_embeds == [{'title': 'AI'}]
+    assert restored.get(2) is None
+    # The window still counts from the first flag
+    clock.advance(600)
+    assert restored.get(1) is None
+
+def test_restore_skips_incidents_whose_window_passed(clock):
+    index, _ = make_index()
+    incident = index.open('i1', 1, 10, 100, flagger_id=7)
+    index.posted(incident, 555, [])
+    state = index.export_state()
+    clock.advance(600)
+    restored, _ = make_index()
+    restored.restore_state(state)
+    assert restored.size == 0
@@ -0,0 +1,116 @@
+"""
+Adaptive Limiter Tests
+AIMD limit changes and weighted fair granting of waiting slots
+"""
+
+import asyncio
+
+import pytest
+
+import concurrency
+from concurrency import AdaptiveLimiter
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    monkeypatch.setattr(concurrency, 'time', clock)
+    return AdaptiveLimiter(initial=4, min_limit=1, max_limit=8, backoff=0.5, latency_tolerance=2.0, cooldown=1.0)
+
+def test_throttling_halves_the_limit_once_per_cooldown(limiter, clock):
+    limiter.observe(429)
+    assert limiter.limit == 2
+    limiter.observe(503)
+    assert limiter.limit == 2
+    clock.advance(1.0)
+    limiter.observe('timeout')
+    assert limiter.limit == 1
+    clock.advance(1.0)
+    limiter.observe(500)
+    assert limiter.limit == 1
+
+def test_grows_only_while_the_limit_is_in_use(limiter):
+    limiter.observe(200, 0.5)
+    assert limiter.limit == 4
+    limiter.in_flight = 3
+    limiter.observe(200, 0.5)
+    assert limiter.limit == pytest.approx(4.25)
+
+def test_never_grows_past_max(limiter):
+    limiter.limit = 8
+    limiter.in_flight = 8
+    limiter.observe(200, 0.5)
+    assert limiter.limit == 8
+
+def test_slow_responses_shrink_the_limit(limiter):
+    limiter.observe(200, 0.5)
+    limiter.observe(200, 1.5)
+    assert limiter.limit == pytest.approx(3.6)
+    assert limiter.baseline == pytest.approx(0.51)
+
+def test_status_without_latency_leaves_the_limit_alone(limiter):
+    limiter.in_flight = 3
+    limiter.observe(200)
+    limiter.observe(400, 0.5)
+    assert limiter.limit == 4 and limiter.baseline is None
+
+def test_restore_state_clamps_to_the_configured_range(limiter):
+    limiter.restore_state({'limit': 100, 'baseline': 0.3})
+    assert limiter.limit == 8 and limiter.baseline == 0.3
+    limiter.restore_state({})
+    assert limiter.limit == 8
+
+async def grant_order(limiter, waiters):
+    """Hold every slot, queue (key, weight) waiters, then release one slot at a time."""
+    order = []
+
+    async def wait(key, weight):
+        await limiter.acquire(key, weight)
+        order.append(key)
+
+    for _ in range(int(limiter.limit)):
+        await limiter.acquire('holder')
+    tasks = [asyncio.create_task(wait(key, weight)) for key, weight in waiters]
+    await asyncio.sleep(0)
+    for _ in waiters:
+        limiter.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+def test_waiting_keys_take_turns():
+    limiter = AdaptiveLimiter(initial=1)
+    order = asyncio.run(grant_order(limiter, [('a', 1), ('a', 1), ('a', 1), ('b', 1)]))
+    # b does not queue behind all of a's requests
+    assert order == ['a', 'b', 'a', 'a']
+
+def test_weight_sets_the_share_of_grants():
+    limiter = AdaptiveLimiter(initial=1)
+    order = asyncio.run(grant_order(limiter, [('a', 1)] * 4 + [('b', 3)] * 4))
+    assert order[:4].count('b') == 3
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1)
+        await limiter.acquire('holder')
+        waiter = asyncio.create_task(limiter.acquire('a'))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        return limiter.waiting, limiter.in_flight
+    assert asyncio.run(run()) == (0, 0)
+
+def test_waiter_cancelled_after_its_grant_hands_the_slot_on():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1)
+        await limiter.acquire('holder')
+        first = asyncio.create_task(limiter.acquire('a'))
+        second = asyncio.create_task(limiter.acquire('b'))
+        await asyncio.sleep(0)
+        # The slot is granted to the first waiter, which is cancelled before it runs
+        limiter.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, 1)
+        return limiter.in_flight
+    assert asyncio.run(run()) == 1
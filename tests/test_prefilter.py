@@ -0,0 +1,68 @@
+"""
+Pre-filter Tests
+Aho-Corasick matching on word boundaries and the skip/local/escalate decisions
+"""
+
+from prefilter import ESCALATE, LOCAL, SKIP, AhoCorasick, TextPrefilter
+
+def test_finds_every_pattern_in_one_pass():
+    matcher = AhoCorasick(['he', 'she', 'his', 'hers'])
+    text = 'she said his and hers'
+    assert sorted(text[start:end] for start, end in matcher.find(text)) == ['hers', 'his', 'she']
+
+def test_matches_only_whole_words():
+    matcher = AhoCorasick(['ass'])
+    assert matcher.find('a class act') == []
+    assert matcher.find('ass.') == [(0, 3)]
+    assert matcher.find('you ass') == [(4, 7)]
+
+def test_overlapping_patterns_via_failure_links():
+    matcher = AhoCorasick(['bad word', 'word'])
+    assert sorted(matcher.find('a bad word')) == [(2, 10), (6, 10)]
+
+def test_blank_patterns_are_ignored_and_case_is_folded():
+    matcher = AhoCorasick(['', '  ', 'Darn'])
+    assert matcher.size == 1
+    assert matcher.find('darn it') == [(0, 4)]
+
+def make_prefilter(**options):
+    return TextPrefilter(mask_words=['darn', 'heck'], escalate_words=['kill yourself'], **options)
+
+def test_text_free_messages_are_skipped():
+    prefilter = make_prefilter()
+    for text in ('😂😂', 'https://example.com/x', '<@123> <:pog:456>', '!!!'):
+        assert prefilter.check(text).decision == SKIP
+
+def test_escalate_words_win_over_everything():
+    result = make_prefilter().check('darn, just kill yourself')
+    assert (result.decision, result.reason) == (ESCALATE, 'hostile')
+
+def test_short_messages_are_skipped():
+    assert make_prefilter().check('darn').reason == 'too_short'
+
+def test_listed_words_are_masked_locally():
+    result = make_prefilter().check('this darn printer is broken again')
+    assert (result.decision, result.reason) == (LOCAL, 'masked')
+    assert result.text == 'this d*** printer is broken again'
+
+def test_unlisted_text_escalates_unless_skip_clean():
+    assert make_prefilter().check('you are the worst').decision == ESCALATE
+    assert make_prefilter(skip_clean=True).check('you are the worst').reason == 'clean'
+
+def test_dense_or_long_messages_escalate():
+    assert make_prefilter().check('darn heck darn').reason == 'dense'
+    assert make_prefilter(max_local_length=20).check('this darn printer is broken again').reason == 'too_long'
+
+def test_mask_keeps_offsets_when_lowercasing_changes_length():
+    # 'İ' lowercases to two characters; the mask must still land on the right word
+    prefilter = make_prefilter()
+    assert prefilter.mask('İİ darn it') == 'İİ d*** it'
+    assert prefilter.mask('nothing listed') is None
+
+def test_stats_count_each_decision():
+    prefilter = make_prefilter()
+    for text in ('😂', 'this darn printer is broken', 'you are the worst'):
+        prefilter.check(text)
+    stats = prefilter.get_stats()
+    assert stats['decisions'] == {SKIP: 1, LOCAL: 1, ESCALATE: 1}
+    assert stats['checked'] == 3
@@ -0,0 +1,95 @@
+"""
+Rate Limiter Tests
+GCRA tiers: bursts, window expiry, tier stacking and idle-key eviction
+"""
+
+import asyncio
+
+import pytest
+
+import shared_state
+from ratelimit import GCRALimit, RateLimiter
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(shared_state, 'time', clock)
+
+def hit(limiter, user_id=1, guild_id=10, channel_id=100, user_limit=None):
+    return asyncio.run(limiter.hit(user_id, guild_id, channel_id, user_limit))
+
+def test_allows_a_full_burst_then_limits():
+    limiter = RateLimiter([GCRALimit('user', 3, 60)])
+    assert [hit(limiter) for _ in range(3)] == [None, None, None]
+    assert hit(limiter) == 'user'
+    assert limiter.get_stats()['limited'] == {'user': 1}
+
+def test_one_event_frees_up_per_emission_interval(clock):
+    limiter = RateLimiter([GCRALimit('user', 3, 60)])
+    for _ in range(3):
+        hit(limiter)
+    clock.advance(19.9)
+    assert hit(limiter) == 'user'
+    clock.advance(0.1)
+    assert hit(limiter) is None
+    assert hit(limiter) == 'user'
+
+def test_full_window_restores_the_whole_burst(clock):
+    limiter = RateLimiter([GCRALimit('user', 3, 60)])
+    for _ in range(3):
+        hit(limiter)
+    clock.advance(60)
+    assert [hit(limiter) for _ in range(3)] == [None, None, None]
+
+def test_users_are_limited_separately():
+    limiter = RateLimiter([GCRALimit('user', 1, 60)])
+    assert hit(limiter, user_id=1) is None
+    assert hit(limiter, user_id=2) is None
+    assert hit(limiter, user_id=1) == 'user'
+
+def test_guild_tier_limits_across_users():
+    limiter = RateLimiter([GCRALimit('user', 5, 60), GCRALimit('guild', 2, 60)])
+    assert hit(limiter, user_id=1) is None
+    assert hit(limiter, user_id=2) is None
+    assert hit(limiter, user_id=3) == 'guild'
+    # Another guild has its own allowance
+    assert hit(limiter, user_id=3, guild_id=11) is None
+
+def test_rejected_event_uses_no_allowance_in_any_tier():
+    limiter = RateLimiter([GCRALimit('user', 1, 60), GCRALimit('guild', 2, 60)])
+    assert hit(limiter, user_id=1) is None
+    # Limited by the user tier, so the guild tier must not count it
+    assert hit(limiter, user_id=1) == 'user'
+    assert hit(limiter, user_id=2) is None
+
+def test_guild_user_limit_replaces_the_user_tier_and_counts_towards_it():
+    limiter = RateLimiter([GCRALimit('user', 5, 60)])
+    strict = GCRALimit('user', 1, 60)
+    assert hit(limiter, user_limit=strict) is None
+    assert hit(limiter, user_limit=strict) == 'user'
+    assert limiter.limits[0].limited == 1
+
+def test_sweep_evicts_only_idle_keys(clock):
+    limiter = RateLimiter([GCRALimit('user', 2, 60)])
+    hit(limiter, user_id=1)
+    clock.advance(30)
+    hit(limiter, user_id=2)
+    assert asyncio.run(limiter.sweep()) == 1
+    assert limiter.get_stats()['keys'] == 1
+    assert limiter.evictions == 1
+
+def test_limits_from_config_skips_unset_tiers():
+    limits = RateLimiter.limits_from_config({
+        'rate_limit_max': 4, 'rate_limit_window': 30,
+        'rate_limits': {'guild': {'max': 20}, 'channel': {}, 'global': {'max': 0}}
+    })
+    assert [(limit.name, limit.max_events, limit.window) for limit in limits] == [
+        ('user', 4, 30), ('guild', 20, 60)
+    ]
+
+def test_reload_keeps_rejection_counts():
+    limiter = RateLimiter([GCRALimit('user', 1, 60)])
+    hit(limiter)
+    hit(limiter)
+    limiter.reload({'rate_limit_max': 10, 'rate_limit_window': 60})
+    assert limiter.limits[0].max_events == 10
+    assert limiter.limits[0].limited == 1
@@ -0,0 +1,151 @@
+"""
+Resilience Tests
+Circuit breaker states, retry delays, Retry-After parsing and hedged requests
+"""
+
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, RetryPolicy, UpstreamError, hedged, parse_retry_after
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(resilience, 'time', clock)
+    return CircuitBreaker(failure_threshold=3, recovery_time=30)
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    # A success resets the count
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.available
+    assert not breaker.allow()
+    assert breaker.get_stats()['rejected'] == 1
+
+def test_half_open_lets_exactly_one_probe_through(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    # Checking availability does not claim the probe
+    assert breaker.available and breaker.available
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.available
+    assert not breaker.allow()
+
+def test_successful_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_probe_reopens_for_another_recovery_time(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert breaker.get_stats()['opened'] == 2
+
+def test_released_probe_frees_the_half_open_slot(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    # The probe was cancelled before it got a verdict
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+@pytest.mark.parametrize('status, retryable', [
+    ('timeout', True), ('error', True), (408, True), (409, True), (429, True), (500, True), (503, True),
+    (400, False), (401, False), (404, False), (422, False)
+])
+def test_retryable_statuses(status, retryable):
+    assert UpstreamError(status).retryable is retryable
+
+def test_parse_retry_after(monkeypatch):
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-3') == 0.0
+    assert parse_retry_after('soon') is None
+    monkeypatch.setattr(resilience.time, 'time', lambda: 1_700_000_000.0)
+    assert parse_retry_after(formatdate(1_700_000_010.0, usegmt=True)) == pytest.approx(10.0)
+    assert parse_retry_after(formatdate(1_699_999_990.0, usegmt=True)) == 0.0
+
+def test_retry_delay_defers_to_retry_after_up_to_the_cap():
+    policy = RetryPolicy(retries=2, base_delay=0.5, max_delay=8.0)
+    assert policy.delay(0, retry_after=3.0) == 3.0
+    assert policy.delay(0, retry_after=9.0) is None
+
+def test_retry_delay_is_jittered_exponential_backoff_capped(monkeypatch):
+    policy = RetryPolicy(retries=5, base_delay=0.5, max_delay=8.0)
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+    assert [policy.delay(attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+
+async def respond(value, delay=0.0, error=None, started=None):
+    if started is not None:
+        started.append(value)
+    await asyncio.sleep(delay)
+    if error:
+        raise error
+    return value
+
+def test_fast_primary_never_starts_the_secondary():
+    async def run():
+        started = []
+        result = await hedged(lambda: respond('primary', started=started),
+                              lambda: respond('secondary', started=started), 0.05)
+        return result, started
+    assert asyncio.run(run()) == ('primary', ['primary'])
+
+def test_slow_primary_is_beaten_by_the_secondary_and_cancelled():
+    async def run():
+        tasks = []
+        async def slow():
+            tasks.append(asyncio.current_task())
+            return await respond('primary', delay=1.0)
+        result = await hedged(slow, lambda: respond('secondary'), 0.01)
+        await asyncio.sleep(0)
+        return result, tasks[0].cancelled()
+    assert asyncio.run(run()) == ('secondary', True)
+
+def test_failed_secondary_falls_back_to_the_primary_result():
+    async def run():
+        return await hedged(lambda: respond('primary', delay=0.05),
+                            lambda: respond('secondary', error=UpstreamError(500)), 0.01)
+    assert asyncio.run(run()) == 'primary'
+
+def test_both_failing_raises_the_last_error():
+    async def run():
+        return await hedged(lambda: respond('primary', delay=0.03, error=UpstreamError(502)),
+                            lambda: respond('secondary', error=UpstreamError(503)), 0.01)
+    with pytest.raises(UpstreamError, match='502'):
+        asyncio.run(run())
+
+def test_primary_failing_before_the_delay_raises_at_once():
+    async def run():
+        started = []
+        with pytest.raises(UpstreamError):
+            await hedged(lambda: respond('primary', error=UpstreamError(500), started=started),
+                         lambda: respond('secondary', started=started), 0.5)
+        return started
+    assert asyncio.run(run()) == ['primary']
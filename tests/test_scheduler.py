@@ -0,0 +1,183 @@
+"""
+Send Scheduler Tests
+Per-channel ordering, digesting of backlogs, stale-item drops and idle-channel eviction
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import scheduler
+from scheduler import ChannelSendScheduler
+
+class ShiftedClock:
+    """Real monotonic time, shifted forward on demand to age queued items."""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self) -> float:
+        return time.monotonic() + self.offset
+
+class Channel:
+    """Send callback that can hold the first send until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = False
+
+    async def send(self, channel_id, guild_id, embeds):
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("send failed")
+        self.sent.append((channel_id, embeds))
+        return f"message-{len(self.sent)}"
+
+def build_digest(summaries, overflow):
+    return ('digest', list(summaries), overflow)
+
+def make_scheduler(channel, **options):
+    options = dict(dict(rate=100, per=1.0, digest_threshold=3, max_digest_items=10, max_age=60), **options)
+    return ChannelSendScheduler(channel.send, build_digest, **options)
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_sends_in_order_and_returns_the_message():
+    async def run():
+        channel = Channel()
+        sched = make_scheduler(channel)
+        results = [await sched.send(1, 9, [name], name) for name in 'abc']
+        await sched.stop()
+        return channel.sent, results
+    sent, results = asyncio.run(run())
+    assert sent == [(1, ['a']), (1, ['b']), (1, ['c'])]
+    assert results == ['message-1', 'message-2', 'message-3']
+
+def test_backlog_is_merged_into_one_digest():
+    async def run():
+        channel = Channel()
+        channel.gate.clear()
+        sched = make_scheduler(channel)
+        first = asyncio.create_task(sched.send(1, 9, ['a'], 'A'))
+        await settle()
+        rest = [asyncio.create_task(sched.send(1, 9, [name], name.upper())) for name in 'bcd']
+        await settle()
+        channel.gate.set()
+        results = await asyncio.gather(first, *rest)
+        stats = sched.get_stats()['channels'][1]
+        await sched.stop()
+        return channel.sent, results, stats
+    sent, results, stats = asyncio.run(run())
+    assert sent == [(1, ['a']), (1, [('digest', ['B', 'C', 'D'], 0)])]
+    # Digested items have no message of their own
+    assert results == ['message-1', None, None, None]
+    assert stats['digests'] == 1 and stats['digested'] == 3
+
+def test_short_backlog_is_sent_item_by_item():
+    async def run():
+        channel = Channel()
+        channel.gate.clear()
+        sched = make_scheduler(channel)
+        tasks = [asyncio.create_task(sched.send(1, 9, [name], name)) for name in 'ab']
+        await settle()
+        channel.gate.set()
+        await asyncio.gather(*tasks)
+        await sched.stop()
+        return channel.sent
+    assert asyncio.run(run()) == [(1, ['a']), (1, ['b'])]
+
+def test_stale_items_beyond_one_digest_are_dropped(monkeypatch):
+    clock = ShiftedClock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+
+    async def run():
+        channel = Channel()
+        channel.gate.clear()
+        sched = make_scheduler(channel, max_digest_items=2)
+        first = asyncio.create_task(sched.send(1, 9, ['a'], 'A'))
+        await settle()
+        rest = [asyncio.create_task(sched.send(1, 9, [name], name.upper())) for name in 'bcdef']
+        await settle()
+        clock.offset = 120
+        channel.gate.set()
+        results = await asyncio.gather(first, *rest)
+        stats = sched.get_stats()['channels'][1]
+        await sched.stop()
+        return channel.sent, results, stats
+    sent, results, stats = asyncio.run(run())
+    assert sent[1] == (1, [('digest', ['B', 'C'], 3)])
+    assert results[1:] == [None] * 5
+    assert stats['dropped'] == 3
+
+def test_cancelled_caller_does_not_stop_the_drain(monkeypatch):
+    clock = ShiftedClock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+
+    async def run():
+        channel = Channel()
+        channel.gate.clear()
+        sched = make_scheduler(channel, max_digest_items=1)
+        first = asyncio.create_task(sched.send(1, 9, ['a'], 'A'))
+        await settle()
+        rest = [asyncio.create_task(sched.send(1, 9, [name], name.upper())) for name in 'bcd']
+        await settle()
+        # This caller gives up; its item is among those dropped as stale
+        rest[2].cancel()
+        clock.offset = 120
+        channel.gate.set()
+        results = await asyncio.wait_for(asyncio.gather(first, *rest, return_exceptions=True), 2)
+        # The channel keeps draining afterwards
+        await asyncio.wait_for(sched.send(1, 9, ['e'], 'E'), 2)
+        await sched.stop()
+        return channel.sent, results
+    sent, results = asyncio.run(run())
+    assert isinstance(results[3], asyncio.CancelledError)
+    assert sent[1:] == [(1, [('digest', ['B'], 2)]), (1, [('digest', ['E'], 0)])]
+
+def test_failed_send_resolves_to_none_and_counts_an_error():
+    async def run():
+        channel = Channel()
+        channel.fail = True
+        sched = make_scheduler(channel)
+        result = await sched.send(1, 9, ['a'], 'A')
+        stats = sched.get_stats()['channels'][1]
+        await sched.stop()
+        return result, stats
+    result, stats = asyncio.run(run())
+    assert result is None
+    assert stats['errors'] == 1 and stats['sent'] == 0
+
+def test_stop_resolves_pending_sends():
+    async def run():
+        channel = Channel()
+        channel.gate.clear()
+        sched = make_scheduler(channel)
+        tasks = [asyncio.create_task(sched.send(1, 9, [name], name)) for name in 'abc']
+        await settle()
+        await sched.stop()
+        return await asyncio.gather(*tasks)
+    assert asyncio.run(run()) == [None, None, None]
+
+def test_idle_channels_beyond_the_cap_are_forgotten():
+    async def run():
+        channel = Channel()
+        sched = make_scheduler(channel, max_tracked_channels=2)
+        for channel_id in (1, 2, 3):
+            await sched.send(channel_id, 9, ['x'], 'x')
+            await settle()
+        channels = list(sched.get_stats()['channels'])
+        await sched.stop()
+        return channels
+    assert asyncio.run(run()) == [2, 3]
+
+def test_from_config_reads_every_setting():
+    sched = ChannelSendScheduler.from_config(None, build_digest, {
+        'rate': 2, 'per': 3, 'digest_threshold': 5, 'max_digest_items': 6, 'max_age': 7, 'max_tracked_channels': 8
+    })
+    assert (sched.rate, sched.per, sched.digest_threshold, sched.max_digest_items, sched.max_age,
+            sched.max_tracked_channels) == (2, 3, 5, 6, 7, 8)
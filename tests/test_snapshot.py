@@ -0,0 +1,87 @@
+"""
+Snapshot Tests
+Round-trips through the gzip file, and malformed or foreign snapshots being ignored
+"""
+
+import gzip
+import json
+import os
+
+import pytest
+
+from message_cache import MessageSnapshot, MessageSnapshotCache
+from snapshot import SNAPSHOT_VERSION, read_snapshot, write_snapshot
+
+def write_raw(path, payload: bytes):
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    state = {'jobs': [{'content': 'ünïcödé 💩', 'message_id': 2 ** 62}], 'token_budget': {'used': {'1': 5}}}
+    write_snapshot(path, state)
+    assert read_snapshot(path) == state
+
+def test_read_removes_the_file_so_it_is_applied_once(tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    write_snapshot(path, {'a': 1})
+    assert read_snapshot(path) == {'a': 1}
+    assert not os.path.exists(path)
+    assert read_snapshot(path) is None
+
+def test_write_replaces_the_previous_snapshot_atomically(tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    write_snapshot(path, {'a': 1})
+    write_snapshot(path, {'a': 2})
+    assert os.listdir(tmp_path) == ['state.json.gz']
+    assert read_snapshot(path) == {'a': 2}
+
+def test_missing_snapshot_is_none(tmp_path):
+    assert read_snapshot(str(tmp_path / 'missing.json.gz')) is None
+
+@pytest.mark.parametrize('payload', [
+    b'not gzip at all',
+    gzip.compress(b'{"version": 1, "state": '),
+    gzip.compress(b'\xff\xfe not utf-8'),
+    gzip.compress(b'not json'),
+    gzip.compress(b'')[:10],
+])
+def test_unreadable_snapshot_is_ignored_and_removed(tmp_path, payload):
+    path = str(tmp_path / 'state.json.gz')
+    write_raw(path, payload)
+    assert read_snapshot(path) is None
+    assert not os.path.exists(path)
+
+@pytest.mark.parametrize('data', [
+    [],
+    'state',
+    {'state': {'a': 1}},
+    {'version': SNAPSHOT_VERSION + 1, 'state': {'a': 1}},
+])
+def test_snapshot_from_another_version_or_shape_is_ignored(tmp_path, data):
+    path = str(tmp_path / 'state.json.gz')
+    write_raw(path, gzip.compress(json.dumps(data).encode()))
+    assert read_snapshot(path) is None
+
+def test_empty_state_reads_as_an_empty_dict(tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    write_raw(path, gzip.compress(json.dumps({'version': SNAPSHOT_VERSION, 'state': None}).encode()))
+    assert read_snapshot(path) == {}
+
+def test_cache_state_round_trips_through_the_file(tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    cache = MessageSnapshotCache(ttl=300)
+    cache.put(MessageSnapshot(1, 100, 10, 'guild', 42, '<@42>', 'hello'))
+    write_snapshot(path, {'message_cache': cache.export_state()})
+
+    restored = MessageSnapshotCache(ttl=300)
+    restored.restore_state(read_snapshot(path)['message_cache'])
+    assert restored.get(1) == cache.get(1)
+
+def test_malformed_tier_raises_for_the_caller_to_skip():
+    # Raised to the bot, which restores each tier in its own try and skips the broken one
+    cache = MessageSnapshotCache()
+    with pytest.raises((TypeError, ValueError)):
+        cache.restore_state({'entries': [[0]]})
+    with pytest.raises(AttributeError):
+        cache.restore_state([])
@@ -0,0 +1,97 @@
+"""
+Token Accounting Tests
+Token estimates, prompt trimming, output sizing and per-guild daily budgets
+"""
+
+import pytest
+
+import tokens
+from tokens import TokenBudget, TokenSizer, estimate_tokens, trim_to_tokens
+
+@pytest.mark.parametrize('text, expected', [
+    ('', 0),
+    ('hello world', 2),
+    ('internationalization', 3),
+    ('123456', 2),
+    ('1234567', 3),
+    ('hi!', 2),
+    ('日本語', 3),
+    ('😀', 2),
+])
+def test_estimate_tokens(text, expected):
+    assert estimate_tokens(text) == expected
+
+def test_short_text_is_not_trimmed():
+    assert trim_to_tokens('Short one.', 10) == 'Short one.'
+
+def test_trims_at_the_last_sentence_that_fits():
+    text = 'First sentence here. Second sentence here. Third sentence here.'
+    assert trim_to_tokens(text, 10) == 'First sentence here. Second sentence here.'
+    assert trim_to_tokens(text, 7) == 'First sentence here.'
+
+def test_falls_back_to_words_when_one_sentence_is_too_long():
+    assert trim_to_tokens('one two three four five six', 3) == 'one two three'
+
+def test_one_huge_word_keeps_about_four_characters_per_token():
+    assert trim_to_tokens('x' * 400, 10) == 'x' * 40
+
+def test_output_tokens_follow_the_input_within_bounds():
+    sizer = TokenSizer(output_ratio=1.5, output_margin=16, min_output_tokens=32, max_output_tokens=200)
+    assert sizer.output_tokens('hi') == 32
+    assert sizer.output_tokens('word ' * 40) == 76
+    assert sizer.output_tokens('word ' * 1000) == 200
+
+@pytest.fixture
+def budget(monkeypatch, clock):
+    monkeypatch.setattr(tokens, 'time', clock)
+    # Guild 1 may spend 100 tokens a day; others are unlimited
+    return TokenBudget(lambda guild_id: 100 if guild_id == 1 else 0)
+
+def test_budget_runs_out_at_the_limit(budget):
+    budget.charge(1, 60)
+    assert budget.remaining(1) == 40 and not budget.exhausted(1)
+    budget.charge(1, 40)
+    assert budget.exhausted(1)
+    budget.charge(1, 10)
+    assert budget.remaining(1) == 0 and budget.used(1) == 110
+
+def test_unlimited_and_guildless_usage_is_never_exhausted(budget):
+    budget.charge(2, 10_000)
+    assert budget.remaining(2) is None and not budget.exhausted(2)
+    budget.charge(None, 50)
+    assert not budget.exhausted(None)
+    assert budget.get_stats()['charged'] == 10_000
+
+def test_checking_the_budget_has_no_side_effects(budget):
+    budget.charge(1, 100)
+    for _ in range(3):
+        assert budget.exhausted(1)
+    assert budget.get_stats()['exhausted'] == 0
+    budget.record_refusal()
+    assert budget.get_stats()['exhausted'] == 1
+
+def test_estimated_charges_are_tracked(budget):
+    budget.charge(1, 30, estimated=True)
+    budget.charge(1, 20)
+    budget.charge(1, 0)
+    assert budget.get_stats()['charged'] == 50
+    assert budget.get_stats()['estimated'] == 30
+
+def test_usage_resets_at_the_next_utc_day(budget, clock):
+    budget.charge(1, 100)
+    clock.advance(86400)
+    assert budget.used(1) == 0 and not budget.exhausted(1)
+
+def test_usage_survives_a_restart_on_the_same_day(budget):
+    budget.charge(1, 70)
+    restarted = TokenBudget(budget.limit_for)
+    restarted.restore_state(budget.export_state())
+    assert restarted.used(1) == 70
+
+def test_usage_from_an_earlier_day_is_not_restored(budget, clock):
+    budget.charge(1, 70)
+    state = budget.export_state()
+    clock.advance(86400)
+    restarted = TokenBudget(budget.limit_for)
+    restarted.restore_state(state)
+    assert restarted.used(1) == 0
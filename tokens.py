@@ -0,0 +1,172 @@
+"""
+Token Accounting
+Local token estimates, sentence-boundary trimming and per-guild daily token budgets
+"""
+
+import logging
+import re
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ASCII words, digit runs, or any other single non-space character
+_PIECE = re.compile(r"[A-Za-z]+|\d+|\S")
+# Whitespace after sentence-ending punctuation, or a line break
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+|\s*\n\s*")
+_WORD_BREAK = re.compile(r"\s+")
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the BPE token count of text without a tokenizer.
+
+    Common English words are one token and long ones a few more; digits go in
+    groups of three; punctuation, symbols and non-Latin characters count one
+    each, emoji outside the BMP two. Close enough to size prompts and budgets.
+    """
+    tokens = 0
+    for piece in _PIECE.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += 1 + len(piece) // 8
+        elif first.isdigit() and first.isascii():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 2 if ord(first) > 0xFFFF else 1
+    return tokens
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, at the last sentence end that fits.
+
+    Falls back to the last word that fits when even the first sentence is too
+    long.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    for breaks in (_SENTENCE_BREAK, _WORD_BREAK):
+        cut = _fit(text, breaks, max_tokens)
+        if cut:
+            return text[:cut].rstrip()
+    # One enormous word: keep about four characters per token
+    return text[:max(1, max_tokens) * 4]
+
+def _fit(text: str, breaks: re.Pattern, max_tokens: int) -> int:
+    """End offset of the longest run of whole segments within max_tokens (0 if none)."""
+    used = 0
+    start = 0
+    cut = 0
+    for end in [m.start() for m in breaks.finditer(text)] + [len(text)]:
+        used += estimate_tokens(text[start:end])
+        if used > max_tokens:
+            break
+        cut = start = end
+    return cut
+
+class TokenSizer:
+    """Trims prompt input to a token budget and sizes max_tokens to match it."""
+
+    def __init__(self, max_input_tokens: int = 250, output_ratio: float = 1.5, output_margin: int = 16,
+                 min_output_tokens: int = 32, max_output_tokens: int = 200):
+        self.max_input_tokens = max_input_tokens
+        self.output_ratio = output_ratio
+        self.output_margin = output_margin
+        self.min_output_tokens = min_output_tokens
+        self.max_output_tokens = max_output_tokens
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "TokenSizer":
+        """Create a sizer from the openrouter.tokens config section."""
+        config = config or {}
+        return cls(
+            max_input_tokens=config.get('max_input_tokens', 250),
+            output_ratio=config.get('output_ratio', 1.5),
+            output_margin=config.get('output_margin', 16),
+            min_output_tokens=config.get('min_output_tokens', 32),
+            max_output_tokens=config.get('max_output_tokens', 200)
+        )
+
+    def trim(self, text: str) -> str:
+        """The part of text that goes into the prompt."""
+        return trim_to_tokens(text, self.max_input_tokens)
+
+    def output_tokens(self, text: str) -> int:
+        """max_tokens for rewriting text: a rewrite runs about as long as its input."""
+        wanted = int(estimate_tokens(text) * self.output_ratio) + self.output_margin
+        return max(self.min_output_tokens, min(self.max_output_tokens, wanted))
+
+class TokenBudget:
+    """Tokens each guild may spend on AI requests per UTC day.
+
+    Usage is counted in this process only; a guild's events all arrive on one
+    shard, so its budget is never split between processes.
+    """
+
+    def __init__(self, limit_for: Callable[[Optional[int]], int]):
+        # guild_id -> daily token limit, 0 for unlimited
+        self.limit_for = limit_for
+        self._day = self._today()
+        self._used: Dict[int, int] = {}
+        self.stats = {'charged': 0, 'estimated': 0, 'exhausted': 0}
+
+    def used(self, guild_id: Optional[int]) -> int:
+        """Tokens the guild has spent today."""
+        self._roll_over()
+        return self._used.get(guild_id, 0)
+
+    def remaining(self, guild_id: Optional[int]) -> Optional[int]:
+        """Tokens left today, or None when the guild has no limit."""
+        limit = self.limit_for(guild_id)
+        if not limit:
+            return None
+        return max(0, limit - self.used(guild_id))
+
+    def exhausted(self, guild_id: Optional[int]) -> bool:
+        """True once the guild has spent its daily allowance."""
+        return guild_id is not None and self.remaining(guild_id) == 0
+
+    def record_refusal(self):
+        """Count an AI request skipped because its guild's allowance is spent."""
+        self.stats['exhausted'] += 1
+
+    def charge(self, guild_id: Optional[int], tokens: int, estimated: bool = False):
+        """Add tokens spent on the guild's behalf."""
+        if guild_id is None or tokens <= 0:
+            return
+        self._roll_over()
+        used = self._used.get(guild_id, 0) + tokens
+        self._used[guild_id] = used
+        self.stats['charged'] += tokens
+        if estimated:
+            self.stats['estimated'] += tokens
+        limit = self.limit_for(guild_id)
+        if limit and used >= limit > used - tokens:
+            logger.info(f"Guild {guild_id} used its daily AI token budget ({limit})")
+
+    def get_stats(self) -> dict:
+        """Return tokens charged, requests refused and today's per-guild totals."""
+        self._roll_over()
+        return dict(self.stats, guilds=len(self._used), today=sum(self._used.values()))
+
+    def export_state(self) -> dict:
+        """Today's usage, for a warm-restart snapshot."""
+        self._roll_over()
+        # JSON object keys are strings
+        return {'day': self._day, 'used': {str(guild_id): used for guild_id, used in self._used.items()}}
+
+    def restore_state(self, state: dict):
+        """Carry today's usage over a restart; usage from an earlier day is dropped."""
+        self._roll_over()
+        if state.get('day') != self._day:
+            return
+        for guild_id, used in state.get('used', {}).items():
+            guild_id = int(guild_id)
+            self._used[guild_id] = self._used.get(guild_id, 0) + used
+
+    @staticmethod
+    def _today() -> int:
+        return int(time.time() // 86400)
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._used = {}